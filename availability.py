@@ -0,0 +1,208 @@
+"""Free appointment slots on a fixed per-day grid.
+
+A day is split into ``SLOTS_PER_DAY`` slots of ``SLOT_MINUTES`` counted
+from midnight. A set of slots of one day is an ``int`` bitmap: bit ``i`` is
+the slot starting ``i * SLOT_MINUTES`` minutes after midnight. Free slots
+of a master on a day are
+
+    working hours & ~booked & ~past
+
+where a booking blocks every slot that starts less than one slot length
+away from it (an appointment is assumed to last one slot). The ``booked``
+bitmaps are kept per master and day by the storage engine (see
+:func:`booking_masks`), so neither the slot queries nor the booking
+conflict check read appointments. The bitmaps are also what the
+availability endpoint returns, so a week for every master of a salon is a
+handful of small integers; :func:`earliest_slots` merges the per-master
+streams of free starts to find the nearest ones.
+
+Working hours come from the masters' compiled schedules (see
+:mod:`schedule`) as ``master_id -> day -> bitmap`` callables; masters
+without one work ``DEFAULT_HOURS``.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+SLOT_MINUTES = 60
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+DEFAULT_HOURS = ((9 * 60, 18 * 60),)
+
+# Записи в этих статусах слот не занимают
+INACTIVE_STATUSES = ("cancelled", "completed")
+
+Bookings = Dict[date, List[datetime]]
+Occupancy = Dict[date, int]
+WorkingHours = Callable[[date], int]
+
+
+def parse_local(value: str) -> Optional[datetime]:
+    """Parse a stored appointment time as naive local time (``None`` if malformed)."""
+    try:
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (ValueError, AttributeError):
+        return None
+    return moment.replace(tzinfo=None) if moment.tzinfo else moment
+
+
+def slot_start(day: date, index: int) -> datetime:
+    return datetime.combine(day, time()) + timedelta(minutes=index * SLOT_MINUTES)
+
+
+def range_mask(first: int, last: int) -> int:
+    """Bitmap with slots ``first..last`` (inclusive) set, clipped to the day."""
+    first, last = max(first, 0), min(last, SLOTS_PER_DAY - 1)
+    if first > last:
+        return 0
+    return ((1 << (last - first + 1)) - 1) << first
+
+
+def intervals_mask(intervals: Iterable[Tuple[int, int]]) -> int:
+    """Slots lying entirely inside the ``(start_minute, end_minute)`` intervals."""
+    mask = 0
+    for start, end in intervals:
+        mask |= range_mask(-(-start // SLOT_MINUTES), end // SLOT_MINUTES - 1)
+    return mask
+
+
+def working_mask(day: date) -> int:
+    """Working slots of a master without a schedule."""
+    return intervals_mask(DEFAULT_HOURS)
+
+
+def booked_mask(day: date, bookings: Bookings) -> int:
+    """Slots of ``day`` closer than one slot length to a booking (also from adjacent days)."""
+    day_start = datetime.combine(day, time())
+    mask = 0
+    for other in (day - timedelta(days=1), day, day + timedelta(days=1)):
+        for moment in bookings.get(other, ()):
+            offset = (moment - day_start).total_seconds() / (SLOT_MINUTES * 60)
+            mask |= range_mask(math.floor(offset), math.ceil(offset))
+    return mask
+
+
+def booking_masks(moment: datetime) -> Occupancy:
+    """Slots blocked by one booking at ``moment``, by day (a late booking spills into the next day)."""
+    bookings = {moment.date(): [moment]}
+    masks = {}
+    for day in (moment.date(), moment.date() + timedelta(days=1)):
+        mask = booked_mask(day, bookings)
+        if mask:
+            masks[day] = mask
+    return masks
+
+
+def past_mask(day: date, now: datetime) -> int:
+    """Slots that start at or before ``now``."""
+    if day < now.date():
+        return range_mask(0, SLOTS_PER_DAY - 1)
+    if day > now.date():
+        return 0
+    elapsed = (now - datetime.combine(day, time())).total_seconds() / (SLOT_MINUTES * 60)
+    return range_mask(0, math.floor(elapsed))
+
+
+def free_mask(day: date, booked: int, now: datetime, working: WorkingHours = working_mask) -> int:
+    return working(day) & ~booked & ~past_mask(day, now)
+
+
+def mask_slots(day: date, mask: int) -> List[str]:
+    """ISO start times of the slots set in ``mask``."""
+    return [slot_start(day, i).isoformat() for i in range(SLOTS_PER_DAY) if mask >> i & 1]
+
+
+def group_bookings(rows: Iterable[Tuple[str, str]]) -> Dict[str, Bookings]:
+    """``(master_id, datetime)`` rows -> master -> day -> booking times."""
+    grouped: Dict[str, Bookings] = defaultdict(lambda: defaultdict(list))
+    for master_id, value in rows:
+        moment = parse_local(value)
+        if moment is not None:
+            grouped[master_id][moment.date()].append(moment)
+    return grouped
+
+
+def free_masks(days: List[date], master_ids: Iterable[str], occupancy: Dict[str, Occupancy],
+               now: datetime, hours: Optional[Dict[str, WorkingHours]] = None) -> Dict[str, List[int]]:
+    """Per master, one free-slot bitmap per day of ``days``."""
+    empty: Occupancy = {}
+    hours = hours or {}
+    result = {}
+    for master_id in master_ids:
+        booked = occupancy.get(master_id, empty)
+        working = hours.get(master_id, working_mask)
+        result[master_id] = [free_mask(day, booked.get(day, 0), now, working) for day in days]
+    return result
+
+
+def occupancy_masks(days: Iterable[date], bookings: Bookings) -> Occupancy:
+    """Booked-slot bitmaps of ``days`` computed from the bookings themselves (zero days omitted)."""
+    masks = {}
+    for day in days:
+        mask = booked_mask(day, bookings)
+        if mask:
+            masks[day] = mask
+    return masks
+
+
+def booking_window(first: date, last: date) -> Tuple[str, str]:
+    """``[date_from, date_to)`` strings covering bookings that can block slots of ``first..last``."""
+    return (first - timedelta(days=1)).isoformat(), (last + timedelta(days=2)).isoformat()
+
+
+def run_mask(mask: int, length: int) -> int:
+    """Slots that start ``length`` consecutive free slots of ``mask``."""
+    result = mask
+    for shift in range(1, length):
+        result &= mask >> shift
+    return result
+
+
+def slots_needed(duration_minutes: Optional[int]) -> int:
+    """Grid slots occupied by a service of ``duration_minutes`` (one if unknown)."""
+    if not duration_minutes or duration_minutes <= 0:
+        return 1
+    return math.ceil(duration_minutes / SLOT_MINUTES)
+
+
+def earliest_slots(master_ids: List[str], now: datetime, length: int, limit: int,
+                   load_occupancy: Callable[[date, date], Dict[str, Occupancy]],
+                   hours: Optional[Dict[str, WorkingHours]] = None,
+                   horizon_days: int = 60, chunk_days: int = 7) -> List[Tuple[datetime, str]]:
+    """The ``limit`` earliest ``(start, master_id)`` pairs with ``length`` free slots.
+
+    Every master contributes a lazy, time-ordered stream of free starts,
+    computed day by day from the bitmaps; :func:`heapq.merge` pulls from the
+    streams in order, so only the days up to the last returned slot are
+    evaluated. Occupancy is loaded for all masters at once, ``chunk_days``
+    at a time, through ``load_occupancy(first, last)``.
+    """
+    first_day = now.date()
+    hours = hours or {}
+    chunks: Dict[int, Dict[str, Occupancy]] = {}
+
+    def booked(master_id: str, offset: int) -> int:
+        chunk = offset // chunk_days
+        if chunk not in chunks:
+            start = first_day + timedelta(days=chunk * chunk_days)
+            chunks[chunk] = load_occupancy(start, start + timedelta(days=chunk_days - 1))
+        return chunks[chunk].get(master_id, {}).get(first_day + timedelta(days=offset), 0)
+
+    def stream(master_id: str) -> Iterator[Tuple[datetime, str]]:
+        working = hours.get(master_id, working_mask)
+        for offset in range(horizon_days):
+            day = first_day + timedelta(days=offset)
+            if not working(day):
+                continue  # выходной — записи этого дня не нужны
+            mask = run_mask(free_mask(day, booked(master_id, offset), now, working), length)
+            while mask:
+                index = (mask & -mask).bit_length() - 1
+                yield slot_start(day, index), master_id
+                mask &= mask - 1
+
+    return list(islice(heapq.merge(*(stream(master_id) for master_id in master_ids)), limit))
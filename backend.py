@@ -1,16 +1,28 @@
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
-from typing import Dict, Optional, List
-import uuid
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, Dict, Generic, Iterable, Optional, List, Set, Tuple, TypeVar, Union
+import asyncio
 import logging
 import json
-from datetime import datetime, timezone
+import time
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
-import database
+import availability
+import backup
+import catalog_import
+import changes
+import events
+import maintenance
+import schedule
+import traffic
+from database import SALON_RELATIONS
+from repository import Repository, get_repository
+from records import Appointment
+from serialization import Fragment, FragmentCache, GenerationCache, RecordRoute, encode_csv, encode_ndjson
 from config import get_settings
 
 # #region agent log
@@ -40,7 +52,40 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 debug_log("backend.py:25", "Logging configured", {"level": logger.level}, "B")
 
-app = FastAPI(title="Salon WebApp API")
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+# Долгие потоки: снимок БД не должен жить столько же, сколько соединение клиента
+STREAMING_PATHS = {"/api/events"}
+
+
+def repo() -> Repository:
+    return get_repository()
+
+
+async def unit_of_work(request: Request):
+    """Одно соединение и одна транзакция БД на запрос.
+
+    Соединение открывается при первом обращении к БД; изменяющие запросы
+    выполняются в одной транзакции и откатываются целиком при ошибке.
+    Обработчики, работающие с БД, объявлены через ``def``: FastAPI выполняет
+    их в пуле потоков, и ожидание блокировки SQLite не останавливает цикл событий.
+    С очередью писателя групповой COMMIT ожидается здесь же через await:
+    пока одна транзакция ждёт соседей по пакету, цикл событий свободен.
+    """
+    if request.url.path in STREAMING_PATHS:
+        yield
+        return
+    with repo().unit_of_work(write=request.method not in SAFE_METHODS) as uow:
+        yield
+        committed = uow.submit_commit() if uow is not None else None
+        if committed is not None:
+            await asyncio.wrap_future(committed)
+
+
+# scope="function": выход из зависимости (COMMIT) выполняется до отправки ответа,
+# поэтому неудачная фиксация превращается в 5xx, а не в 200 без данных
+app = FastAPI(title="Salon WebApp API", dependencies=[Depends(unit_of_work, scope="function")])
+# Ответы кодируются из записей напрямую (serialization.py), минуя jsonable_encoder
+app.router.route_class = RecordRoute
 debug_log("backend.py:27", "FastAPI app created", {}, "B")
 frontend_dir = Path(__file__).resolve().parent
 index_path = frontend_dir / "index.html"
@@ -65,6 +110,40 @@ async def log_requests(request: Request, call_next):
         debug_log('backend.py:44', 'Request error', {'method': request.method, 'path': request.url.path, 'error': str(e), 'error_type': type(e).__name__}, 'D')
         raise
 
+traffic_recorder = (
+    traffic.TrafficRecorder(settings.traffic_capture_path, settings.traffic_capture_salt)
+    if settings.traffic_capture_path
+    else None
+)
+
+
+# Запись обезличенного трафика для последующего воспроизведения (traffic.py replay)
+@app.middleware("http")
+async def capture_traffic(request: Request, call_next):
+    recorder = traffic_recorder
+    if recorder is None or not request.url.path.startswith("/api/"):
+        return await call_next(request)
+
+    body = await request.body() if request.method in ("POST", "PUT", "PATCH") else b""
+    started_at = time.time()
+    started = time.perf_counter()
+    response = await call_next(request)
+    duration_ms = (time.perf_counter() - started) * 1000
+
+    route = request.scope.get("route")
+    recorder.record(
+        started_at=started_at,
+        method=request.method,
+        route=getattr(route, "path", request.url.path),
+        path_params=dict(request.path_params),
+        query_params=dict(request.query_params),
+        body=body,
+        user_id=request.headers.get("X-User-Id"),
+        status=response.status_code,
+        duration_ms=duration_ms,
+    )
+    return response
+
 static_dir = frontend_dir / "static"
 if static_dir.exists():
     app.mount("/static", StaticFiles(directory=static_dir), name="static")
@@ -99,8 +178,28 @@ debug_log("backend.py:60", "CORS middleware added", {"origins": allowed_origins}
 
 @app.on_event("startup")
 async def on_startup():
-    database.init_db()
-    logger.info("Database initialized")
+    repo().init()
+    logger.info("Storage initialized (%s)", settings.storage_engine)
+    app.state.background_tasks = []
+    if settings.archive_interval_seconds > 0:
+        app.state.background_tasks.append(
+            asyncio.create_task(maintenance.archival_loop(), name="appointment-archival")
+        )
+    if settings.db_maintenance_interval_seconds > 0:
+        app.state.background_tasks.append(
+            asyncio.create_task(maintenance.maintenance_loop(), name="db-maintenance")
+        )
+    if settings.db_integrity_interval_seconds > 0:
+        app.state.background_tasks.append(
+            asyncio.create_task(maintenance.integrity_loop(), name="db-integrity")
+        )
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    for task in getattr(app.state, "background_tasks", []):
+        task.cancel()
+    repo().close()
 
 
 class SalonCreate(BaseModel):
@@ -130,6 +229,35 @@ class ServiceUpdate(BaseModel):
     description: Optional[str] = None
 
 
+class MasterImport(MasterCreate):
+    name: str = Field(min_length=1)
+    external_id: Optional[str] = None
+
+
+class ServiceImport(ServiceCreate):
+    name: str = Field(min_length=1)
+    external_id: Optional[str] = None
+
+
+class ScheduleBreak(BaseModel):
+    start: str  # "HH:MM"
+    end: str
+    days: Optional[List[str]] = None  # mon..sun; по умолчанию каждый день
+
+
+class ScheduleException(BaseModel):
+    date_from: str  # YYYY-MM-DD
+    date_to: Optional[str] = None  # включительно; по умолчанию = date_from
+    intervals: List[Tuple[str, str]] = []  # пусто — выходной
+    note: Optional[str] = None
+
+
+class MasterSchedule(BaseModel):
+    weekly: Dict[str, List[Tuple[str, str]]] = {}  # mon..sun -> [["09:00", "18:00"]]
+    breaks: List[ScheduleBreak] = Field(default=[], max_length=50)
+    exceptions: List[ScheduleException] = Field(default=[], max_length=500)
+
+
 class SalonUpdate(BaseModel):
     name: Optional[str] = None
 
@@ -145,6 +273,197 @@ class AppointmentUpdate(BaseModel):
     status: Optional[str] = None
 
 
+class AppointmentBatchUpdate(BaseModel):
+    ids: List[str] = Field(min_length=1, max_length=500)
+    status: str
+
+
+# Модели ответов: схема OpenAPI и контракт, который проверяют тесты
+T = TypeVar("T")
+
+
+class ItemsOut(BaseModel, Generic[T]):
+    items: List[T]
+
+
+class OkOut(BaseModel):
+    ok: bool
+
+
+class MasterOut(BaseModel):
+    id: str
+    name: str
+    telegram_id: Optional[str] = None
+
+
+class PublicMasterOut(BaseModel):
+    id: str
+    name: str
+
+
+class ServiceOut(BaseModel):
+    id: str
+    name: str
+    price: Optional[float] = None
+    duration: Optional[int] = None
+    description: Optional[str] = None
+
+
+class AppointmentOut(BaseModel):
+    id: str
+    salon_id: str
+    master_id: str
+    service_id: str
+    client_id: str
+    datetime: str
+    status: str
+
+
+class AppointmentPageOut(ItemsOut[AppointmentOut]):
+    next_offset: Optional[int] = None
+
+
+class AppointmentBatchItemOut(BaseModel):
+    id: str
+    ok: bool
+    status: Optional[str] = None  # статус записи после обработки
+    error: Optional[str] = None
+
+
+class AppointmentBatchOut(BaseModel):
+    updated: int
+    failed: int
+    items: List[AppointmentBatchItemOut]
+
+
+class AppointmentsWindowOut(BaseModel):
+    date_from: str
+    date_to: str
+    total: int
+    before: int
+    after: int
+    url: str
+
+
+class SalonOut(BaseModel):
+    id: str
+    name: str
+    owner_id: str
+    masters: Optional[List[MasterOut]] = None
+    services: Optional[List[ServiceOut]] = None
+    appointments: Optional[List[AppointmentOut]] = None
+    appointments_window: Optional[AppointmentsWindowOut] = None
+
+
+class SalonSummaryOut(BaseModel):
+    id: str
+    name: str
+    masters_count: int
+    services_count: int
+
+
+class MasterSalonOut(BaseModel):
+    id: str
+    name: str
+    masters: List[MasterOut]
+    services: List[ServiceOut]
+
+
+class RoleOut(BaseModel):
+    role: str
+    user_id: str
+    salon_id: Optional[str] = None
+
+
+class BackupOut(BaseModel):
+    path: str
+    sha256: str
+    size_bytes: int
+    compressed_bytes: int
+    duration_ms: float
+    rotated: List[str]
+    steps: int
+    restarts: int
+    fallback: bool
+
+
+class CatalogImportRowOut(BaseModel):
+    row: int
+    status: str  # created | updated | error (valid — строка без ошибок в отклонённом импорте)
+    id: Optional[str] = None
+    external_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class CatalogImportOut(BaseModel):
+    created: int
+    updated: int
+    errors: int
+    masters: List[CatalogImportRowOut]
+    services: List[CatalogImportRowOut]
+
+
+class MasterScheduleOut(MasterSchedule):
+    master_id: str
+    custom: bool  # False — действуют часы по умолчанию
+
+
+class AvailabilityOut(BaseModel):
+    date_from: str
+    days: int
+    slot_minutes: int
+    masters: Dict[str, List[int]]  # мастер -> битовая маска свободных слотов по дням
+
+
+class EarliestSlotOut(BaseModel):
+    master_id: str
+    datetime: str
+
+
+class EarliestSlotsOut(BaseModel):
+    duration: int  # минуты
+    items: List[EarliestSlotOut]
+
+
+class ClientCatalogOut(BaseModel):
+    id: str
+    name: str
+    masters: List[PublicMasterOut]
+    services: List[ServiceOut]
+
+
+class BootstrapOut(BaseModel):
+    role: str
+    user_id: str
+    salon: Optional[Union[SalonOut, MasterSalonOut]] = None  # owner / master
+    appointments: List[AppointmentOut]
+    appointments_window: Optional[AppointmentsWindowOut] = None  # owner: как в /api/owner/salon
+    salons: Optional[List[SalonSummaryOut]] = None  # client
+    catalogs: Optional[Dict[str, ClientCatalogOut]] = None  # client: салоны из его записей
+
+
+class SyncSalonOut(BaseModel):
+    id: str
+    name: str
+
+
+class SyncOut(BaseModel):
+    cursor: int  # передать как since в следующий запрос
+    reset: bool  # курсор неизвестен или сжат: загрузить всё заново (bootstrap) и продолжить с cursor
+    has_more: bool
+    salons: List[SyncSalonOut]
+    masters: List[MasterOut]
+    services: List[ServiceOut]
+    schedules: List[MasterScheduleOut]
+    appointments: List[AppointmentOut]
+    deleted: Dict[str, List[str]]  # salons / masters / services / schedules / appointments -> id
+
+
+class HealthOut(BaseModel):
+    status: str
+    time: str
+
+
 def require_user_id(request: Request) -> str:
     user_id = request.headers.get("X-User-Id")
     if not user_id:
@@ -152,12 +471,37 @@ def require_user_id(request: Request) -> str:
     return str(user_id)
 
 
-def get_owner_salon(owner_id: str) -> Optional[Dict]:
-    return database.get_owner_salon(owner_id)
+def require_admin(request: Request) -> str:
+    user_id = require_user_id(request)
+    if user_id not in settings.admin_ids:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user_id
+
+
+def get_owner_salon(owner_id: str, include: Optional[Iterable[str]] = None) -> Optional[Dict]:
+    return repo().get_owner_salon(owner_id, include)
+
 
+def get_owner_salon_id(owner_id: str) -> Optional[str]:
+    return repo().get_owner_salon_id(owner_id)
 
-def get_salon_by_id(salon_id: str) -> Optional[Dict]:
-    return database.get_salon_by_id(salon_id)
+
+def get_salon_by_id(salon_id: str, include: Optional[Iterable[str]] = None) -> Optional[Dict]:
+    return repo().get_salon_by_id(salon_id, include)
+
+
+def parse_salon_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    """Разбор ?fields=masters,services; None — все коллекции"""
+    if fields is None:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - SALON_RELATIONS
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {sorted(unknown)}. Allowed: {sorted(SALON_RELATIONS)}",
+        )
+    return requested
 
 
 def is_owner(salon: Dict, user_id: str) -> bool:
@@ -168,7 +512,7 @@ def is_owner(salon: Dict, user_id: str) -> bool:
 def is_master(salon: Dict, user_id: str) -> bool:
     """Проверка, является ли пользователь мастером салона"""
     for master in salon.get("masters", []):
-        if master.get("telegram_id") == str(user_id):
+        if master.telegram_id == str(user_id):
             return True
     return False
 
@@ -176,7 +520,7 @@ def is_master(salon: Dict, user_id: str) -> bool:
 def get_user_role(user_id: str, salon_id: Optional[str] = None) -> str:
     """Определение роли пользователя: owner, master, или client"""
     if salon_id:
-        salon = get_salon_by_id(salon_id)
+        salon = get_salon_by_id(salon_id, include={"masters"})
         if salon:
             if is_owner(salon, user_id):
                 return "owner"
@@ -184,9 +528,9 @@ def get_user_role(user_id: str, salon_id: Optional[str] = None) -> str:
                 return "master"
     
     # Проверяем все салоны, если salon_id не указан
-    salons = database.get_all_salons()
+    salons = repo().get_all_salons()
     for salon_data in salons:
-        salon = get_salon_by_id(salon_data["id"])
+        salon = get_salon_by_id(salon_data["id"], include={"masters"})
         if salon:
             if is_owner(salon, user_id):
                 return "owner"
@@ -196,119 +540,271 @@ def get_user_role(user_id: str, salon_id: Optional[str] = None) -> str:
     return "client"
 
 
-@app.get("/api/owner/salon")
-async def owner_get_salon(request: Request):
+# Закодированные фрагменты каталога салона (сводка, мастера, услуги)
+catalog_cache = FragmentCache()
+CATALOG_PARTS = ("summary", "masters", "services")
+
+
+def invalidate_catalog(salon_id: str) -> None:
+    """Сбросить кеш каталога салона после фиксации текущей транзакции"""
+    keys = [(salon_id, part) for part in CATALOG_PARTS]
+    repo().after_commit(lambda: catalog_cache.invalidate(*keys))
+
+
+def cached_catalog(salon_id: str, part: str, load) -> Fragment:
+    """Фрагмент каталога из кеша; ``load()`` вызывается при промахе"""
+    key = (salon_id, part)
+    fragment = catalog_cache.get(key)
+    if fragment is None:
+        if repo().in_snapshot():
+            # Снимок открыт раньше, чем взято поколение: запись между ними
+            # в него не попала, поэтому в общий кеш такой фрагмент не кладём
+            return catalog_cache.prepare(load())
+        # Поколение берём до чтения из БД: запись, зафиксированная в промежутке,
+        # не даст сохранить устаревший фрагмент
+        generation = catalog_cache.generation(key)
+        fragment = catalog_cache.put(key, generation, load())
+    return fragment
+
+
+def appointments_window_payload(salon_id: str) -> Dict:
+    """Записи салона в окне «сегодня ± N дней» и счётчики остальных.
+
+    Полная история доступна постранично через /api/owner/appointments.
+    """
+    days = settings.owner_salon_window_days
+    today = date.today()
+    date_from = (today - timedelta(days=days)).isoformat()
+    date_to = (today + timedelta(days=days + 1)).isoformat()
+    counts = repo().count_salon_appointments(salon_id, date_from, date_to)
+    return {
+        "appointments": repo().get_salon_appointments(salon_id, date_from=date_from, date_to=date_to),
+        "appointments_window": {
+            "date_from": date_from,
+            "date_to": date_to,
+            "total": counts["total"],
+            "before": counts["before"],
+            "after": counts["after"],
+            "url": "/api/owner/appointments?limit=100",
+        },
+    }
+
+
+@app.get("/api/owner/salon", response_model=SalonOut)
+def owner_get_salon(request: Request, fields: Optional[str] = None):
+    """Салон владельца; ?fields=masters,services ограничивает вложенные коллекции"""
     owner_id = require_user_id(request)
-    salon = get_owner_salon(owner_id)
+    include = parse_salon_fields(fields)
+    relations = SALON_RELATIONS if include is None else include
+    salon = get_owner_salon(owner_id, include=relations - {"appointments"})
     if not salon:
         raise HTTPException(status_code=404, detail="Salon not found")
+    if "appointments" in relations:
+        salon.update(appointments_window_payload(salon["id"]))
     return salon
 
 
-@app.post("/api/owner/salon")
-async def owner_create_salon(request: Request, payload: SalonCreate):
+@app.post("/api/owner/salon", response_model=SalonOut)
+def owner_create_salon(request: Request, payload: SalonCreate):
     owner_id = require_user_id(request)
-    if get_owner_salon(owner_id):
+    if get_owner_salon_id(owner_id):
         raise HTTPException(status_code=400, detail="Salon already exists")
 
-    salon = database.create_salon(payload.name or "Мой салон", owner_id)
+    salon = repo().create_salon(payload.name or "Мой салон", owner_id)
     return salon
 
 
-@app.patch("/api/owner/salon")
-async def owner_update_salon(request: Request, payload: SalonUpdate):
+@app.patch("/api/owner/salon", response_model=SalonOut)
+def owner_update_salon(request: Request, payload: SalonUpdate):
     owner_id = require_user_id(request)
-    salon = get_owner_salon(owner_id)
-    if not salon:
+    salon_id = get_owner_salon_id(owner_id)
+    if not salon_id:
         raise HTTPException(status_code=404, detail="Salon not found")
     
-    updated_salon = database.update_salon(salon["id"], payload.name)
+    updated_salon = repo().update_salon(salon_id, payload.name)
+    invalidate_catalog(salon_id)
     return updated_salon
 
 
 # --- Masters ---
-@app.get("/api/owner/masters")
-async def owner_list_masters(request: Request):
+@app.get("/api/owner/masters", response_model=ItemsOut[MasterOut])
+def owner_list_masters(request: Request):
     owner_id = require_user_id(request)
-    salon = get_owner_salon(owner_id)
+    salon = get_owner_salon(owner_id, include={"masters"})
     if not salon:
         raise HTTPException(status_code=404, detail="Salon not found")
     return {"items": salon["masters"]}
 
 
-@app.post("/api/owner/masters")
-async def owner_add_master(request: Request, master: MasterCreate):
+@app.post("/api/owner/masters", response_model=MasterOut)
+def owner_add_master(request: Request, master: MasterCreate):
     owner_id = require_user_id(request)
-    salon = get_owner_salon(owner_id)
-    if not salon:
+    salon_id = get_owner_salon_id(owner_id)
+    if not salon_id:
         raise HTTPException(status_code=404, detail="Salon not found")
 
-    master_obj = database.create_master(salon["id"], master.name, master.telegram_id)
+    master_obj = repo().create_master(salon_id, master.name, master.telegram_id)
+    invalidate_catalog(salon_id)
     return master_obj
 
 
-@app.patch("/api/owner/masters/{master_id}")
-async def owner_update_master(request: Request, master_id: str, payload: MasterUpdate):
+@app.patch("/api/owner/masters/{master_id}", response_model=MasterOut)
+def owner_update_master(request: Request, master_id: str, payload: MasterUpdate):
     owner_id = require_user_id(request)
-    salon = get_owner_salon(owner_id)
+    salon = get_owner_salon(owner_id, include={"masters"})
     if not salon:
         raise HTTPException(status_code=404, detail="Salon not found")
 
     # Проверяем, что мастер принадлежит салону
-    master_ids = [m["id"] for m in salon.get("masters", [])]
+    master_ids = [m.id for m in salon.get("masters", [])]
     if master_id not in master_ids:
         raise HTTPException(status_code=404, detail="Master not found")
     
-    updated_master = database.update_master(master_id, payload.name)
+    updated_master = repo().update_master(master_id, payload.name)
     if not updated_master:
         raise HTTPException(status_code=404, detail="Master not found")
+    invalidate_catalog(salon["id"])
     return updated_master
 
 
-@app.delete("/api/owner/masters/{master_id}")
-async def owner_delete_master(request: Request, master_id: str):
+@app.delete("/api/owner/masters/{master_id}", response_model=OkOut)
+def owner_delete_master(request: Request, master_id: str):
+    # Удаление каскадом уносит записи мастера — только мастера своего салона
+    salon_id = require_owner_master(request, master_id)
+    deleted = repo().delete_master(master_id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Master not found")
+    invalidate_catalog(salon_id)
+    invalidate_schedule(master_id)
+    return {"ok": True}
+
+
+# --- Master schedules ---
+schedule_cache = GenerationCache(maxsize=4096)
+
+
+def invalidate_schedule(master_id: str) -> None:
+    """Сбросить скомпилированное расписание мастера после фиксации транзакции"""
+    repo().after_commit(lambda: schedule_cache.invalidate(master_id))
+
+
+def master_schedules(master_ids: List[str]) -> Dict[str, schedule.CompiledSchedule]:
+    """Скомпилированные расписания мастеров; промахи кеша читаются одним запросом"""
+    compiled = {}
+    missing = []
+    for master_id in master_ids:
+        cached = schedule_cache.get(master_id)
+        if cached is None:
+            missing.append(master_id)
+        else:
+            compiled[master_id] = cached
+    if missing:
+        generations = {master_id: schedule_cache.generation(master_id) for master_id in missing}
+        stored = repo().get_master_schedules(missing)
+        for master_id in missing:
+            rules = stored.get(master_id)
+            fresh = schedule.compile_schedule(rules) if rules else schedule.DEFAULT
+            compiled[master_id] = schedule_cache.put(master_id, generations[master_id], fresh)
+    return compiled
+
+
+def master_hours(master_ids: List[str]) -> Dict[str, availability.WorkingHours]:
+    """Рабочие слоты мастеров по дням для расчёта свободного времени"""
+    return {master_id: compiled.mask for master_id, compiled in master_schedules(master_ids).items()}
+
+
+def require_owner_master(request: Request, master_id: str) -> str:
+    """salon_id владельца, если мастер из его салона"""
     owner_id = require_user_id(request)
-    salon = get_owner_salon(owner_id)
+    salon = get_owner_salon(owner_id, include={"masters"})
     if not salon:
         raise HTTPException(status_code=404, detail="Salon not found")
-
-    deleted = database.delete_master(master_id)
-    if not deleted:
+    if not any(m.id == master_id for m in salon.get("masters", [])):
         raise HTTPException(status_code=404, detail="Master not found")
-    return {"ok": True}
+    return salon["id"]
+
+
+def schedule_document(master_id: str, rules: Optional[Dict]) -> Dict:
+    return {**(rules or schedule.DEFAULT_SCHEDULE), "master_id": master_id, "custom": rules is not None}
+
+
+def schedule_payload(master_id: str) -> Dict:
+    return schedule_document(master_id, repo().get_master_schedules([master_id]).get(master_id))
+
+
+@app.get("/api/owner/masters/{master_id}/schedule", response_model=MasterScheduleOut)
+def owner_get_master_schedule(request: Request, master_id: str):
+    """Расписание мастера (или часы по умолчанию, если оно не задано)"""
+    require_owner_master(request, master_id)
+    return schedule_payload(master_id)
+
+
+@app.put("/api/owner/masters/{master_id}/schedule", response_model=MasterScheduleOut)
+def owner_set_master_schedule(request: Request, master_id: str, payload: MasterSchedule):
+    """Заменить расписание мастера: недельные часы, перерывы и исключения по датам"""
+    require_owner_master(request, master_id)
+    rules = payload.model_dump(exclude_none=True)
+    try:
+        schedule.compile_schedule(rules)
+    except schedule.ScheduleError as exc:
+        raise HTTPException(status_code=400, detail=f"Invalid schedule: {exc}")
+    repo().set_master_schedule(master_id, rules)
+    invalidate_schedule(master_id)
+    return {**rules, "master_id": master_id, "custom": True}
+
+
+@app.delete("/api/owner/masters/{master_id}/schedule", response_model=MasterScheduleOut)
+def owner_reset_master_schedule(request: Request, master_id: str):
+    """Вернуть мастеру часы по умолчанию"""
+    require_owner_master(request, master_id)
+    repo().set_master_schedule(master_id, None)
+    invalidate_schedule(master_id)
+    return schedule_payload(master_id)
 
 
 # --- Services (UI placeholder for owner) ---
-@app.post("/api/owner/services")
-async def owner_add_service(request: Request, service: ServiceCreate):
+def require_owner_service(request: Request, service_id: str) -> str:
+    """salon_id владельца, если услуга из его салона"""
     owner_id = require_user_id(request)
-    salon = get_owner_salon(owner_id)
+    salon = get_owner_salon(owner_id, include={"services"})
     if not salon:
         raise HTTPException(status_code=404, detail="Salon not found")
+    if not any(s.id == service_id for s in salon.get("services", [])):
+        raise HTTPException(status_code=404, detail="Service not found")
+    return salon["id"]
+
+
+@app.post("/api/owner/services", response_model=ServiceOut)
+def owner_add_service(request: Request, service: ServiceCreate):
+    owner_id = require_user_id(request)
+    salon_id = get_owner_salon_id(owner_id)
+    if not salon_id:
+        raise HTTPException(status_code=404, detail="Salon not found")
 
-    service_obj = database.create_service(
-        salon["id"], 
+    service_obj = repo().create_service(
+        salon_id, 
         service.name, 
         service.price, 
         service.duration, 
         service.description
     )
+    invalidate_catalog(salon_id)
     return service_obj
 
 
-@app.patch("/api/owner/services/{service_id}")
-async def owner_update_service(request: Request, service_id: str, payload: ServiceUpdate):
+@app.patch("/api/owner/services/{service_id}", response_model=ServiceOut)
+def owner_update_service(request: Request, service_id: str, payload: ServiceUpdate):
     owner_id = require_user_id(request)
-    salon = get_owner_salon(owner_id)
+    salon = get_owner_salon(owner_id, include={"services"})
     if not salon:
         raise HTTPException(status_code=404, detail="Salon not found")
 
     # Проверяем, что услуга принадлежит салону
-    service_ids = [s["id"] for s in salon.get("services", [])]
+    service_ids = [s.id for s in salon.get("services", [])]
     if service_id not in service_ids:
         raise HTTPException(status_code=404, detail="Service not found")
     
-    updated_service = database.update_service(
+    updated_service = repo().update_service(
         service_id,
         payload.name,
         payload.price,
@@ -317,135 +813,367 @@ async def owner_update_service(request: Request, service_id: str, payload: Servi
     )
     if not updated_service:
         raise HTTPException(status_code=404, detail="Service not found")
+    invalidate_catalog(salon["id"])
     return updated_service
 
 
-@app.delete("/api/owner/services/{service_id}")
-async def owner_delete_service(request: Request, service_id: str):
-    owner_id = require_user_id(request)
-    salon = get_owner_salon(owner_id)
-    if not salon:
-        raise HTTPException(status_code=404, detail="Salon not found")
-
-    deleted = database.delete_service(service_id)
+@app.delete("/api/owner/services/{service_id}", response_model=OkOut)
+def owner_delete_service(request: Request, service_id: str):
+    salon_id = require_owner_service(request, service_id)
+    deleted = repo().delete_service(service_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Service not found")
+    invalidate_catalog(salon_id)
     return {"ok": True}
 
 
+# --- Catalog import ---
+IMPORT_MODELS = {"masters": MasterImport, "services": ServiceImport}
+
+
+async def read_catalog_import(request: Request) -> Dict[str, List[Any]]:
+    """Тело импорта: JSON {"masters": [...], "services": [...]} или CSV с колонкой kind"""
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("text/csv"):
+            catalog = catalog_import.parse_csv(body.decode("utf-8-sig"))
+        else:
+            payload = json.loads(body)
+            if not isinstance(payload, dict) or not all(
+                isinstance(payload.get(kind, []), list) for kind in catalog_import.KINDS
+            ):
+                raise catalog_import.ImportFormatError('expected {"masters": [...], "services": [...]}')
+            catalog = {kind: payload.get(kind, []) for kind in catalog_import.KINDS}
+    except ValueError as exc:  # в т.ч. JSONDecodeError и UnicodeDecodeError
+        raise HTTPException(status_code=400, detail=f"Invalid import body: {exc}")
+    if sum(map(len, catalog.values())) > catalog_import.MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {catalog_import.MAX_ROWS} rows per import")
+    return catalog
+
+
+def validate_catalog_rows(catalog: Dict[str, List[Any]]):
+    """Проверить все строки по моделям; вернуть данные строк и построчные ошибки"""
+    rows: Dict[str, List[Dict]] = {}
+    results: Dict[str, List[Dict]] = {}
+    for kind, model in IMPORT_MODELS.items():
+        rows[kind], results[kind] = [], []
+        for number, raw in enumerate(catalog[kind]):
+            try:
+                row = model.model_validate(raw).model_dump()
+            except ValidationError as exc:
+                error = "; ".join(
+                    f"{'.'.join(map(str, e['loc'])) or 'row'}: {e['msg']}" for e in exc.errors()
+                )
+                results[kind].append({"row": number, "status": "error", "error": error})
+                continue
+            rows[kind].append(row)
+            results[kind].append({"row": number, "status": "valid", "external_id": row["external_id"]})
+    return rows, results
+
+
+@app.post(
+    "/api/owner/catalog/import",
+    response_model=CatalogImportOut,
+    responses={422: {"description": "Rows with errors; nothing was imported"}},
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": {"type": "object", "properties": {
+            "masters": {"type": "array", "items": MasterImport.model_json_schema()},
+            "services": {"type": "array", "items": ServiceImport.model_json_schema()},
+        }}},
+        "text/csv": {"schema": {"type": "string"}},
+    }}},
+)
+def owner_import_catalog(
+    request: Request,
+    catalog: Dict[str, List[Any]] = Depends(read_catalog_import),
+    upsert: Optional[str] = Query(None, pattern="^(name|external_id)$"),
+):
+    """Массовый импорт мастеров и услуг одной транзакцией.
+
+    Сначала проверяются все строки; при любой ошибке ничего не записывается
+    и возвращается 422 с построчными результатами.
+    """
+    owner_id = require_user_id(request)
+    salon_id = get_owner_salon_id(owner_id)
+    if not salon_id:
+        raise HTTPException(status_code=404, detail="Salon not found")
+
+    rows, results = validate_catalog_rows(catalog)
+    summary = catalog_import.summary(results)
+    if summary["errors"]:
+        raise HTTPException(status_code=422, detail=summary)
+
+    result = repo().import_catalog(salon_id, rows, upsert)
+    if result["errors"]:
+        raise HTTPException(status_code=422, detail=result)
+    invalidate_catalog(salon_id)
+    return result
+
+
 # --- Client API ---
-@app.get("/api/client/salons")
-async def client_list_salons():
+@app.get("/api/client/salons", response_model=ItemsOut[SalonSummaryOut])
+def client_list_salons():
     """Список всех салонов (публичный)"""
-    salons = database.get_all_salons()
+    salons = repo().get_all_salons()
     return {"items": salons}
 
 
-@app.get("/api/client/salons/{salon_id}")
-async def client_get_salon(salon_id: str):
+def catalog_summary(salon_id: str) -> Fragment:
+    """Сводка салона для клиента (из кеша каталога)"""
+    def load():
+        salon = get_salon_by_id(salon_id, include={"masters", "services"})
+        if not salon:
+            raise HTTPException(status_code=404, detail="Salon not found")
+        return {
+            "id": salon["id"],
+            "name": salon["name"],
+            "masters_count": len(salon.get("masters", [])),
+            "services_count": len(salon.get("services", []))
+        }
+
+    return cached_catalog(salon_id, "summary", load)
+
+
+def catalog_masters(salon_id: str) -> Fragment:
+    """Публичный список мастеров салона (из кеша каталога)"""
+    def load():
+        salon = get_salon_by_id(salon_id, include=set())
+        if not salon:
+            raise HTTPException(status_code=404, detail="Salon not found")
+        # telegram_id клиентам не отдаём
+        return [{"id": m.id, "name": m.name} for m in repo().get_salon_masters(salon_id)]
+
+    return cached_catalog(salon_id, "masters", load)
+
+
+def catalog_services(salon_id: str) -> Fragment:
+    """Список услуг салона (из кеша каталога)"""
+    def load():
+        salon = get_salon_by_id(salon_id, include=set())
+        if not salon:
+            raise HTTPException(status_code=404, detail="Salon not found")
+        return repo().get_salon_services(salon_id)
+
+    return cached_catalog(salon_id, "services", load)
+
+
+@app.get("/api/client/salons/{salon_id}", response_model=SalonSummaryOut)
+def client_get_salon(salon_id: str):
     """Информация о салоне для клиента"""
-    salon = get_salon_by_id(salon_id)
-    if not salon:
-        raise HTTPException(status_code=404, detail="Salon not found")
-    
-    return {
-        "id": salon["id"],
-        "name": salon["name"],
-        "masters_count": len(salon.get("masters", [])),
-        "services_count": len(salon.get("services", []))
-    }
+    return catalog_summary(salon_id)
 
 
-@app.get("/api/client/salons/{salon_id}/masters")
-async def client_get_salon_masters(salon_id: str):
+@app.get("/api/client/salons/{salon_id}/masters", response_model=ItemsOut[PublicMasterOut])
+def client_get_salon_masters(salon_id: str):
     """Список мастеров салона"""
-    salon = get_salon_by_id(salon_id)
-    if not salon:
-        raise HTTPException(status_code=404, detail="Salon not found")
-    
-    masters = database.get_salon_masters(salon_id)
-    # Убираем telegram_id из ответа для клиентов
-    for master in masters:
-        master.pop("telegram_id", None)
-    return {"items": masters}
+    return {"items": catalog_masters(salon_id)}
 
 
-@app.get("/api/client/salons/{salon_id}/services")
-async def client_get_salon_services(salon_id: str):
+@app.get("/api/client/salons/{salon_id}/services", response_model=ItemsOut[ServiceOut])
+def client_get_salon_services(salon_id: str):
     """Список услуг салона"""
-    salon = get_salon_by_id(salon_id)
-    if not salon:
-        raise HTTPException(status_code=404, detail="Salon not found")
-    
-    services = database.get_salon_services(salon_id)
-    return {"items": services}
+    return {"items": catalog_services(salon_id)}
+
 
+EARLIEST_SEARCH_DAYS = 60
 
-@app.get("/api/client/salons/{salon_id}/available-slots")
-async def client_get_available_slots(salon_id: str, master_id: str, date: str):
+
+def master_occupancy(first: date, last: date, master_ids: List[str]):
+    """Маски занятых слотов мастеров по дням first..last"""
+    return repo().get_occupancy(master_ids, first, last)
+
+
+@app.get("/api/client/salons/{salon_id}/available-slots", response_model=ItemsOut[str])
+def client_get_available_slots(salon_id: str, master_id: str, date: str):
     """Получение доступных слотов времени для мастера на указанную дату"""
-    salon = get_salon_by_id(salon_id)
+    salon = get_salon_by_id(salon_id, include={"masters"})
     if not salon:
         raise HTTPException(status_code=404, detail="Salon not found")
     
     # Проверка существования мастера
-    master_exists = any(m["id"] == master_id for m in salon.get("masters", []))
+    master_exists = any(m.id == master_id for m in salon.get("masters", []))
     if not master_exists:
         raise HTTPException(status_code=404, detail="Master not found")
     
     # Парсинг даты
-    try:
-        target_date = datetime.fromisoformat(date.replace('Z', '+00:00'))
-        if target_date.tzinfo:
-            target_date = target_date.replace(tzinfo=None)
-    except (ValueError, AttributeError):
+    target_date = availability.parse_local(date)
+    if target_date is None:
         raise HTTPException(status_code=400, detail="Invalid date format. Use ISO format (e.g., 2024-01-01)")
+    day = target_date.date()
     
-    # Получаем все записи мастера на эту дату
-    appointments = database.get_salon_appointments(salon_id)
-    booked_times = []
-    for apt in appointments:
-        if apt.get("master_id") == master_id and apt.get("status") not in ["cancelled", "completed"]:
-            try:
-                apt_datetime = datetime.fromisoformat(apt.get("datetime", "").replace('Z', '+00:00'))
-                if apt_datetime.tzinfo:
-                    apt_datetime = apt_datetime.replace(tzinfo=None)
-                if apt_datetime.date() == target_date.date():
-                    booked_times.append(apt_datetime)
-            except (ValueError, AttributeError):
-                continue
-    
-    # Генерируем доступные слоты (каждый час с 9:00 до 18:00)
-    available_slots = []
-    start_hour = 9
-    end_hour = 18
-    
-    for hour in range(start_hour, end_hour):
-        slot_time = target_date.replace(hour=hour, minute=0, second=0, microsecond=0)
-        # Проверяем, не занят ли слот
-        is_booked = any(
-            abs((slot_time - booked_time).total_seconds()) < 3600  # В пределах часа
-            for booked_time in booked_times
-        )
-        if not is_booked and slot_time > datetime.now():
-            available_slots.append(slot_time.isoformat())
-    
-    return {"items": available_slots}
+    # Занятость мастера на этот день — одна строка master_occupancy
+    occupancy = master_occupancy(day, day, [master_id])
+    hours = master_hours([master_id])
+    mask = availability.free_masks([day], [master_id], occupancy, datetime.now(), hours)[master_id][0]
+    return {"items": availability.mask_slots(day, mask)}
+
+
+@app.get("/api/client/salons/{salon_id}/availability", response_model=AvailabilityOut)
+def client_get_availability(
+    salon_id: str,
+    date_from: str,
+    days: int = Query(7, ge=1, le=62),
+    master_id: Optional[str] = None,
+    service_id: Optional[str] = None,
+):
+    """Свободные слоты на несколько дней: по мастеру или по всем мастерам салона.
+
+    Для каждого мастера — список битовых масок по дням: бит i означает
+    свободный слот, начинающийся через i * slot_minutes минут после полуночи.
+    Все мастера салона оказывают все его услуги, поэтому service_id только
+    проверяется.
+    """
+    salon = get_salon_by_id(salon_id, include={"masters", "services"})
+    if not salon:
+        raise HTTPException(status_code=404, detail="Salon not found")
+
+    master_ids = [m.id for m in salon.get("masters", [])]
+    if master_id:
+        if master_id not in master_ids:
+            raise HTTPException(status_code=404, detail="Master not found")
+        master_ids = [master_id]
+    if service_id and not any(s.id == service_id for s in salon.get("services", [])):
+        raise HTTPException(status_code=404, detail="Service not found")
+
+    try:
+        first = date.fromisoformat(date_from[:10])
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date_from. Use YYYY-MM-DD")
+    day_list = [first + timedelta(days=i) for i in range(days)]
+
+    occupancy = master_occupancy(day_list[0], day_list[-1], master_ids)
+    hours = master_hours(master_ids)
+    return {
+        "date_from": first.isoformat(),
+        "days": days,
+        "slot_minutes": availability.SLOT_MINUTES,
+        "masters": availability.free_masks(day_list, master_ids, occupancy, datetime.now(), hours),
+    }
+
+
+@app.get("/api/client/salons/{salon_id}/earliest-slots", response_model=EarliestSlotsOut)
+def client_get_earliest_slots(
+    salon_id: str,
+    service_id: str,
+    limit: int = Query(5, ge=1, le=50),
+    duration: Optional[int] = Query(None, ge=1, le=12 * 60),
+    after: Optional[str] = None,
+):
+    """Ближайшие свободные окна у любого мастера салона для услуги.
+
+    Длительность берётся из услуги (или из ``duration``, минуты); поиск идёт
+    не дальше EARLIEST_SEARCH_DAYS дней вперёд.
+    """
+    salon = get_salon_by_id(salon_id, include={"masters", "services"})
+    if not salon:
+        raise HTTPException(status_code=404, detail="Salon not found")
+    service = next((s for s in salon.get("services", []) if s.id == service_id), None)
+    if service is None:
+        raise HTTPException(status_code=404, detail="Service not found")
+
+    now = datetime.now()
+    if after:
+        start = availability.parse_local(after)
+        if start is None:
+            raise HTTPException(status_code=400, detail="Invalid 'after'. Use ISO format (e.g., 2024-01-01T10:00:00)")
+        now = max(now, start)
+
+    minutes = duration or service.duration
+    master_ids = [m.id for m in salon.get("masters", [])]
+    found = availability.earliest_slots(
+        master_ids,
+        now,
+        availability.slots_needed(minutes),
+        limit,
+        lambda first, last: master_occupancy(first, last, master_ids),
+        hours=master_hours(master_ids),
+        horizon_days=EARLIEST_SEARCH_DAYS,
+    )
+    return {
+        "duration": minutes or availability.SLOT_MINUTES,
+        "items": [{"master_id": master_id, "datetime": start.isoformat()} for start, master_id in found],
+    }
 
 
 # --- Master API ---
+APPOINTMENT_STATUSES = ["pending", "confirmed", "cancelled", "completed"]
+
+
+def require_valid_status(status: Optional[str]) -> str:
+    if not status:
+        raise HTTPException(status_code=400, detail="Status is required")
+    if status not in APPOINTMENT_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Invalid status. Allowed: {APPOINTMENT_STATUSES}")
+    return status
+
+
+def status_transition_error(current_status: str, status: str) -> Optional[str]:
+    """Причина, по которой запись нельзя перевести из ``current_status`` в ``status``"""
+    if current_status == "cancelled":
+        return "Cannot change status of cancelled appointment"
+    if current_status == "completed" and status != "completed":
+        return "Cannot change status of completed appointment"
+    return None
+
+
+# Живые обновления записей (см. events.py и GET /api/events)
+event_broker = events.EventBroker(
+    history=settings.events_history,
+    queue_size=settings.events_queue_size,
+    max_subscribers=settings.events_max_subscribers,
+)
+
+
+def publish_appointments(appointments: Iterable[Appointment]) -> None:
+    """После фиксации отправить записи подписчикам их салона и мастера"""
+    changed = [(apt.to_dict(), {f"salon:{apt.salon_id}", f"master:{apt.master_id}"}) for apt in appointments]
+    if changed:
+        repo().after_commit(
+            lambda: [event_broker.publish("appointment", data, topics) for data, topics in changed]
+        )
+
+
+def update_status_batch(ids: List[str], status: str, allowed) -> Dict:
+    """Перевести записи ``ids`` в ``status`` с построчным результатом.
+
+    Записи читаются одним запросом, изменения пишутся одним executemany в
+    транзакции запроса. ``allowed(appointment)`` отсекает чужие записи —
+    для вызывающего они неотличимы от несуществующих.
+    """
+    ids = list(dict.fromkeys(ids))
+    found = {apt.id: apt for apt in repo().get_appointments_by_ids(ids)}
+    items, to_update = [], []
+    for appointment_id in ids:
+        appointment = found.get(appointment_id)
+        if appointment is None or not allowed(appointment):
+            items.append({"id": appointment_id, "ok": False, "error": "Appointment not found"})
+            continue
+        error = status_transition_error(appointment.status, status)
+        if error:
+            items.append({"id": appointment_id, "ok": False, "status": appointment.status, "error": error})
+            continue
+        to_update.append(appointment_id)
+        items.append({"id": appointment_id, "ok": True, "status": status})
+    repo().update_appointments_status(to_update, status)
+    updated = [found[appointment_id].copy() for appointment_id in to_update]
+    for appointment in updated:
+        appointment.status = status
+    publish_appointments(updated)
+    return {"updated": len(to_update), "failed": len(items) - len(to_update), "items": items}
+
+
 def get_master_salon(user_id: str) -> Optional[Dict]:
     """Получить салон, в котором пользователь является мастером"""
-    salons = database.get_all_salons()
+    salons = repo().get_all_salons()
     for salon_data in salons:
-        salon = get_salon_by_id(salon_data["id"])
+        salon = get_salon_by_id(salon_data["id"], include={"masters", "services"})
         if salon and is_master(salon, user_id):
             return salon
     return None
 
 
-@app.get("/api/master/salon")
-async def master_get_salon(request: Request):
+@app.get("/api/master/salon", response_model=MasterSalonOut)
+def master_get_salon(request: Request):
     """Получить салон мастера"""
     user_id = require_user_id(request)
     salon = get_master_salon(user_id)
@@ -460,8 +1188,8 @@ async def master_get_salon(request: Request):
     }
 
 
-@app.get("/api/master/appointments")
-async def master_get_appointments(request: Request):
+@app.get("/api/master/appointments", response_model=ItemsOut[AppointmentOut])
+def master_get_appointments(request: Request):
     """Записи мастера"""
     user_id = require_user_id(request)
     salon = get_master_salon(user_id)
@@ -469,16 +1197,32 @@ async def master_get_appointments(request: Request):
         raise HTTPException(status_code=404, detail="Salon not found or user is not a master")
     
     # Найти ID мастера по telegram_id
-    master_ids = [m["id"] for m in salon.get("masters", []) if m.get("telegram_id") == str(user_id)]
+    master_ids = [m.id for m in salon.get("masters", []) if m.telegram_id == str(user_id)]
     if not master_ids:
         return {"items": []}
     
-    appointments = database.get_master_appointments(master_ids)
+    appointments = repo().get_master_appointments(master_ids)
     return {"items": appointments}
 
 
-@app.patch("/api/master/appointments/{appointment_id}")
-async def master_update_appointment(request: Request, appointment_id: str, payload: AppointmentUpdate):
+@app.patch("/api/master/appointments", response_model=AppointmentBatchOut)
+def master_update_appointments(request: Request, payload: AppointmentBatchUpdate):
+    """Пакетное изменение статуса записей мастером (одна транзакция)"""
+    user_id = require_user_id(request)
+    salon = get_master_salon(user_id)
+    if not salon:
+        raise HTTPException(status_code=404, detail="Salon not found or user is not a master")
+
+    master_ids = {m.id for m in salon.get("masters", []) if m.telegram_id == str(user_id)}
+    if not master_ids:
+        raise HTTPException(status_code=404, detail="Master not found")
+
+    status = require_valid_status(payload.status)
+    return update_status_batch(payload.ids, status, lambda apt: apt.master_id in master_ids)
+
+
+@app.patch("/api/master/appointments/{appointment_id}", response_model=AppointmentOut)
+def master_update_appointment(request: Request, appointment_id: str, payload: AppointmentUpdate):
     """Изменение статуса записи мастером"""
     user_id = require_user_id(request)
     salon = get_master_salon(user_id)
@@ -486,47 +1230,41 @@ async def master_update_appointment(request: Request, appointment_id: str, paylo
         raise HTTPException(status_code=404, detail="Salon not found or user is not a master")
     
     # Найти ID мастера по telegram_id
-    master_ids = [m["id"] for m in salon.get("masters", []) if m.get("telegram_id") == str(user_id)]
+    master_ids = [m.id for m in salon.get("masters", []) if m.telegram_id == str(user_id)]
     if not master_ids:
         raise HTTPException(status_code=404, detail="Master not found")
     
     # Найти запись мастера
-    appointment = database.get_appointment_by_id(appointment_id)
-    if not appointment or appointment.get("master_id") not in master_ids:
+    appointment = repo().get_appointment_by_id(appointment_id)
+    if not appointment or appointment.master_id not in master_ids:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
     # Валидация статуса
-    current_status = appointment.get("status")
-    if not payload.status:
-        raise HTTPException(status_code=400, detail="Status is required")
-    
-    valid_statuses = ["pending", "confirmed", "cancelled", "completed"]
-    if payload.status not in valid_statuses:
-        raise HTTPException(status_code=400, detail=f"Invalid status. Allowed: {valid_statuses}")
+    require_valid_status(payload.status)
     
     # Проверка допустимых переходов статуса
-    if current_status == "cancelled":
-        raise HTTPException(status_code=400, detail="Cannot change status of cancelled appointment")
-    if current_status == "completed" and payload.status != "completed":
-        raise HTTPException(status_code=400, detail="Cannot change status of completed appointment")
+    error = status_transition_error(appointment.status, payload.status)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
     
     # Обновление статуса
-    updated_appointment = database.update_appointment(appointment_id, payload.status)
+    updated_appointment = repo().update_appointment(appointment_id, payload.status)
+    publish_appointments([updated_appointment])
     return updated_appointment
 
 
 # --- Appointments API ---
-@app.post("/api/client/appointments")
-async def client_create_appointment(request: Request, appointment: AppointmentCreate):
+@app.post("/api/client/appointments", response_model=AppointmentOut)
+def client_create_appointment(request: Request, appointment: AppointmentCreate):
     """Создание записи клиентом"""
     user_id = require_user_id(request)
-    salon = get_salon_by_id(appointment.salon_id)
+    salon = get_salon_by_id(appointment.salon_id, include={"masters", "services"})
     if not salon:
         raise HTTPException(status_code=404, detail="Salon not found")
     
     # Проверка существования мастера и услуги
-    master_exists = any(m["id"] == appointment.master_id for m in salon.get("masters", []))
-    service_exists = any(s["id"] == appointment.service_id for s in salon.get("services", []))
+    master_exists = any(m.id == appointment.master_id for m in salon.get("masters", []))
+    service_exists = any(s.id == appointment.service_id for s in salon.get("services", []))
     
     if not master_exists:
         raise HTTPException(status_code=404, detail="Master not found")
@@ -564,19 +1302,13 @@ async def client_create_appointment(request: Request, appointment: AppointmentCr
     if appointment_datetime <= now:
         raise HTTPException(status_code=400, detail="Cannot book appointment in the past")
     
-    # Проверка на конфликты времени (мастер уже занят в это время)
-    appointments = database.get_salon_appointments(appointment.salon_id)
-    conflicting_appointments = [
-        apt for apt in appointments
-        if apt.get("master_id") == appointment.master_id
-        and apt.get("status") not in ["cancelled", "completed"]
-        and apt.get("datetime") == appointment.datetime
-    ]
-    
-    if conflicting_appointments:
+    # Проверка на конфликты времени: слоты записи против масок занятости мастера
+    needed = availability.booking_masks(appointment_datetime.replace(tzinfo=None))
+    occupancy = master_occupancy(min(needed), max(needed), [appointment.master_id]).get(appointment.master_id, {})
+    if any(occupancy.get(day, 0) & mask for day, mask in needed.items()):
         raise HTTPException(status_code=409, detail="Master is already booked at this time")
     
-    appointment_obj = database.create_appointment(
+    appointment_obj = repo().create_appointment(
         appointment.salon_id,
         appointment.master_id,
         appointment.service_id,
@@ -584,26 +1316,26 @@ async def client_create_appointment(request: Request, appointment: AppointmentCr
         appointment.datetime,
         "pending"
     )
-    
+    publish_appointments([appointment_obj])
     return appointment_obj
 
 
-@app.get("/api/client/appointments")
-async def client_get_appointments(request: Request):
-    """Записи клиента"""
+@app.get("/api/client/appointments", response_model=ItemsOut[AppointmentOut])
+def client_get_appointments(request: Request, date_from: Optional[str] = None, date_to: Optional[str] = None):
+    """Записи клиента (диапазон раньше границы архива читает и архив)"""
     user_id = require_user_id(request)
-    appointments = database.get_client_appointments(str(user_id))
+    appointments = repo().get_client_appointments(str(user_id), date_from=date_from, date_to=date_to)
     return {"items": appointments}
 
 
-@app.patch("/api/client/appointments/{appointment_id}")
-async def client_update_appointment(request: Request, appointment_id: str, payload: AppointmentUpdate):
+@app.patch("/api/client/appointments/{appointment_id}", response_model=AppointmentOut)
+def client_update_appointment(request: Request, appointment_id: str, payload: AppointmentUpdate):
     """Отмена записи клиентом"""
     user_id = require_user_id(request)
     
     # Найти запись
-    appointment = database.get_appointment_by_id(appointment_id)
-    if not appointment or appointment.get("client_id") != str(user_id):
+    appointment = repo().get_appointment_by_id(appointment_id)
+    if not appointment or appointment.client_id != str(user_id):
         raise HTTPException(status_code=404, detail="Appointment not found")
     
     # Клиент может только отменить запись
@@ -611,72 +1343,300 @@ async def client_update_appointment(request: Request, appointment_id: str, paylo
         raise HTTPException(status_code=400, detail="Client can only cancel appointments")
     
     # Проверка, что запись можно отменить
-    current_status = appointment.get("status")
+    current_status = appointment.status
     if current_status in ["cancelled", "completed"]:
         raise HTTPException(status_code=400, detail=f"Cannot cancel appointment with status: {current_status}")
     
     # Обновление статуса
-    updated_appointment = database.update_appointment(appointment_id, "cancelled")
+    updated_appointment = repo().update_appointment(appointment_id, "cancelled")
+    publish_appointments([updated_appointment])
     return updated_appointment
 
 
+# --- Live updates ---
+def event_topics(user_id: str) -> Set[str]:
+    """Темы событий пользователя: салон владельца или его записи как мастера"""
+    salon_id = get_owner_salon_id(user_id)
+    if salon_id:
+        return {f"salon:{salon_id}"}
+    salon = get_master_salon(user_id)
+    if salon:
+        return {f"master:{m.id}" for m in salon.get("masters", []) if m.telegram_id == str(user_id)}
+    return set()
+
+
+async def event_stream(topics: Set[str], last_event_id: Optional[str]):
+    """Кадры text/event-stream: пропущенные события, затем живые и heartbeat.
+
+    Подписка оформляется при первой итерации, а не в обработчике: если
+    клиент ушёл раньше, чем ответ начал отдаваться, подписываться было
+    некому и отписываться не нужно.
+    """
+    yield "retry: 3000\n\n"
+    try:
+        subscription, replay = event_broker.subscribe(topics, last_event_id)
+    except events.TooManySubscribers:
+        return  # лимит заняли между проверкой и подпиской — клиент переподключится
+    try:
+        for event in replay:
+            yield events.format_event(event)
+        while not (replay and replay[-1].type == events.RESET):
+            event = await subscription.get(settings.events_heartbeat_seconds)
+            if event is None:
+                yield ": ping\n\n"
+                continue
+            yield events.format_event(event)
+            if event.type == events.RESET:
+                break  # подписчик отстал — клиент перезагрузит список
+    finally:
+        event_broker.unsubscribe(subscription)
+
+
+@app.get(
+    "/api/events",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}},
+)
+async def stream_events(request: Request, last_event_id: Optional[str] = Header(None)):
+    """Поток изменений записей (SSE): владельцу — по салону, мастеру — по его записям.
+
+    Каждое событие ``appointment`` несёт запись целиком. После переподключения
+    с Last-Event-ID приходят пропущенные события или ``reset``, если их уже
+    нет в буфере.
+    """
+    user_id = require_user_id(request)
+    topics = await asyncio.to_thread(event_topics, user_id)
+    if not topics:
+        raise HTTPException(status_code=404, detail="Salon not found or user is not a master")
+    if event_broker.subscriber_count() >= event_broker.max_subscribers:
+        raise HTTPException(status_code=503, detail="Too many live connections, try again later")
+    return StreamingResponse(
+        event_stream(topics, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # --- User Role Detection ---
-@app.get("/api/owner/appointments")
-async def owner_get_appointments(request: Request, master_id: Optional[str] = None, status: Optional[str] = None):
-    """Список всех записей салона с фильтрацией"""
+@app.get("/api/owner/appointments", response_model=AppointmentPageOut)
+def owner_get_appointments(
+    request: Request,
+    master_id: Optional[str] = None,
+    status: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    """Список записей салона с фильтрацией и пагинацией (date_to не включительно)"""
     owner_id = require_user_id(request)
-    salon = get_owner_salon(owner_id)
-    if not salon:
+    salon_id = get_owner_salon_id(owner_id)
+    if not salon_id:
         raise HTTPException(status_code=404, detail="Salon not found")
     
-    appointments = database.get_salon_appointments(salon["id"])
-    
-    # Фильтрация по мастеру
-    if master_id:
-        appointments = [apt for apt in appointments if apt.get("master_id") == master_id]
-    
-    # Фильтрация по статусу
-    if status:
-        appointments = [apt for apt in appointments if apt.get("status") == status]
-    
-    return {"items": appointments}
+    appointments = repo().get_salon_appointments(
+        salon_id,
+        date_from=date_from,
+        date_to=date_to,
+        master_id=master_id,
+        status=status,
+        limit=limit,
+        offset=offset,
+    )
+    result = {"items": appointments}
+    if limit is not None:
+        result["next_offset"] = offset + limit if len(appointments) == limit else None
+    return result
 
 
-@app.patch("/api/owner/appointments/{appointment_id}")
-async def owner_update_appointment(request: Request, appointment_id: str, payload: AppointmentUpdate):
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", encode_ndjson),
+    "csv": ("text/csv; charset=utf-8", encode_csv),
+}
+
+
+def export_chunks(batches, fmt: str):
+    """Байты выгрузки: по одному куску на порцию строк из БД"""
+    encode_batch = EXPORT_FORMATS[fmt][1]
+    if fmt == "csv":
+        yield (",".join(Appointment.COLUMNS) + "\n").encode("utf-8")
+    for rows in batches:
+        yield encode_batch(rows).encode("utf-8")
+
+
+@app.get(
+    "/api/owner/appointments/export",
+    response_class=StreamingResponse,
+    responses={200: {"content": {media_type: {} for media_type, _ in EXPORT_FORMATS.values()}}},
+)
+def owner_export_appointments(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    master_id: Optional[str] = None,
+    status: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    include_archive: bool = True,
+):
+    """Потоковая выгрузка записей салона в NDJSON или CSV (вместе с архивом)"""
+    owner_id = require_user_id(request)
+    salon_id = get_owner_salon_id(owner_id)
+    if not salon_id:
+        raise HTTPException(status_code=404, detail="Salon not found")
+
+    batches = repo().iter_salon_appointments(
+        salon_id,
+        date_from=date_from,
+        date_to=date_to,
+        master_id=master_id,
+        status=status,
+        include_archive=include_archive,
+    )
+    filename = f"appointments-{date.today().isoformat()}.{format}"
+    return StreamingResponse(
+        export_chunks(batches, format),
+        media_type=EXPORT_FORMATS[format][0],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.patch("/api/owner/appointments", response_model=AppointmentBatchOut)
+def owner_update_appointments(request: Request, payload: AppointmentBatchUpdate):
+    """Пакетное изменение статуса записей владельцем, например закрытие дня"""
+    owner_id = require_user_id(request)
+    salon_id = get_owner_salon_id(owner_id)
+    if not salon_id:
+        raise HTTPException(status_code=404, detail="Salon not found")
+
+    status = require_valid_status(payload.status)
+    return update_status_batch(payload.ids, status, lambda apt: apt.salon_id == salon_id)
+
+
+@app.patch("/api/owner/appointments/{appointment_id}", response_model=AppointmentOut)
+def owner_update_appointment(request: Request, appointment_id: str, payload: AppointmentUpdate):
     """Изменение статуса записи владельцем"""
     owner_id = require_user_id(request)
-    salon = get_owner_salon(owner_id)
-    if not salon:
+    salon_id = get_owner_salon_id(owner_id)
+    if not salon_id:
         raise HTTPException(status_code=404, detail="Salon not found")
     
     # Найти запись
-    appointment = database.get_appointment_by_id(appointment_id)
-    if not appointment or appointment.get("salon_id") != salon["id"]:
+    appointment = repo().get_appointment_by_id(appointment_id)
+    if not appointment or appointment.salon_id != salon_id:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
     # Валидация статуса
-    if not payload.status:
-        raise HTTPException(status_code=400, detail="Status is required")
-    
-    valid_statuses = ["pending", "confirmed", "cancelled", "completed"]
-    if payload.status not in valid_statuses:
-        raise HTTPException(status_code=400, detail=f"Invalid status. Allowed: {valid_statuses}")
+    require_valid_status(payload.status)
     
     # Обновление статуса
-    updated_appointment = database.update_appointment(appointment_id, payload.status)
+    updated_appointment = repo().update_appointment(appointment_id, payload.status)
+    publish_appointments([updated_appointment])
     return updated_appointment
 
 
-@app.get("/api/user/role")
-async def get_user_role_endpoint(request: Request, salon_id: Optional[str] = None):
+@app.get("/api/user/role", response_model=RoleOut)
+def get_user_role_endpoint(request: Request, salon_id: Optional[str] = None):
     """Определение роли пользователя"""
     user_id = require_user_id(request)
     role = get_user_role(user_id, salon_id)
     return {"role": role, "user_id": user_id, "salon_id": salon_id}
 
 
-@app.get("/health")
+@app.get("/api/bootstrap", response_model=BootstrapOut)
+def bootstrap(request: Request):
+    """Роль пользователя и всё, что нужно для первого экрана, одним ответом.
+
+    Заменяет цепочку role → salon → appointments при запуске мини-приложения;
+    все чтения идут через одно соединение и один снимок unit of work.
+    Роль определяется так же, как в /api/user/role, но владелец проверяется
+    по индексу, а не перебором салонов.
+    """
+    user_id = require_user_id(request)
+    owner_salon_id = get_owner_salon_id(user_id)
+    if owner_salon_id:
+        salon = get_salon_by_id(owner_salon_id, include={"masters", "services"})
+        return {
+            "role": "owner",
+            "user_id": user_id,
+            "salon": salon,
+            **appointments_window_payload(owner_salon_id),
+        }
+
+    salon = get_master_salon(user_id)
+    if salon:
+        master_ids = [m.id for m in salon.get("masters", []) if m.telegram_id == str(user_id)]
+        return {
+            "role": "master",
+            "user_id": user_id,
+            "salon": {
+                "id": salon["id"],
+                "name": salon["name"],
+                "masters": salon.get("masters", []),
+                "services": salon.get("services", []),
+            },
+            "appointments": repo().get_master_appointments(master_ids),
+        }
+
+    salons = repo().get_all_salons()
+    appointments = repo().get_client_appointments(str(user_id))
+    names = {s["id"]: s["name"] for s in salons}
+    catalogs = {
+        salon_id: {
+            "id": salon_id,
+            "name": names[salon_id],
+            "masters": catalog_masters(salon_id),
+            "services": catalog_services(salon_id),
+        }
+        for salon_id in dict.fromkeys(apt.salon_id for apt in appointments)
+        if salon_id in names
+    }
+    return {
+        "role": "client",
+        "user_id": user_id,
+        "salons": salons,
+        "appointments": appointments,
+        "catalogs": catalogs,
+    }
+
+
+# --- Delta sync ---
+def sync_scope(user_id: str) -> changes.Scope:
+    """Что видит пользователь: весь салон владельца, каталог и свои записи мастера, свои записи клиента"""
+    salon_id = get_owner_salon_id(user_id)
+    if salon_id:
+        return changes.Scope(salon_id=salon_id)
+    salon = get_master_salon(user_id)
+    if salon:
+        master_ids = tuple(m.id for m in salon.get("masters", []) if m.telegram_id == str(user_id))
+        return changes.Scope(catalog_salon_id=salon["id"], master_ids=master_ids)
+    return changes.Scope(client_id=str(user_id))
+
+
+@app.get("/api/sync", response_model=SyncOut)
+def sync(request: Request, since: Optional[int] = Query(None, ge=0), limit: int = Query(500, ge=1, le=1000)):
+    """Изменения после курсора ``since``: текущее состояние изменившихся сущностей и id удалённых.
+
+    Без ``since`` (или с курсором старше срока хранения журнала) приходит
+    ``reset``: клиент загружает данные целиком и дальше синхронизируется
+    с ``cursor``. ``has_more`` — изменений больше ``limit``, следующая
+    страница начинается с ``cursor``.
+    """
+    user_id = require_user_id(request)
+    page = repo().get_changes(sync_scope(user_id), since, limit)
+    page["schedules"] = [schedule_document(master_id, rules) for master_id, rules in page["schedules"].items()]
+    return page
+
+
+@app.post("/api/admin/backup", response_model=BackupOut)
+def admin_create_backup(request: Request):
+    """Горячая резервная копия БД (сжатый снимок с контрольной суммой)"""
+    require_admin(request)
+    if settings.storage_engine != "sqlite":
+        raise HTTPException(status_code=400, detail="Backups are only available for the sqlite engine")
+    return backup.create_backup(settings.backup_dir, keep=settings.backup_keep)
+
+
+@app.get("/health", response_model=HealthOut)
 async def health():
     now = datetime.now(timezone.utc).replace(microsecond=0)
     return {"status": "ok", "time": now.isoformat().replace("+00:00", "Z")}
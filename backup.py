@@ -0,0 +1,195 @@
+"""Online backups of salon.db without stopping the service.
+
+The snapshot is taken with the SQLite backup API in steps of a few hundred
+pages; the progress callback sleeps after every step that leaves pages to
+copy, so live requests keep getting the database in between. (The ``sleep``
+argument of ``Connection.backup`` itself only applies when a step hits
+SQLITE_BUSY or SQLITE_LOCKED.) SQLite restarts an incremental backup whenever another
+connection writes to the source; if that happens more than
+``max_restarts`` times, the copy falls back to a single step, which in WAL
+mode reads one consistent snapshot without blocking writers.
+
+Snapshots are gzip-compressed, get a ``.sha256`` sidecar and are rotated::
+
+    python backup.py create --dest backups --keep 7
+    python backup.py verify backups/salon-20260105-120000.db.gz
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import database
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PREFIX = "salon-"
+SNAPSHOT_SUFFIX = ".db.gz"
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def _copy_incremental(source: sqlite3.Connection, target: sqlite3.Connection,
+                      pages: int, sleep: float, max_restarts: int) -> Dict[str, int]:
+    stats = {"steps": 0, "restarts": 0}
+    last_remaining: Optional[int] = None
+
+    def progress(status: int, remaining: int, total: int) -> None:
+        nonlocal last_remaining
+        stats["steps"] += 1
+        if last_remaining is not None and remaining > last_remaining:
+            stats["restarts"] += 1
+            if stats["restarts"] > max_restarts:
+                raise _TooManyRestarts
+        last_remaining = remaining
+        # Пауза между шагами: sleep= у backup() срабатывает только на BUSY/LOCKED
+        if remaining and sleep > 0:
+            time.sleep(sleep)
+
+    source.backup(target, pages=pages, progress=progress)
+    return stats
+
+
+def snapshot(target_path: Path, pages: int = 256, sleep: float = 0.01,
+             max_restarts: int = 20) -> Dict[str, Any]:
+    """Copy the live database into ``target_path`` (uncompressed)."""
+    source = database.connect(str(database.DB_PATH))
+    try:
+        target = sqlite3.connect(str(target_path))
+        try:
+            stats = _copy_incremental(source, target, pages, sleep, max_restarts)
+            stats["fallback"] = False
+        except _TooManyRestarts:
+            target.close()
+            target_path.unlink()
+            target = sqlite3.connect(str(target_path))
+            source.backup(target)
+            stats = {"steps": 1, "restarts": max_restarts + 1, "fallback": True}
+        # Снимок — самостоятельный файл, без -wal рядом
+        target.execute("PRAGMA journal_mode = DELETE")
+        target.close()
+    finally:
+        source.close()
+    return stats
+
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def list_snapshots(dest: Path) -> List[Path]:
+    return sorted(dest.glob(f"{SNAPSHOT_PREFIX}*{SNAPSHOT_SUFFIX}"))
+
+
+def rotate(dest: Path, keep: int) -> List[str]:
+    """Delete all but the ``keep`` newest snapshots (and their checksums)."""
+    removed = []
+    snapshots = list_snapshots(dest)
+    for path in snapshots[:-keep] if keep > 0 else []:
+        path.unlink(missing_ok=True)
+        Path(f"{path}.sha256").unlink(missing_ok=True)
+        removed.append(path.name)
+    return removed
+
+
+def create_backup(dest: str | Path, keep: int = 7, pages: int = 256, sleep: float = 0.01,
+                  max_restarts: int = 20) -> Dict[str, Any]:
+    """Take a compressed, checksummed snapshot and apply the rotation policy."""
+    dest = Path(dest)
+    dest.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    archive_path = dest / f"{SNAPSHOT_PREFIX}{stamp}{SNAPSHOT_SUFFIX}"
+
+    with tempfile.TemporaryDirectory(dir=dest) as tmp:
+        raw_path = Path(tmp) / "snapshot.db"
+        stats = snapshot(raw_path, pages=pages, sleep=sleep, max_restarts=max_restarts)
+        raw_size = raw_path.stat().st_size
+        partial = archive_path.with_name(archive_path.name + ".part")
+        with raw_path.open("rb") as src, gzip.open(partial, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        partial.replace(archive_path)
+
+    checksum = sha256_file(archive_path)
+    Path(f"{archive_path}.sha256").write_text(f"{checksum}  {archive_path.name}\n", encoding="utf-8")
+    removed = rotate(dest, keep)
+
+    report = {
+        "path": str(archive_path),
+        "sha256": checksum,
+        "size_bytes": raw_size,
+        "compressed_bytes": archive_path.stat().st_size,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        "rotated": removed,
+        **stats,
+    }
+    logger.info("Backup %s written in %.0f ms (%s restarts)", archive_path.name,
+                report["duration_ms"], stats["restarts"])
+    return report
+
+
+def verify_backup(path: str | Path) -> Dict[str, Any]:
+    """Check the checksum sidecar and run ``PRAGMA integrity_check`` on the snapshot."""
+    path = Path(path)
+    expected = Path(f"{path}.sha256").read_text(encoding="utf-8").split()[0]
+    checksum_ok = sha256_file(path) == expected
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_path = Path(tmp) / "verify.db"
+        try:
+            with gzip.open(path, "rb") as src, raw_path.open("wb") as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            conn = sqlite3.connect(str(raw_path))
+            try:
+                integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            finally:
+                conn.close()
+        except (OSError, EOFError, sqlite3.DatabaseError) as exc:
+            integrity = f"unreadable: {exc}"
+    return {"path": str(path), "checksum_ok": checksum_ok, "integrity": integrity,
+            "ok": checksum_ok and integrity == "ok"}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from config import get_settings
+
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Online backup of the salon database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    create = subparsers.add_parser("create", help="take a snapshot of the live database")
+    create.add_argument("--dest", default=settings.backup_dir)
+    create.add_argument("--keep", type=int, default=settings.backup_keep)
+    create.add_argument("--pages", type=int, default=256, help="pages copied per step")
+    create.add_argument("--sleep", type=float, default=0.01, help="pause between steps, seconds")
+    verify = subparsers.add_parser("verify", help="check checksum and integrity of a snapshot")
+    verify.add_argument("path")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.command == "create":
+        report = create_backup(args.dest, keep=args.keep, pages=args.pages, sleep=args.sleep)
+    else:
+        report = verify_backup(args.path)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.command == "verify" and not report["ok"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
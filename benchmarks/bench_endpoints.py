@@ -0,0 +1,91 @@
+"""Latency of hot endpoints and the share spent encoding the response.
+
+    python benchmarks/bench_endpoints.py --appointments 10000 --repeat 20
+
+Runs against the in-memory engine through ``TestClient``. For every endpoint
+it reports the median request latency and, for the same payload, how long
+``jsonable_encoder`` + ``json.dumps`` (FastAPI's generic path) and
+``serialization.encode`` (the path the app uses) take to produce the bytes.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import repository  # noqa: E402
+
+repository.set_repository(repository.MemoryRepository())
+
+import backend  # noqa: E402
+from serialization import encode  # noqa: E402
+
+
+OWNER = {"X-User-Id": "bench-owner"}
+
+
+def _prepare(appointments: int) -> str:
+    repo = repository.get_repository()
+    salon = repo.create_salon("Bench", "bench-owner")
+    masters = [repo.create_master(salon["id"], f"Master {i}", f"tg-{i}") for i in range(20)]
+    services = [repo.create_service(salon["id"], f"Service {i}", 1000 + i, 60, "Описание") for i in range(50)]
+    start = datetime.now().replace(minute=0, second=0, microsecond=0)
+    for i in range(appointments):
+        when = (start + timedelta(hours=i % 2000)).isoformat()
+        repo.create_appointment(salon["id"], masters[i % 20].id, services[i % 50].id, f"client-{i % 700}", when)
+    return salon["id"]
+
+
+def _median_ms(fn, repeat: int) -> float:
+    fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def _generic(payload) -> bytes:
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--appointments", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)  # лог запросов искажает замеры
+    salon_id = _prepare(args.appointments)
+    repo = repository.get_repository()
+    client = TestClient(backend.app)
+    cases = [
+        ("GET /api/owner/appointments", "/api/owner/appointments", OWNER,
+         lambda: {"items": repo.get_salon_appointments(salon_id)}),
+        ("GET /api/owner/salon", "/api/owner/salon?fields=masters,services", OWNER,
+         lambda: repo.get_owner_salon("bench-owner", include={"masters", "services"})),
+        ("GET /api/client/.../services", f"/api/client/salons/{salon_id}/services", {},
+         lambda: {"items": repo.get_salon_services(salon_id)}),
+    ]
+    print(f"{'endpoint':<30} {'request':>10} {'generic enc':>12} {'fast enc':>10} {'bytes':>10}")
+    for name, url, headers, payload in cases:
+        request_ms = _median_ms(lambda: client.get(url, headers=headers), args.repeat)
+        data = payload()
+        generic_ms = _median_ms(lambda: _generic(data), args.repeat)
+        fast_ms = _median_ms(lambda: encode(data), args.repeat)
+        print(f"{name:<30} {request_ms:>8.2f}ms {generic_ms:>10.2f}ms {fast_ms:>8.2f}ms {len(encode(data)):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Insert throughput and index size of appointment keys: UUID4 vs UUIDv7 vs INTEGER.
+
+    python benchmarks/bench_ids.py --rows 1000000
+
+Each layout gets its own database with the production ``appointments``
+indexes and is filled in batches of ``--batch`` rows, one transaction per
+batch. ``uuid4`` is the old random TEXT key, ``uuid7`` is what ``ids.new_id``
+generates now, ``integer`` keeps a UUIDv7 public id in a UNIQUE column and
+joins on an ``INTEGER PRIMARY KEY`` (rowid). Sizes come from the ``dbstat``
+virtual table.
+
+``integer`` is the layout of the application schema since migration 5
+(there the parent columns are called ``salon_pk``, ``master_pk`` and
+``service_pk``); ``uuid7`` is the TEXT-keyed layout it replaced.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import ids  # noqa: E402
+
+
+LAYOUTS = {
+    "uuid4": """
+        CREATE TABLE appointments (
+            id TEXT PRIMARY KEY, salon_id TEXT NOT NULL, master_id TEXT NOT NULL,
+            service_id TEXT NOT NULL, client_id TEXT NOT NULL, datetime TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending'
+        )""",
+    "uuid7": """
+        CREATE TABLE appointments (
+            id TEXT PRIMARY KEY, salon_id TEXT NOT NULL, master_id TEXT NOT NULL,
+            service_id TEXT NOT NULL, client_id TEXT NOT NULL, datetime TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending'
+        )""",
+    "integer": """
+        CREATE TABLE appointments (
+            pk INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, salon_id INTEGER NOT NULL,
+            master_id INTEGER NOT NULL, service_id INTEGER NOT NULL, client_id TEXT NOT NULL,
+            datetime TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'pending'
+        )""",
+}
+
+INDEXES = [
+    "CREATE INDEX idx_appointments_master ON appointments(master_id)",
+    "CREATE INDEX idx_appointments_client ON appointments(client_id)",
+    "CREATE INDEX idx_appointments_salon_datetime ON appointments(salon_id, datetime)",
+]
+
+
+def _rows(layout: str, count: int, salons: list, masters: list, services: list):
+    make_id = (lambda: str(uuid.uuid4())) if layout == "uuid4" else ids.new_id
+    for i in range(count):
+        n = random.randrange(len(salons))
+        yield (
+            make_id(), salons[n], masters[n], services[n], f"client-{random.randrange(50000)}",
+            f"2030-{1 + i % 12:02d}-{1 + i % 28:02d}T{9 + i % 9:02d}:00:00",
+        )
+
+
+def run(layout: str, rows: int, batch: int, tmp: Path) -> dict:
+    path = tmp / f"bench_{layout}.db"
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(LAYOUTS[layout])
+    for statement in INDEXES:
+        conn.execute(statement)
+    conn.commit()
+
+    if layout == "integer":
+        salons = masters = services = list(range(1, 201))
+    else:
+        salons = [ids.new_id() for _ in range(200)]
+        masters = [ids.new_id() for _ in range(200)]
+        services = [ids.new_id() for _ in range(200)]
+
+    insert = (
+        "INSERT INTO appointments (id, salon_id, master_id, service_id, client_id, datetime) "
+        "VALUES (?, ?, ?, ?, ?, ?)"
+    )
+    source = _rows(layout, rows, salons, masters, services)
+    started = time.perf_counter()
+    done = 0
+    while done < rows:
+        chunk = [next(source) for _ in range(min(batch, rows - done))]
+        conn.executemany(insert, chunk)
+        conn.commit()
+        done += len(chunk)
+    elapsed = time.perf_counter() - started
+
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    sizes = dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"))
+    conn.close()
+    pk_index = "sqlite_autoindex_appointments_1"
+    return {
+        "layout": layout,
+        "rows_per_sec": round(rows / elapsed),
+        "seconds": round(elapsed, 2),
+        "table_mb": sizes.get("appointments", 0) / 2**20,
+        "id_index_mb": sizes.get(pk_index, 0) / 2**20,
+        "indexes_mb": sum(v for k, v in sizes.items() if k != "appointments" and k != "sqlite_schema") / 2**20,
+        "file_mb": path.stat().st_size / 2**20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=10_000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        for layout in LAYOUTS:
+            r = run(layout, args.rows, args.batch, Path(tmp))
+            print(
+                f"{r['layout']:<8} {r['rows_per_sec']:>8}/s ({r['seconds']:>6.2f}s)  "
+                f"table {r['table_mb']:7.1f} MB  id index {r['id_index_mb']:6.1f} MB  "
+                f"all indexes {r['indexes_mb']:7.1f} MB  file {r['file_mb']:7.1f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
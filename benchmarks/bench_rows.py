@@ -0,0 +1,100 @@
+"""Memory and time to load a large appointment list: ``dict(row)`` vs slotted records.
+
+    python benchmarks/bench_rows.py --rows 100000
+
+Both modes read the same appointments with the same query. ``dict`` is the
+previous path (``sqlite3.Row`` converted with ``dict(row)``), ``record`` uses
+``records.row_factory(Appointment)``. Memory is measured with ``tracemalloc``:
+``retained`` is what the resulting list keeps alive, ``peak`` the high-water
+mark while loading it.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database  # noqa: E402
+from records import Appointment, row_factory  # noqa: E402
+
+
+def _prepare(tmp: Path, rows: int) -> str:
+    database.configure(f"sqlite:///{tmp / 'bench_rows.db'}")
+    database.init_db(seed=False)
+    salon = database.create_salon("Bench", "owner")
+    master = database.create_master(salon["id"], "Anna")
+    service = database.create_service(salon["id"], "Cut")
+
+    def bulk_insert(conn):
+        conn.executemany(
+            database.APPOINTMENT_INSERT,
+            [(f"a{i:08d}", salon["id"], master.id, service.id, f"client-{i % 5000}",
+              f"2030-01-{1 + i % 28:02d}T{9 + i % 9:02d}:00:00", "pending") for i in range(rows)],
+        )
+
+    database.submit_write(bulk_insert).result()
+    return salon["id"]
+
+
+def _load(mode: str, salon_id: str) -> list:
+    conn = database.connect(str(database.DB_PATH))
+    query = f"SELECT {database.APPOINTMENT_COLUMNS} FROM appointments_view WHERE salon_id = ? ORDER BY datetime, id"
+    try:
+        if mode == "dict":
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute(query, (salon_id,)).fetchall()]
+        cursor = conn.cursor()
+        cursor.row_factory = row_factory(Appointment)
+        return cursor.execute(query, (salon_id,)).fetchall()
+    finally:
+        conn.close()
+
+
+def run(mode: str, salon_id: str) -> dict:
+    _load(mode, salon_id)  # прогрев кеша страниц SQLite
+    gc.collect()
+    started = time.perf_counter()
+    rows = _load(mode, salon_id)
+    elapsed = time.perf_counter() - started
+    del rows
+
+    gc.collect()
+    tracemalloc.start()
+    rows = _load(mode, salon_id)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "mode": mode,
+        "rows": len(rows),
+        "ms": round(elapsed * 1000, 1),
+        "retained_mb": retained / 2**20,
+        "peak_mb": peak / 2**20,
+        "bytes_per_row": retained / len(rows),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        salon_id = _prepare(Path(tmp), args.rows)
+        for mode in ("dict", "record"):
+            r = run(mode, salon_id)
+            print(
+                f"{r['mode']:<7} {r['rows']:>8} rows  load {r['ms']:>8.1f} ms  "
+                f"retained {r['retained_mb']:7.1f} MB ({r['bytes_per_row']:5.0f} B/row)  "
+                f"peak {r['peak_mb']:7.1f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
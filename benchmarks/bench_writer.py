@@ -0,0 +1,101 @@
+"""Throughput of bursts of ``create_appointment``: direct connections vs writer queue.
+
+    python benchmarks/bench_writer.py --threads 16 --per-thread 200
+
+Each thread books appointments as fast as it can. In ``direct`` mode every
+call opens its own connection and commits on its own (the default path);
+in ``queue`` mode the calls are funnelled through ``database.start_writer()``
+and group-committed.
+"""
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database  # noqa: E402
+
+
+def _prepare(tmp: Path, mode: str):
+    database.configure(f"sqlite:///{tmp / f'bench_{mode}.db'}")
+    database.init_db(seed=False)
+    salon = database.create_salon("Bench", f"owner-{mode}")
+    master = database.create_master(salon["id"], "Anna")
+    service = database.create_service(salon["id"], "Cut")
+    return salon["id"], master["id"], service["id"]
+
+
+def run(mode: str, threads: int, per_thread: int, tmp: Path) -> dict:
+    salon_id, master_id, service_id = _prepare(tmp, mode)
+    writer = database.start_writer() if mode == "queue" else None
+    errors = 0
+    errors_lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(n: int):
+        nonlocal errors
+        barrier.wait()
+        futures = []
+        for i in range(per_thread):
+            args = (salon_id, master_id, service_id, f"client-{n}", f"2030-01-01T10:{i % 60:02d}:00")
+            try:
+                if writer:
+                    futures.append(database.submit_create_appointment(*args))
+                else:
+                    database.create_appointment(*args)
+            except sqlite3.OperationalError:
+                with errors_lock:
+                    errors += 1
+        for future in futures:
+            try:
+                future.result()
+            except sqlite3.OperationalError:
+                with errors_lock:
+                    errors += 1
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    stats = writer.stats if writer else None
+    database.stop_writer()
+    total = threads * per_thread
+    return {
+        "mode": mode,
+        "writes": total,
+        "seconds": round(elapsed, 3),
+        "writes_per_sec": round(total / elapsed, 1),
+        "errors": errors,
+        "transactions": stats.transactions if stats else total,
+        "largest_batch": stats.largest_batch if stats else 1,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--per-thread", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("direct", "queue"):
+            result = run(mode, args.threads, args.per_thread, Path(tmp))
+            print(
+                f"{result['mode']:<7} {result['writes']:>6} writes in {result['seconds']:>7.3f}s "
+                f"→ {result['writes_per_sec']:>9.1f}/s, transactions={result['transactions']}, "
+                f"largest batch={result['largest_batch']}, lock errors={result['errors']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Bulk import of a salon catalog (masters and services).
+
+The import is planned as a whole before anything is written: every row is
+checked against the rows already in the salon and against the other rows of
+the same import, and only if no row has an error do the engines apply the
+plan — inserts and updates per table with ``executemany`` in the transaction
+of the request.
+
+Rows are matched to existing ones by ``upsert`` key:
+
+* ``None`` — every row creates a new master/service;
+* ``"name"`` — a row updates the first existing row with the same name;
+* ``"external_id"`` — a row updates the row with the same ``external_id``
+  (the id of the item in the chain's own system) and must carry one.
+
+On update, fields missing from the row (``None``) keep their stored value.
+"""
+from __future__ import annotations
+
+import csv
+import io
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ids import new_id
+
+
+KINDS = ("masters", "services")
+FIELDS = {
+    "masters": ("name", "telegram_id", "external_id"),
+    "services": ("name", "price", "duration", "description", "external_id"),
+}
+UPSERT_KEYS = ("name", "external_id")
+MAX_ROWS = 5000
+
+# Значения колонки kind в CSV
+_CSV_KINDS = {"master": "masters", "masters": "masters", "service": "services", "services": "services"}
+
+
+class ImportFormatError(ValueError):
+    """The import body cannot be parsed into catalog rows."""
+
+
+def parse_csv(text: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Split a CSV with a ``kind`` column (master/service) into row dicts.
+
+    Empty cells are dropped, so they mean "not set" just like a missing JSON key.
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or "kind" not in reader.fieldnames:
+        raise ImportFormatError("CSV header must contain a 'kind' column")
+    catalog: Dict[str, List[Dict[str, Any]]] = {kind: [] for kind in KINDS}
+    for line, record in enumerate(reader, start=2):
+        kind = _CSV_KINDS.get((record.pop("kind") or "").strip().lower())
+        if kind is None:
+            raise ImportFormatError(f"line {line}: kind must be 'master' or 'service'")
+        catalog[kind].append({key: value for key, value in record.items() if key and value not in (None, "")})
+    return catalog
+
+
+def plan(kind: str, rows: List[Dict[str, Any]], existing: Iterable[Tuple[str, str, Optional[str]]],
+         upsert: Optional[str]) -> Tuple[List[Dict[str, Any]], List[tuple], List[tuple]]:
+    """Decide what every row of one kind does.
+
+    ``existing`` yields ``(id, name, external_id)`` of the salon's current
+    rows. Returns per-row results and the ``(id, *FIELDS)`` parameter tuples
+    for inserts and updates.
+    """
+    by_key: Dict[str, str] = {}
+    by_external_id: Dict[str, str] = {}
+    for row_id, name, external_id in existing:
+        if external_id:
+            by_external_id[external_id] = row_id
+        key_value = name if upsert == "name" else external_id
+        if upsert and key_value:
+            by_key.setdefault(key_value, row_id)
+
+    fields = FIELDS[kind]
+    results: List[Dict[str, Any]] = []
+    inserts: List[tuple] = []
+    updates: List[tuple] = []
+    seen_keys: Dict[str, int] = {}
+    seen_external_ids: Dict[str, int] = {}
+    for number, row in enumerate(rows):
+        external_id = row.get("external_id")
+        result: Dict[str, Any] = {"row": number, "external_id": external_id}
+        results.append(result)
+
+        key_value = row.get(upsert) if upsert else None
+        if upsert == "external_id" and not external_id:
+            result.update(status="error", error="external_id is required to upsert by external_id")
+            continue
+        if key_value is not None and key_value in seen_keys:
+            result.update(status="error", error=f"duplicate {upsert} (same as row {seen_keys[key_value]})")
+            continue
+        if external_id and external_id in seen_external_ids:
+            result.update(status="error",
+                          error=f"duplicate external_id (same as row {seen_external_ids[external_id]})")
+            continue
+        if key_value is not None:
+            seen_keys[key_value] = number
+        if external_id:
+            seen_external_ids[external_id] = number
+
+        target = by_key.get(key_value) if key_value is not None else None
+        owner = by_external_id.get(external_id) if external_id else None
+        if owner is not None and owner != target:
+            result.update(status="error", error=f"external_id is already used by another {kind[:-1]}")
+            continue
+
+        params = tuple(row.get(field) for field in fields)
+        if target is None:
+            row_id = new_id()
+            inserts.append((row_id, *params))
+            result.update(status="created", id=row_id)
+        else:
+            updates.append((target, *params))
+            result.update(status="updated", id=target)
+    return results, inserts, updates
+
+
+def summary(results: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Counters plus the per-row results of both kinds."""
+    statuses = [result["status"] for kind in KINDS for result in results[kind]]
+    return {
+        "created": statuses.count("created"),
+        "updated": statuses.count("updated"),
+        "errors": statuses.count("error"),
+        **results,
+    }
@@ -0,0 +1,102 @@
+"""Change log behind delta sync (``GET /api/sync``).
+
+Every write appends one entry per touched entity, in the same transaction
+as the write itself: ``(seq, entity, entity_id)`` plus the salon, master
+and client the entity belongs to, which decide who may see it. ``seq`` only
+grows and serves as the sync cursor.
+
+A sync reads the entries after the caller's cursor, keeps the latest one
+per entity and returns the current state of those entities. An entity that
+no longer exists is listed under ``deleted``. Entries are never updated, so
+compaction can drop any entry that a later entry for the same entity
+supersedes without changing a single answer. Entries older than the
+retention period are dropped too. Their highest ``seq`` becomes the
+horizon: a cursor below it (or one the store has never issued) gets
+``reset``, and the caller reloads everything and continues from the
+returned cursor.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+
+# Сущность в журнале -> ключ ответа
+ENTITIES = {
+    "salon": "salons",
+    "master": "masters",
+    "service": "services",
+    "schedule": "schedules",
+    "appointment": "appointments",
+}
+CATALOG_ENTITIES = frozenset({"salon", "master", "service"})
+
+
+class Change(NamedTuple):
+    seq: int
+    entity: str
+    entity_id: str
+    salon_id: str
+    master_id: Optional[str]
+    client_id: Optional[str]
+    changed_at: str
+
+
+@dataclass(frozen=True)
+class Scope:
+    """Whose changes a sync returns; an entry matching any field is included."""
+
+    salon_id: Optional[str] = None  # всё в салоне (владелец)
+    catalog_salon_id: Optional[str] = None  # салон, мастера и услуги (мастер)
+    master_ids: Tuple[str, ...] = ()  # записи и расписания этих мастеров
+    client_id: Optional[str] = None  # записи клиента
+
+    def matches(self, change: Change) -> bool:
+        return (
+            change.salon_id == self.salon_id
+            or (change.salon_id == self.catalog_salon_id and change.entity in CATALOG_ENTITIES)
+            or (change.master_id is not None and change.master_id in self.master_ids)
+            or (change.client_id is not None and change.client_id == self.client_id)
+        )
+
+
+def result(cursor: int, reset: bool = False, has_more: bool = False) -> Dict[str, Any]:
+    """An empty sync answer; the engines fill in the changed entities."""
+    page: Dict[str, Any] = {"cursor": cursor, "reset": reset, "has_more": has_more}
+    for key in ENTITIES.values():
+        page[key] = {} if key == "schedules" else []
+    page["deleted"] = {key: [] for key in ENTITIES.values()}
+    return page
+
+
+def needs_reset(since: Optional[int], horizon: int, last: int) -> bool:
+    """The cursor is missing, compacted away, or was never issued by this store."""
+    return since is None or since < horizon or since > last
+
+
+def paginate(latest: Sequence[Tuple[str, str, int]], since: int,
+             limit: int) -> Tuple[Dict[str, Any], Dict[str, List[str]]]:
+    """Split ``(entity, entity_id, seq)`` rows ordered by ``seq`` into one page.
+
+    ``latest`` holds at most ``limit + 1`` rows, one per entity. The cursor
+    is the last ``seq`` on the page: an entity that changed again after it
+    shows up on the next page.
+    """
+    rows = latest[:limit]
+    page = result(rows[-1][2] if rows else since, has_more=len(latest) > limit)
+    ids: Dict[str, List[str]] = {entity: [] for entity in ENTITIES}
+    for entity, entity_id, _ in rows:
+        ids[entity].append(entity_id)
+    return page, ids
+
+
+def fill(page: Dict[str, Any], entity: str, ids: Iterable[str], found: Dict[str, Any]) -> None:
+    """Put the current state of ``ids`` into ``page``; ids missing from ``found`` were deleted."""
+    key = ENTITIES[entity]
+    for entity_id in ids:
+        if entity_id not in found:
+            page["deleted"][key].append(entity_id)
+        elif key == "schedules":
+            page[key][entity_id] = found[entity_id]
+        else:
+            page[key].append(found[entity_id])
@@ -22,9 +22,28 @@ class Settings:
     bot_token: str | None
     web_app_url: str
     database_url: str
+    storage_engine: str
+    sqlite_busy_timeout_ms: int
+    sqlite_writer_queue: bool
+    owner_salon_window_days: int
+    archive_retention_days: int
+    archive_interval_seconds: int
+    archive_batch_size: int
+    changes_retention_days: int
+    db_maintenance_interval_seconds: int
+    db_integrity_interval_seconds: int
+    events_heartbeat_seconds: float
+    events_queue_size: int
+    events_history: int
+    events_max_subscribers: int
+    backup_dir: str
+    backup_keep: int
+    admin_ids: frozenset[str]
     host: str
     port: int
     debug: bool
+    traffic_capture_path: str | None
+    traffic_capture_salt: str
 
 
 @lru_cache(maxsize=1)
@@ -33,9 +52,28 @@ def get_settings() -> Settings:
         bot_token=os.getenv("BOT_TOKEN"),
         web_app_url=os.getenv("WEB_APP_URL", "http://localhost:8000"),
         database_url=os.getenv("DATABASE_URL", "sqlite:///./salon.db"),
+        storage_engine=os.getenv("STORAGE_ENGINE", "sqlite").strip().lower(),
+        sqlite_busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+        sqlite_writer_queue=_to_bool(os.getenv("SQLITE_WRITER_QUEUE"), default=False),
+        owner_salon_window_days=int(os.getenv("OWNER_SALON_WINDOW_DAYS", "14")),
+        archive_retention_days=int(os.getenv("ARCHIVE_RETENTION_DAYS", "180")),
+        archive_interval_seconds=int(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600")),
+        archive_batch_size=int(os.getenv("ARCHIVE_BATCH_SIZE", "500")),
+        changes_retention_days=int(os.getenv("CHANGES_RETENTION_DAYS", "30")),
+        db_maintenance_interval_seconds=int(os.getenv("DB_MAINTENANCE_INTERVAL_SECONDS", "900")),
+        db_integrity_interval_seconds=int(os.getenv("DB_INTEGRITY_INTERVAL_SECONDS", "86400")),
+        events_heartbeat_seconds=float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15")),
+        events_queue_size=int(os.getenv("EVENTS_QUEUE_SIZE", "100")),
+        events_history=int(os.getenv("EVENTS_HISTORY", "1000")),
+        events_max_subscribers=int(os.getenv("EVENTS_MAX_SUBSCRIBERS", "1000")),
+        backup_dir=os.getenv("BACKUP_DIR", "./backups"),
+        backup_keep=int(os.getenv("BACKUP_KEEP", "7")),
+        admin_ids=frozenset(x.strip() for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()),
         host=os.getenv("HOST", "127.0.0.1"),
         port=int(os.getenv("PORT", "8000")),
         debug=_to_bool(os.getenv("APP_DEBUG"), default=False),
+        traffic_capture_path=os.getenv("TRAFFIC_CAPTURE_PATH") or None,
+        traffic_capture_salt=os.getenv("TRAFFIC_CAPTURE_SALT", "salon-traffic"),
     )
 
 
@@ -0,0 +1,135 @@
+"""Общие фикстуры pytest: у каждого теста своя база данных.
+
+Схема создаётся один раз на процесс (на воркер при ``pytest -n auto``) в
+шаблонном файле, который затем копируется для каждого теста. С
+``STORAGE_ENGINE=memory`` API работает на свежем in-memory движке.
+
+Здесь же общие данные API-тестов: ``client``, заголовки владельца ``owner``
+и его салон ``salon`` с фабриками ``add_master``/``add_service``.
+"""
+from __future__ import annotations
+
+import shutil
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+import repository
+from backend import app
+from config import get_settings
+
+OWNER_ID = "12345"
+MASTER_TELEGRAM_ID = "99999"
+
+
+def pytest_addoption(parser):
+    parser.addoption("--run-slow", action="store_true", help="запустить и медленные тесты (@pytest.mark.slow)")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: долгий нагрузочный тест, запускается с --run-slow")
+
+
+def pytest_collection_modifyitems(config, items):
+    """Медленные тесты по умолчанию пропускаются."""
+    if config.getoption("--run-slow"):
+        return
+    skip = pytest.mark.skip(reason="медленный тест: запустите pytest --run-slow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def template_db(tmp_path_factory):
+    """Пустая БД со схемой, собранная один раз на воркер."""
+    path = tmp_path_factory.mktemp("template") / "salon.db"
+    previous = database.DB_PATH
+    database.configure(f"sqlite:///{path}")
+    database.init_db(seed=False)
+    database.DB_PATH = previous
+    return path
+
+
+@pytest.fixture(autouse=True)
+def isolated_db(template_db, tmp_path):
+    """Изолированное хранилище для каждого теста.
+
+    Файл SQLite копируется всегда, чтобы прямые вызовы ``database`` не
+    попадали в рабочую БД даже при ``STORAGE_ENGINE=memory``.
+    """
+    previous_path = database.DB_PATH
+    path = tmp_path / "salon.db"
+    shutil.copyfile(template_db, path)
+    database.configure(f"sqlite:///{path}")
+    if get_settings().storage_engine == "memory":
+        repo = repository.MemoryRepository()
+    else:
+        repo = repository.SQLiteRepository()
+    repository.set_repository(repo)
+    yield repo
+    repository.set_repository(None)
+    database.DB_PATH = previous_path
+
+
+@pytest.fixture
+def sqlite_repository(isolated_db):
+    """API поверх SQLite независимо от STORAGE_ENGINE (тесты SQLite-специфики)."""
+    repo = repository.SQLiteRepository()
+    repository.set_repository(repo)
+    return repo
+
+
+@pytest.fixture(scope="session")
+def client():
+    """HTTP-клиент приложения"""
+    return TestClient(app)
+
+
+@pytest.fixture
+def owner():
+    """Заголовки владельца салона из фикстуры ``salon``"""
+    return {"X-User-Id": OWNER_ID}
+
+
+@pytest.fixture
+def salon(client, owner):
+    """Салон владельца OWNER_ID в чистой БД теста"""
+    response = client.post("/api/owner/salon", json={"name": "Test Salon"}, headers=owner)
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.fixture
+def add_master(client, owner, salon):
+    """Фабрика мастеров салона: ``add_master(name, telegram_id=None)``"""
+    def add(name="Master 1", telegram_id=None):
+        response = client.post("/api/owner/masters", json={"name": name, "telegram_id": telegram_id}, headers=owner)
+        assert response.status_code == 200
+        return response.json()
+    return add
+
+
+@pytest.fixture
+def master(add_master):
+    """Мастер с telegram_id в салоне владельца"""
+    return add_master("Master 1", MASTER_TELEGRAM_ID)
+
+
+@pytest.fixture
+def add_service(client, owner, salon):
+    """Фабрика услуг салона: ``add_service(name, price, duration, description)``"""
+    def add(name="Cut", price=1000, duration=60, description=None):
+        response = client.post("/api/owner/services", headers=owner, json={
+            "name": name, "price": price, "duration": duration, "description": description,
+        })
+        assert response.status_code == 200
+        return response.json()
+    return add
+
+
+@pytest.fixture
+def service(add_service):
+    """Часовая услуга салона владельца"""
+    return add_service()
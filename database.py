@@ -1,14 +1,25 @@
 """Работа с базой данных SQLite."""
 from __future__ import annotations
 
+import json
 import logging
 import sqlite3
-import uuid
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type
 
+import availability
+import catalog_import
+import changes
 from config import get_settings
+from db_writer import SQLiteWriter
+from ids import new_id
+from records import Appointment, Master, Record, Salon, Service, row_factory, select_columns
 
 
 settings = get_settings()
@@ -29,22 +40,345 @@ def _resolve_db_path(database_url: str) -> Path:
 DB_PATH = _resolve_db_path(settings.database_url)
 
 
-def get_db_connection():
-    """Получить соединение с БД"""
-    conn = sqlite3.connect(str(DB_PATH))
+def configure(database_url: str) -> Path:
+    """Переключить модуль на другой файл БД (тесты, бенчмарки)."""
+    global DB_PATH
+    DB_PATH = _resolve_db_path(database_url)
+    return DB_PATH
+
+
+def connect(db_path: str, check_same_thread: bool = True) -> sqlite3.Connection:
+    """Открыть соединение с настроенным busy_timeout и включёнными внешними ключами."""
+    conn = sqlite3.connect(
+        db_path,
+        timeout=settings.sqlite_busy_timeout_ms / 1000,
+        check_same_thread=check_same_thread,
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {int(settings.sqlite_busy_timeout_ms)}")
+    # По умолчанию SQLite не проверяет FOREIGN KEY и не выполняет ON DELETE CASCADE
+    conn.execute("PRAGMA foreign_keys = ON")
     return conn
 
 
+def _select(conn, cls: Type[Record], query: str, params: Iterable[Any] = ()) -> sqlite3.Cursor:
+    """Выполнить SELECT, строки которого сразу собираются в записи ``cls``."""
+    cursor = conn.cursor()
+    cursor.row_factory = row_factory(cls)
+    return cursor.execute(query, tuple(params))
+
+
+def get_db_connection():
+    """Получить соединение с БД (общее, если активен unit of work)"""
+    uow = _current_uow.get()
+    if uow is not None:
+        return uow.connection()
+    return connect(str(DB_PATH))
+
+
+class _ScopedConnection:
+    """Соединение unit of work: close/commit внутри функций модуля игнорируются."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+    def commit(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class _RolledBack(Exception):
+    """Unit of work откатился: писатель отменяет его SAVEPOINT."""
+
+
+class _Lease:
+    """Соединение писателя, одолженное unit of work на время одной операции очереди.
+
+    ``hold`` выполняется в потоке писателя внутри SAVEPOINT пакета и ждёт,
+    пока обработчик запроса закончит работу с соединением.
+    """
+
+    def __init__(self):
+        self.conn: Optional[sqlite3.Connection] = None
+        self._ready = threading.Event()
+        self._done = threading.Event()
+        self._ok = False
+
+    def hold(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+        self._ready.set()
+        self._done.wait()
+        if not self._ok:
+            raise _RolledBack()
+
+    def acquire(self, future: Future) -> sqlite3.Connection:
+        while not self._ready.wait(0.05):
+            if future.done():
+                future.result()  # писатель остановлен или пакет не начался
+                raise RuntimeError("SQLite writer finished without lending its connection")
+        return self.conn
+
+    def release(self, ok: bool) -> None:
+        self._ok = ok
+        self._done.set()
+
+
+class UnitOfWork:
+    """Одно соединение и одна транзакция на весь запрос.
+
+    Соединение открывается лениво при первом обращении к БД. Для изменяющих
+    запросов транзакция стартует как ``BEGIN IMMEDIATE`` — блокировка записи
+    берётся сразу, и чтение-изменение-запись видит согласованные данные; для
+    чтения достаточно ``BEGIN`` (один снимок WAL на весь запрос).
+
+    Если запущен писатель (SQLITE_WRITER_QUEUE), изменяющий unit of work
+    не открывает своё соединение: он занимает соединение писателя в одном
+    SAVEPOINT его пакета, и фиксация идёт групповым COMMIT вместе с
+    соседними записями. ``submit_commit`` отдаёт транзакцию на фиксацию, не
+    блокируя поток; ``commit`` дожидается её.
+    """
+
+    def __init__(self, write: bool = False):
+        self.write = write
+        self._conn: Optional[sqlite3.Connection] = None
+        self._scoped: Optional[_ScopedConnection] = None
+        self._after_commit: List[Callable[[], None]] = []
+        self._lease: Optional[_Lease] = None
+        self._committed: Optional[Future] = None
+
+    def connection(self) -> _ScopedConnection:
+        if self._scoped is None:
+            writer = _writer
+            if self.write and writer is not None and writer.running:
+                self._lease = _Lease()
+                self._committed = writer.submit(self._lease.hold)
+                self._scoped = _ScopedConnection(self._lease.acquire(self._committed))
+                return self._scoped
+            # Обработчик работает в пуле потоков, а фиксация — в цикле событий
+            conn = connect(str(DB_PATH), check_same_thread=False)
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE" if self.write else "BEGIN")
+            self._conn = conn
+            self._scoped = _ScopedConnection(conn)
+        return self._scoped
+
+    def submit_commit(self) -> Optional[Future]:
+        """Вернуть соединение писателю; future завершится после группового COMMIT.
+
+        ``None`` — транзакция своя, фиксировать её будет ``commit``.
+        """
+        if self._lease is not None:
+            self._lease.release(ok=True)
+        return self._committed
+
+    def commit(self) -> None:
+        committed = self.submit_commit()
+        if committed is not None:
+            committed.result()
+        elif self._conn is not None and self._conn.in_transaction:
+            self._conn.execute("COMMIT")
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            callback()
+
+    def rollback(self) -> None:
+        self._after_commit = []
+        if self._lease is not None:
+            self._lease.release(ok=False)
+        elif self._conn is not None and self._conn.in_transaction:
+            self._conn.execute("ROLLBACK")
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = None
+        self._scoped = None
+        self._lease = None
+
+
+_current_uow: ContextVar[Optional[UnitOfWork]] = ContextVar("database_unit_of_work", default=None)
+
+
+@contextmanager
+def unit_of_work(write: bool = False) -> Iterator[UnitOfWork]:
+    """Все вызовы модуля внутри блока используют одно соединение и транзакцию.
+
+    Вложенный вызов переиспользует внешний unit of work.
+    """
+    current = _current_uow.get()
+    if current is not None:
+        yield current
+        return
+    uow = UnitOfWork(write)
+    token = _current_uow.set(uow)
+    try:
+        yield uow
+        uow.commit()
+    except BaseException:
+        uow.rollback()
+        raise
+    finally:
+        _current_uow.reset(token)
+        uow.close()
+
+
+def after_commit(callback: Callable[[], None]) -> None:
+    """Вызвать ``callback`` после фиксации текущего unit of work (без него — сразу).
+
+    При откате вызова не будет; так сбрасываются кеши, которые не должны
+    увидеть незафиксированные данные.
+    """
+    uow = _current_uow.get()
+    if uow is None:
+        callback()
+    else:
+        uow._after_commit.append(callback)
+
+
+def in_snapshot() -> bool:
+    """Текущий unit of work уже читает из своего снимка (соединение открыто)."""
+    uow = _current_uow.get()
+    return uow is not None and uow._scoped is not None
+
+
+# Очередь единственного писателя (SQLITE_WRITER_QUEUE)
+_writer: Optional[SQLiteWriter] = None
+
+
+def start_writer(max_batch: int = 64, max_delay: float = 0.002) -> SQLiteWriter:
+    """Запустить поток-писатель: все записи пойдут через одно соединение."""
+    global _writer
+    if _writer is None or not _writer.running:
+        # Соединение писателя одалживается обработчикам запросов из пула потоков
+        _writer = SQLiteWriter(
+            DB_PATH, lambda path: connect(path, check_same_thread=False), max_batch=max_batch, max_delay=max_delay
+        ).start()
+    return _writer
+
+
+def stop_writer() -> None:
+    """Дописать очередь и остановить поток-писатель."""
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+
+def submit_write(op: Callable[..., Any], *args: Any) -> Future:
+    """Поставить операцию ``op(conn, *args)`` в очередь, вернуть future.
+
+    Без запущенного писателя операция выполняется сразу в отдельной
+    транзакции, а future возвращается уже завершённым.
+    """
+    writer = _writer
+    if writer is not None and writer.running and _current_uow.get() is None:
+        return writer.submit(op, *args)
+    future: Future = Future()
+    try:
+        future.set_result(_execute_write(op, *args))
+    except Exception as exc:  # noqa: BLE001
+        future.set_exception(exc)
+    return future
+
+
+def _execute_write(op: Callable[..., Any], *args: Any) -> Any:
+    conn = get_db_connection()
+    try:
+        result = op(conn, *args)
+        conn.commit()
+        return result
+    finally:
+        conn.close()
+
+
+def _write(op: Callable[..., Any], *args: Any) -> Any:
+    """Выполнить операцию записи синхронно.
+
+    Внутри unit of work запись идёт в его транзакцию (которую при запущенном
+    писателе и так фиксирует писатель), иначе — через писателя, если он запущен.
+    """
+    writer = _writer
+    if writer is not None and writer.running and _current_uow.get() is None:
+        return writer.submit(op, *args).result()
+    return _execute_write(op, *args)
+
+
+_APPOINTMENTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        pk INTEGER PRIMARY KEY,
+        id TEXT NOT NULL UNIQUE,
+        salon_pk INTEGER NOT NULL,
+        master_pk INTEGER NOT NULL,
+        service_pk INTEGER NOT NULL,
+        client_id TEXT NOT NULL,
+        datetime TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        FOREIGN KEY (salon_pk) REFERENCES salons(pk) ON DELETE CASCADE,
+        FOREIGN KEY (master_pk) REFERENCES masters(pk) ON DELETE CASCADE,
+        FOREIGN KEY (service_pk) REFERENCES services(pk) ON DELETE CASCADE
+    )
+"""
+
+
+def _legacy_key_tables(conn: sqlite3.Connection) -> List[str]:
+    """Таблицы, ещё не перестроенные на INTEGER-ключи (миграция 5), в порядке перестройки"""
+    key_columns = {"salons": "pk", "masters": "pk", "services": "pk", "appointments": "salon_pk"}
+    return [
+        table for table, column in key_columns.items()
+        if column not in {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    ]
+
+
+def _has_integer_keys(conn: sqlite3.Connection) -> bool:
+    return not _legacy_key_tables(conn)
+
+
+def _create_keyed_indexes(conn: sqlite3.Connection) -> None:
+    """Индексы салонов, каталога и записей и представление appointments_view"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_salons_owner ON salons(owner_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_masters_salon ON masters(salon_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_masters_telegram ON masters(telegram_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_services_salon ON services(salon_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_salon ON appointments(salon_pk)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_master ON appointments(master_pk)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_client ON appointments(client_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_datetime ON appointments(datetime)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_appointments_master_datetime ON appointments(master_pk, datetime)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_appointments_salon_datetime ON appointments(salon_pk, datetime)"
+    )
+    # Записи с внешними id салона, мастера и услуги — в том же виде, что и в архиве
+    conn.execute("""
+        CREATE VIEW IF NOT EXISTS appointments_view AS
+        SELECT a.id, s.id AS salon_id, m.id AS master_id, v.id AS service_id,
+               a.client_id, a.datetime, a.status
+        FROM appointments a
+        JOIN salons s ON s.pk = a.salon_pk
+        JOIN masters m ON m.pk = a.master_pk
+        JOIN services v ON v.pk = a.service_pk
+    """)
+
+
 def init_db(seed: bool = True):
     """Инициализация БД - создание таблиц и тестовых данных."""
     conn = get_db_connection()
+    # Для новой БД вступает в силу сразу, для существующей — миграцией 1
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("PRAGMA journal_mode = WAL")
     cursor = conn.cursor()
     
     # Таблица салонов
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS salons (
-            id TEXT PRIMARY KEY,
+            pk INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
             name TEXT NOT NULL,
             owner_id TEXT NOT NULL
         )
@@ -53,7 +387,8 @@ def init_db(seed: bool = True):
     # Таблица мастеров
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS masters (
-            id TEXT PRIMARY KEY,
+            pk INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
             salon_id TEXT NOT NULL,
             name TEXT NOT NULL,
             telegram_id TEXT,
@@ -64,7 +399,8 @@ def init_db(seed: bool = True):
     # Таблица услуг
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS services (
-            id TEXT PRIMARY KEY,
+            pk INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
             salon_id TEXT NOT NULL,
             name TEXT NOT NULL,
             price REAL,
@@ -74,32 +410,84 @@ def init_db(seed: bool = True):
         )
     """)
     
-    # Таблица записей
+    # Таблица записей: салон, мастер и услуга — по INTEGER-ключу (pk), наружу
+    # отдаются их UUID через представление appointments_view
+    cursor.execute(_APPOINTMENTS_TABLE.format(name="appointments"))
+    
+    # Расписание мастера: документ с часами, перерывами и исключениями (см. schedule.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS master_schedules (
+            master_id TEXT PRIMARY KEY,
+            rules TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY (master_id) REFERENCES masters(id) ON DELETE CASCADE
+        )
+    """)
+
+    # Занятые слоты мастера по дням: бит i — слот i сетки availability.py
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS master_occupancy (
+            master_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            mask INTEGER NOT NULL,
+            PRIMARY KEY (master_id, day),
+            FOREIGN KEY (master_id) REFERENCES masters(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    """)
+
+    # Архив старых записей (см. archive_appointments)
     cursor.execute("""
-        CREATE TABLE IF NOT EXISTS appointments (
+        CREATE TABLE IF NOT EXISTS appointments_archive (
             id TEXT PRIMARY KEY,
             salon_id TEXT NOT NULL,
             master_id TEXT NOT NULL,
             service_id TEXT NOT NULL,
             client_id TEXT NOT NULL,
             datetime TEXT NOT NULL,
-            status TEXT NOT NULL DEFAULT 'pending',
-            FOREIGN KEY (salon_id) REFERENCES salons(id) ON DELETE CASCADE,
-            FOREIGN KEY (master_id) REFERENCES masters(id) ON DELETE CASCADE,
-            FOREIGN KEY (service_id) REFERENCES services(id) ON DELETE CASCADE
+            status TEXT NOT NULL,
+            archived_at TEXT NOT NULL
+        )
+    """)
+
+    # Журнал изменений для дельта-синхронизации (см. changes.py); только дописывается
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_id TEXT NOT NULL,
+            salon_id TEXT NOT NULL,
+            master_id TEXT,
+            client_id TEXT,
+            changed_at TEXT NOT NULL
+        )
+    """)
+
+    # Служебные значения (граница архива и т.п.)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
         )
     """)
     
-    # Индексы для производительности
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_salons_owner ON salons(owner_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_masters_salon ON masters(salon_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_masters_telegram ON masters(telegram_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_services_salon ON services(salon_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_salon ON appointments(salon_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_master ON appointments(master_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_client ON appointments(client_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_datetime ON appointments(datetime)")
+    # Индексы для производительности; у БД со старыми TEXT-ключами индексы
+    # салонов, каталога и записей создаст миграция 5 после перестройки таблиц
+    if _has_integer_keys(conn):
+        _create_keyed_indexes(conn)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_archive_salon_datetime ON appointments_archive(salon_id, datetime)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_archive_client_datetime ON appointments_archive(client_id, datetime)"
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_changes_salon ON changes(salon_id, seq)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_changes_master ON changes(master_id, seq)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_changes_client ON changes(client_id, seq)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_changes_entity ON changes(entity, entity_id, seq)")
     
+    conn.commit()
+    run_migrations(conn)
+
     if seed:
         _seed_data(conn)
     
@@ -107,6 +495,251 @@ def init_db(seed: bool = True):
     conn.close()
 
 
+# Миграции схемы: номер сохраняется в PRAGMA user_version
+def _migrate_incremental_vacuum(conn: sqlite3.Connection) -> None:
+    """auto_vacuum=INCREMENTAL для существующей БД (требует полного VACUUM)"""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+
+# Строки, чей родитель удалён, пока внешние ключи не проверялись
+ORPHAN_CONDITIONS = {
+    "appointments": (
+        "NOT EXISTS (SELECT 1 FROM salons p WHERE p.pk = t.salon_pk)"
+        " OR NOT EXISTS (SELECT 1 FROM masters p WHERE p.pk = t.master_pk)"
+        " OR NOT EXISTS (SELECT 1 FROM services p WHERE p.pk = t.service_pk)"
+    ),
+    "masters": "NOT EXISTS (SELECT 1 FROM salons p WHERE p.id = t.salon_id)",
+    "services": "NOT EXISTS (SELECT 1 FROM salons p WHERE p.id = t.salon_id)",
+}
+
+
+def delete_orphans(conn: sqlite3.Connection, batch_size: int = 500) -> Dict[str, int]:
+    """Удалить осиротевшие строки порциями, фиксируя каждую порцию."""
+    deleted = {}
+    for table, condition in ORPHAN_CONDITIONS.items():
+        deleted[table] = 0
+        while True:
+            count = conn.execute(
+                f"DELETE FROM {table} WHERE rowid IN "
+                f"(SELECT t.rowid FROM {table} t WHERE {condition} LIMIT ?)",
+                (batch_size,),
+            ).rowcount
+            conn.commit()
+            deleted[table] += count
+            if count < batch_size:
+                break
+    if any(deleted.values()):
+        logger.info("Deleted orphaned rows: %s", deleted)
+    return deleted
+
+
+def _migrate_delete_orphans(conn: sqlite3.Connection) -> None:
+    """Однократная чистка строк, оставшихся после удалений без ON DELETE CASCADE"""
+    # Со старыми TEXT-ключами сирот отбросит перестройка таблиц в миграции 5
+    if _has_integer_keys(conn):
+        delete_orphans(conn)
+
+
+def _migrate_catalog_external_ids(conn: sqlite3.Connection) -> None:
+    """Колонка external_id у мастеров и услуг (ключ массового импорта каталога)"""
+    for table in ("masters", "services"):
+        columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if "external_id" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN external_id TEXT")
+        conn.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_external_id "
+            f"ON {table}(salon_id, external_id) WHERE external_id IS NOT NULL"
+        )
+
+
+def _migrate_master_occupancy(conn: sqlite3.Connection) -> None:
+    """Заполнить master_occupancy по существующим записям"""
+    # Со старыми TEXT-ключами заполнит миграция 5 после перестройки таблиц
+    if _has_integer_keys(conn):
+        _rebuild_occupancy(conn, repair=True)
+
+
+# Перестройка на INTEGER-ключи: таблица -> (новая таблица, копирование строк)
+_INTEGER_KEY_REBUILDS = {
+    "salons": (
+        """
+        CREATE TABLE salons_new (
+            pk INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            owner_id TEXT NOT NULL
+        )
+        """,
+        "INSERT INTO salons_new (id, name, owner_id) SELECT id, name, owner_id FROM salons ORDER BY rowid",
+    ),
+    "masters": (
+        """
+        CREATE TABLE masters_new (
+            pk INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
+            salon_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            telegram_id TEXT,
+            external_id TEXT,
+            FOREIGN KEY (salon_id) REFERENCES salons(id) ON DELETE CASCADE
+        )
+        """,
+        "INSERT INTO masters_new (id, salon_id, name, telegram_id, external_id) "
+        "SELECT id, salon_id, name, telegram_id, external_id FROM masters ORDER BY rowid",
+    ),
+    "services": (
+        """
+        CREATE TABLE services_new (
+            pk INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
+            salon_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            price REAL,
+            duration INTEGER,
+            description TEXT,
+            external_id TEXT,
+            FOREIGN KEY (salon_id) REFERENCES salons(id) ON DELETE CASCADE
+        )
+        """,
+        "INSERT INTO services_new (id, salon_id, name, price, duration, description, external_id) "
+        "SELECT id, salon_id, name, price, duration, description, external_id FROM services ORDER BY rowid",
+    ),
+    # Родители к этому моменту уже перестроены; записи без родителя отбрасываются
+    "appointments": (
+        _APPOINTMENTS_TABLE.format(name="appointments_new"),
+        "INSERT INTO appointments_new (id, salon_pk, master_pk, service_pk, client_id, datetime, status) "
+        "SELECT a.id, s.pk, m.pk, v.pk, a.client_id, a.datetime, a.status FROM appointments a "
+        "JOIN salons s ON s.id = a.salon_id "
+        "JOIN masters m ON m.id = a.master_id "
+        "JOIN services v ON v.id = a.service_id "
+        "ORDER BY a.rowid",
+    ),
+}
+
+
+def _migrate_integer_keys(conn: sqlite3.Connection) -> None:
+    """Перестроить салоны, каталог и записи на INTEGER-ключи (pk); UUID остаётся внешним id.
+
+    Записи ссылаются на салон, мастера и услугу по pk, а не по
+    36-символьной строке, поэтому строки записей и индексы по салону и
+    мастеру меньше. Порядок — как в документации SQLite к ALTER TABLE:
+    новая таблица, копирование, удаление старой и переименование, при
+    выключенных внешних ключах.
+    """
+    legacy = _legacy_key_tables(conn)
+    if not legacy:
+        return
+    conn.commit()
+    # Внутри транзакции PRAGMA foreign_keys не действует
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        conn.execute("BEGIN")
+        for table in legacy:
+            create, copy = _INTEGER_KEY_REBUILDS[table]
+            conn.execute(create)
+            conn.execute(copy)
+            conn.execute(f"DROP TABLE {table}")
+            conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        _create_keyed_indexes(conn)
+        _migrate_catalog_external_ids(conn)
+        _rebuild_occupancy(conn, repair=True)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+
+
+MIGRATIONS = [
+    (1, "auto_vacuum=INCREMENTAL", _migrate_incremental_vacuum),
+    (2, "delete orphaned rows", _migrate_delete_orphans),
+    (3, "catalog external ids", _migrate_catalog_external_ids),
+    (4, "master occupancy bitmaps", _migrate_master_occupancy),
+    (5, "integer internal keys", _migrate_integer_keys),
+]
+
+
+def run_migrations(conn: sqlite3.Connection) -> int:
+    """Применить недостающие миграции, вернуть итоговую версию схемы"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, description, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        logger.info("Applying migration %s: %s", number, description)
+        migrate(conn)
+        conn.commit()
+        conn.execute(f"PRAGMA user_version = {number}")
+        version = number
+    return version
+
+
+def _page_stats(conn: sqlite3.Connection) -> Dict[str, int]:
+    return {
+        "page_size": conn.execute("PRAGMA page_size").fetchone()[0],
+        "page_count": conn.execute("PRAGMA page_count").fetchone()[0],
+        "freelist_count": conn.execute("PRAGMA freelist_count").fetchone()[0],
+    }
+
+
+def run_maintenance(vacuum_pages: int = 2000, checkpoint: str = "PASSIVE") -> Dict[str, Any]:
+    """Один проход обслуживания: PRAGMA optimize, incremental vacuum, checkpoint WAL.
+
+    Возвращает отчёт: длительность, число освобождённых страниц и
+    состояние WAL после checkpoint.
+    """
+    mode = checkpoint.upper()
+    if mode not in {"PASSIVE", "FULL", "RESTART", "TRUNCATE"}:
+        raise ValueError(f"Unknown checkpoint mode: {checkpoint}")
+
+    started = time.perf_counter()
+    conn = connect(str(DB_PATH))
+    conn.isolation_level = None
+    try:
+        before = _page_stats(conn)
+        conn.execute("PRAGMA optimize")
+        if before["freelist_count"] and vacuum_pages > 0:
+            # executescript шагает PRAGMA до конца; execute освободил бы одну страницу
+            conn.executescript(f"PRAGMA incremental_vacuum({int(vacuum_pages)});")
+        after = _page_stats(conn)
+        busy, wal_frames, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    finally:
+        conn.close()
+
+    return {
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        "reclaimed_pages": before["page_count"] - after["page_count"],
+        "reclaimed_bytes": (before["page_count"] - after["page_count"]) * after["page_size"],
+        "page_count": after["page_count"],
+        "freelist_count": after["freelist_count"],
+        "checkpoint": mode,
+        "checkpoint_busy": bool(busy),
+        "wal_frames": wal_frames,
+        "checkpointed_frames": checkpointed,
+    }
+
+
+def integrity_report() -> Dict[str, Any]:
+    """Проверка целостности: PRAGMA quick_check и нарушения внешних ключей по таблицам."""
+    started = time.perf_counter()
+    conn = connect(str(DB_PATH))
+    try:
+        quick_check = [row[0] for row in conn.execute("PRAGMA quick_check(10)")]
+        violations: Dict[str, int] = {}
+        for row in conn.execute("PRAGMA foreign_key_check"):
+            violations[row["table"]] = violations.get(row["table"], 0) + 1
+    finally:
+        conn.close()
+    return {
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        "quick_check": quick_check,
+        "foreign_key_violations": violations,
+        "ok": quick_check == ["ok"] and not violations,
+    }
+
+
 def _seed_data(conn: sqlite3.Connection) -> None:
     """Добавить пример данных, если БД пустая."""
     cursor = conn.cursor()
@@ -116,103 +749,144 @@ def _seed_data(conn: sqlite3.Connection) -> None:
 
     logger.info("Seeding database with example data")
     owner_id = "seed-owner"
-    salon_id = str(uuid.uuid4())
+    salon_id = new_id()
     cursor.execute(
         "INSERT INTO salons (id, name, owner_id) VALUES (?, ?, ?)",
         (salon_id, "Demo Salon", owner_id),
     )
 
-    master_id = str(uuid.uuid4())
+    master_id = new_id()
     cursor.execute(
         "INSERT INTO masters (id, salon_id, name, telegram_id) VALUES (?, ?, ?, ?)",
         (master_id, salon_id, "Анна", "seed-master"),
     )
 
-    service_id = str(uuid.uuid4())
+    service_id = new_id()
     cursor.execute(
         "INSERT INTO services (id, salon_id, name, price, duration, description) "
         "VALUES (?, ?, ?, ?, ?, ?)",
         (service_id, salon_id, "Укладка", 1500, 60, "Быстрая укладка"),
     )
 
-    appointment_id = str(uuid.uuid4())
+    appointment_id = new_id()
+    when = datetime.now().isoformat()
     cursor.execute(
-        "INSERT INTO appointments (id, salon_id, master_id, service_id, client_id, datetime, status) "
-        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        APPOINTMENT_INSERT,
         (
             appointment_id,
             salon_id,
             master_id,
             service_id,
             "seed-client",
-            datetime.now().isoformat(),
+            when,
             "pending",
         ),
     )
+    _occupy(conn, master_id, when)
+
+
+# Журнал изменений: откуда берутся entity_id, salon_id, master_id, client_id
+_CHANGE_SOURCES = {
+    "salon": ("salons", "id, id, NULL, NULL"),
+    "master": ("masters", "id, salon_id, id, NULL"),
+    "service": ("services", "id, salon_id, NULL, NULL"),
+    "schedule": ("masters", "id, salon_id, id, NULL"),
+    "appointment": ("appointments_view", "id, salon_id, master_id, client_id"),
+}
+
+
+def _log_changes(conn: sqlite3.Connection, entity: str, where: str, params: Iterable[Iterable[Any]]) -> None:
+    """Дописать в changes строки ``entity``, выбранные условием ``where`` (по набору параметров).
+
+    Вызывается в транзакции самой записи: после вставки/изменения и до удаления.
+    """
+    table, columns = _CHANGE_SOURCES[entity]
+    changed_at = datetime.now().isoformat(timespec="seconds")
+    conn.executemany(
+        f"INSERT INTO changes (entity, entity_id, salon_id, master_id, client_id, changed_at) "
+        f"SELECT ?, {columns}, ? FROM {table} WHERE {where}",
+        [(entity, changed_at, *values) for values in params],
+    )
 
 
 # Функции для работы с салонами
-def create_salon(name: str, owner_id: str) -> Dict:
-    """Создать салон"""
-    salon_id = str(uuid.uuid4())
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+def _insert_salon(conn: sqlite3.Connection, salon_id: str, name: str, owner_id: str) -> None:
+    conn.execute(
         "INSERT INTO salons (id, name, owner_id) VALUES (?, ?, ?)",
         (salon_id, name, owner_id)
     )
-    conn.commit()
-    conn.close()
+    _log_changes(conn, "salon", "id = ?", [(salon_id,)])
+
+
+def create_salon(name: str, owner_id: str) -> Dict:
+    """Создать салон"""
+    salon_id = new_id()
+    _write(_insert_salon, salon_id, name, owner_id)
     return get_salon_by_id(salon_id)
 
 
-def get_salon_by_id(salon_id: str) -> Optional[Dict]:
-    """Получить салон по ID"""
+# Связанные коллекции, которые можно подгрузить вместе с салоном
+SALON_RELATIONS = frozenset({"masters", "services", "appointments"})
+
+
+def _with_relations(row: Salon, include: Optional[Iterable[str]]) -> Dict:
+    """Дополнить строку салона запрошенными коллекциями (None — всеми)."""
+    salon = row.to_dict()
+    relations = SALON_RELATIONS if include is None else set(include)
+    if "masters" in relations:
+        salon["masters"] = get_salon_masters(row.id)
+    if "services" in relations:
+        salon["services"] = get_salon_services(row.id)
+    if "appointments" in relations:
+        salon["appointments"] = get_salon_appointments(row.id)
+    return salon
+
+
+def get_salon_by_id(salon_id: str, include: Optional[Iterable[str]] = None) -> Optional[Dict]:
+    """Получить салон по ID.
+
+    ``include`` — какие коллекции из SALON_RELATIONS загрузить
+    (по умолчанию все, пустое множество — только сам салон).
+    """
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM salons WHERE id = ?", (salon_id,))
-    row = cursor.fetchone()
+    row = _select(conn, Salon, f"SELECT {select_columns(Salon)} FROM salons WHERE id = ?", (salon_id,)).fetchone()
     conn.close()
     
     if not row:
         return None
-    
-    salon = dict(row)
-    salon["masters"] = get_salon_masters(salon_id)
-    salon["services"] = get_salon_services(salon_id)
-    salon["appointments"] = get_salon_appointments(salon_id)
-    return salon
+    return _with_relations(row, include)
 
 
-def get_owner_salon(owner_id: str) -> Optional[Dict]:
-    """Получить салон владельца"""
+def get_owner_salon(owner_id: str, include: Optional[Iterable[str]] = None) -> Optional[Dict]:
+    """Получить салон владельца (``include`` — как в get_salon_by_id)"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM salons WHERE owner_id = ?", (owner_id,))
-    row = cursor.fetchone()
+    row = _select(
+        conn, Salon, f"SELECT {select_columns(Salon)} FROM salons WHERE owner_id = ?", (owner_id,)
+    ).fetchone()
     conn.close()
     
     if not row:
         return None
-    
-    salon_id = row["id"]
-    salon = dict(row)
-    salon["masters"] = get_salon_masters(salon_id)
-    salon["services"] = get_salon_services(salon_id)
-    salon["appointments"] = get_salon_appointments(salon_id)
-    return salon
+    return _with_relations(row, include)
 
 
-def update_salon(salon_id: str, name: Optional[str] = None) -> Optional[Dict]:
-    """Обновить салон"""
+def get_owner_salon_id(owner_id: str) -> Optional[str]:
+    """Получить только ID салона владельца (по индексу idx_salons_owner)"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    if name:
-        cursor.execute("UPDATE salons SET name = ? WHERE id = ?", (name, salon_id))
-    
-    conn.commit()
+    row = conn.execute("SELECT id FROM salons WHERE owner_id = ? LIMIT 1", (owner_id,)).fetchone()
     conn.close()
+    return row["id"] if row else None
+
+
+def _update_salon(conn: sqlite3.Connection, salon_id: str, name: Optional[str]) -> None:
+    if name:
+        conn.execute("UPDATE salons SET name = ? WHERE id = ?", (name, salon_id))
+        _log_changes(conn, "salon", "id = ?", [(salon_id,)])
+
+
+def update_salon(salon_id: str, name: Optional[str] = None) -> Optional[Dict]:
+    """Обновить салон"""
+    _write(_update_salon, salon_id, name)
     return get_salon_by_id(salon_id)
 
 
@@ -235,89 +909,115 @@ def get_all_salons() -> List[Dict]:
 
 
 # Функции для работы с мастерами
-def create_master(salon_id: str, name: str, telegram_id: Optional[str] = None) -> Dict:
-    """Создать мастера"""
-    master_id = str(uuid.uuid4())
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+def _create_master(conn: sqlite3.Connection, salon_id: str, name: str, telegram_id: Optional[str]) -> Master:
+    master_id = new_id()
+    conn.execute(
         "INSERT INTO masters (id, salon_id, name, telegram_id) VALUES (?, ?, ?, ?)",
         (master_id, salon_id, name, telegram_id)
     )
-    conn.commit()
-    conn.close()
-    return {"id": master_id, "name": name, "telegram_id": telegram_id}
+    _log_changes(conn, "master", "id = ?", [(master_id,)])
+    return Master(master_id, name, telegram_id)
+
+
+def create_master(salon_id: str, name: str, telegram_id: Optional[str] = None) -> Master:
+    """Создать мастера"""
+    return _write(_create_master, salon_id, name, telegram_id)
 
 
-def get_salon_masters(salon_id: str) -> List[Dict]:
+def get_salon_masters(salon_id: str) -> List[Master]:
     """Получить мастеров салона"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, telegram_id FROM masters WHERE salon_id = ?", (salon_id,))
-    rows = cursor.fetchall()
+    rows = _select(
+        conn, Master, f"SELECT {select_columns(Master)} FROM masters WHERE salon_id = ?", (salon_id,)
+    ).fetchall()
     conn.close()
-    return [dict(row) for row in rows]
+    return rows
 
 
-def update_master(master_id: str, name: Optional[str] = None) -> Optional[Dict]:
-    """Обновить мастера"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
+def _update_master(conn: sqlite3.Connection, master_id: str, name: Optional[str]) -> Optional[Master]:
     if name:
-        cursor.execute("UPDATE masters SET name = ? WHERE id = ?", (name, master_id))
-    
-    conn.commit()
-    cursor.execute("SELECT id, name, telegram_id FROM masters WHERE id = ?", (master_id,))
-    row = cursor.fetchone()
-    conn.close()
-    
-    return dict(row) if row else None
+        conn.execute("UPDATE masters SET name = ? WHERE id = ?", (name, master_id))
+        _log_changes(conn, "master", "id = ?", [(master_id,)])
+    return _select(conn, Master, f"SELECT {select_columns(Master)} FROM masters WHERE id = ?", (master_id,)).fetchone()
+
+
+def update_master(master_id: str, name: Optional[str] = None) -> Optional[Master]:
+    """Обновить мастера"""
+    return _write(_update_master, master_id, name)
+
+
+def _delete_master(conn: sqlite3.Connection, master_id: str) -> bool:
+    # Записи мастера удалятся каскадом — в журнал до удаления
+    _log_changes(conn, "appointment", "master_id = ?", [(master_id,)])
+    _log_changes(conn, "master", "id = ?", [(master_id,)])
+    return conn.execute("DELETE FROM masters WHERE id = ?", (master_id,)).rowcount > 0
 
 
 def delete_master(master_id: str) -> bool:
     """Удалить мастера"""
+    return _write(_delete_master, master_id)
+
+
+def get_master_schedules(master_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Заданные расписания мастеров: master_id -> документ (мастеров без расписания нет)"""
+    if not master_ids:
+        return {}
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM masters WHERE id = ?", (master_id,))
-    deleted = cursor.rowcount > 0
-    conn.commit()
+    placeholders = ",".join("?" * len(master_ids))
+    rows = conn.execute(
+        f"SELECT master_id, rules FROM master_schedules WHERE master_id IN ({placeholders})", master_ids
+    ).fetchall()
     conn.close()
-    return deleted
+    return {row["master_id"]: json.loads(row["rules"]) for row in rows}
+
+
+def _set_master_schedule(conn: sqlite3.Connection, master_id: str, rules: Optional[Dict[str, Any]]) -> None:
+    if rules is None:
+        conn.execute("DELETE FROM master_schedules WHERE master_id = ?", (master_id,))
+    else:
+        conn.execute(
+            "INSERT INTO master_schedules (master_id, rules, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(master_id) DO UPDATE SET rules = excluded.rules, updated_at = excluded.updated_at",
+            (master_id, json.dumps(rules, ensure_ascii=False), datetime.now().isoformat()),
+        )
+    _log_changes(conn, "schedule", "id = ?", [(master_id,)])
+
+
+def set_master_schedule(master_id: str, rules: Optional[Dict[str, Any]]) -> None:
+    """Сохранить расписание мастера; None — вернуть часы по умолчанию"""
+    _write(_set_master_schedule, master_id, rules)
 
 
 # Функции для работы с услугами
-def create_service(salon_id: str, name: str, price: Optional[float] = None, 
-                   duration: Optional[int] = None, description: Optional[str] = None) -> Dict:
-    """Создать услугу"""
-    service_id = str(uuid.uuid4())
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+def _create_service(conn: sqlite3.Connection, salon_id: str, name: str, price: Optional[float],
+                    duration: Optional[int], description: Optional[str]) -> Service:
+    service_id = new_id()
+    conn.execute(
         "INSERT INTO services (id, salon_id, name, price, duration, description) VALUES (?, ?, ?, ?, ?, ?)",
         (service_id, salon_id, name, price, duration, description)
     )
-    conn.commit()
-    conn.close()
-    return {"id": service_id, "name": name, "price": price, "duration": duration, "description": description}
+    _log_changes(conn, "service", "id = ?", [(service_id,)])
+    return Service(service_id, name, price, duration, description)
+
+
+def create_service(salon_id: str, name: str, price: Optional[float] = None, 
+                   duration: Optional[int] = None, description: Optional[str] = None) -> Service:
+    """Создать услугу"""
+    return _write(_create_service, salon_id, name, price, duration, description)
 
 
-def get_salon_services(salon_id: str) -> List[Dict]:
+def get_salon_services(salon_id: str) -> List[Service]:
     """Получить услуги салона"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, price, duration, description FROM services WHERE salon_id = ?", (salon_id,))
-    rows = cursor.fetchall()
+    rows = _select(
+        conn, Service, f"SELECT {select_columns(Service)} FROM services WHERE salon_id = ?", (salon_id,)
+    ).fetchall()
     conn.close()
-    return [dict(row) for row in rows]
+    return rows
 
 
-def update_service(service_id: str, name: Optional[str] = None, price: Optional[float] = None,
-                   duration: Optional[int] = None, description: Optional[str] = None) -> Optional[Dict]:
-    """Обновить услугу"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
+def _update_service(conn: sqlite3.Connection, service_id: str, name: Optional[str], price: Optional[float],
+                    duration: Optional[int], description: Optional[str]) -> Optional[Service]:
     updates = []
     params = []
     if name is not None:
@@ -335,108 +1035,575 @@ def update_service(service_id: str, name: Optional[str] = None, price: Optional[
     
     if updates:
         params.append(service_id)
-        cursor.execute(f"UPDATE services SET {', '.join(updates)} WHERE id = ?", params)
-    
-    conn.commit()
-    cursor.execute("SELECT id, name, price, duration, description FROM services WHERE id = ?", (service_id,))
-    row = cursor.fetchone()
-    conn.close()
+        conn.execute(f"UPDATE services SET {', '.join(updates)} WHERE id = ?", params)
+        _log_changes(conn, "service", "id = ?", [(service_id,)])
     
-    return dict(row) if row else None
+    return _select(
+        conn, Service, f"SELECT {select_columns(Service)} FROM services WHERE id = ?", (service_id,)
+    ).fetchone()
+
+
+def update_service(service_id: str, name: Optional[str] = None, price: Optional[float] = None,
+                   duration: Optional[int] = None, description: Optional[str] = None) -> Optional[Service]:
+    """Обновить услугу"""
+    return _write(_update_service, service_id, name, price, duration, description)
+
+
+def _delete_service(conn: sqlite3.Connection, service_id: str) -> bool:
+    # Записи услуги удалятся каскадом — их слоты надо освободить
+    booked = conn.execute(
+        "SELECT master_id, datetime FROM appointments_view WHERE service_id = ?", (service_id,)
+    ).fetchall()
+    _log_changes(conn, "appointment", "service_id = ?", [(service_id,)])
+    _log_changes(conn, "service", "id = ?", [(service_id,)])
+    deleted = conn.execute("DELETE FROM services WHERE id = ?", (service_id,)).rowcount > 0
+    _refresh_occupancy(conn, booked)
+    return deleted
 
 
 def delete_service(service_id: str) -> bool:
     """Удалить услугу"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM services WHERE id = ?", (service_id,))
-    deleted = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return deleted
+    return _write(_delete_service, service_id)
+
+
+# Массовый импорт каталога (см. catalog_import.py)
+_IMPORT_STATEMENTS = {
+    "masters": (
+        "INSERT INTO masters (id, salon_id, name, telegram_id, external_id) VALUES (?, ?, ?, ?, ?)",
+        "UPDATE masters SET name = ?, telegram_id = COALESCE(?, telegram_id), "
+        "external_id = COALESCE(?, external_id) WHERE id = ?",
+    ),
+    "services": (
+        "INSERT INTO services (id, salon_id, name, price, duration, description, external_id) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        "UPDATE services SET name = ?, price = COALESCE(?, price), duration = COALESCE(?, duration), "
+        "description = COALESCE(?, description), external_id = COALESCE(?, external_id) WHERE id = ?",
+    ),
+}
+
+
+def _import_catalog(conn: sqlite3.Connection, salon_id: str, catalog: Dict[str, List[Dict[str, Any]]],
+                    upsert: Optional[str]) -> Dict[str, Any]:
+    plans = {}
+    for kind in catalog_import.KINDS:
+        existing = conn.execute(
+            f"SELECT id, name, external_id FROM {kind} WHERE salon_id = ? ORDER BY rowid", (salon_id,)
+        ).fetchall()
+        plans[kind] = catalog_import.plan(kind, catalog.get(kind, []), existing, upsert)
+    result = catalog_import.summary({kind: plans[kind][0] for kind in catalog_import.KINDS})
+    if result["errors"]:
+        return result
+
+    for kind, (_, inserts, updates) in plans.items():
+        insert, update = _IMPORT_STATEMENTS[kind]
+        if inserts:
+            conn.executemany(insert, [(row_id, salon_id, *params) for row_id, *params in inserts])
+        if updates:
+            conn.executemany(update, [(*params, row_id) for row_id, *params in updates])
+        _log_changes(
+            conn, "master" if kind == "masters" else "service", "id = ?",
+            [(row_id,) for row_id, *_ in [*inserts, *updates]],
+        )
+    return result
+
+
+def import_catalog(salon_id: str, catalog: Dict[str, List[Dict[str, Any]]],
+                   upsert: Optional[str] = None) -> Dict[str, Any]:
+    """Импортировать мастеров и услуг салона одной транзакцией.
+
+    Если хоть одна строка с ошибкой, ничего не записывается.
+    """
+    return _write(_import_catalog, salon_id, catalog, upsert)
 
 
 # Функции для работы с записями
+# Вставка по внешним id: несуществующий салон, мастер или услуга дают NULL
+# в pk, и NOT NULL отклоняет запись так же, как раньше внешний ключ
+APPOINTMENT_INSERT = (
+    "INSERT INTO appointments (id, salon_pk, master_pk, service_pk, client_id, datetime, status) "
+    "VALUES (?, (SELECT pk FROM salons WHERE id = ?), (SELECT pk FROM masters WHERE id = ?), "
+    "(SELECT pk FROM services WHERE id = ?), ?, ?, ?)"
+)
+
+
+def _create_appointment(conn: sqlite3.Connection, salon_id: str, master_id: str, service_id: str,
+                        client_id: str, datetime_str: str, status: str) -> Appointment:
+    appointment_id = new_id()
+    conn.execute(
+        APPOINTMENT_INSERT,
+        (appointment_id, salon_id, master_id, service_id, client_id, datetime_str, status)
+    )
+    _log_changes(conn, "appointment", "id = ?", [(appointment_id,)])
+    if status not in availability.INACTIVE_STATUSES:
+        _occupy(conn, master_id, datetime_str)
+    return Appointment(appointment_id, salon_id, master_id, service_id, client_id, datetime_str, status)
+
+
 def create_appointment(salon_id: str, master_id: str, service_id: str, 
-                      client_id: str, datetime_str: str, status: str = "pending") -> Dict:
+                      client_id: str, datetime_str: str, status: str = "pending") -> Appointment:
     """Создать запись"""
-    appointment_id = str(uuid.uuid4())
+    return _write(_create_appointment, salon_id, master_id, service_id, client_id, datetime_str, status)
+
+
+def submit_create_appointment(salon_id: str, master_id: str, service_id: str,
+                              client_id: str, datetime_str: str, status: str = "pending") -> Future:
+    """Поставить создание записи в очередь писателя, вернуть future"""
+    return submit_write(_create_appointment, salon_id, master_id, service_id, client_id, datetime_str, status)
+
+
+APPOINTMENT_COLUMNS = select_columns(Appointment)
+
+
+def _archive_horizon(conn) -> Optional[str]:
+    """Граница архива: все записи раньше неё могут лежать в appointments_archive"""
+    row = conn.execute("SELECT value FROM meta WHERE key = 'archive_horizon'").fetchone()
+    return row["value"] if row else None
+
+
+def _select_appointments(where: str, params: List[Any], date_from: Optional[str],
+                         include_archive: Optional[bool], limit: Optional[int] = None,
+                         offset: int = 0) -> List[Appointment]:
+    """SELECT записей по условию; архив подмешивается через UNION ALL.
+
+    ``include_archive=None`` — автоматически: только если ``date_from``
+    раньше границы архива (без диапазона читаются лишь «горячие» записи).
+    """
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO appointments (id, salon_id, master_id, service_id, client_id, datetime, status) VALUES (?, ?, ?, ?, ?, ?, ?)",
-        (appointment_id, salon_id, master_id, service_id, client_id, datetime_str, status)
+    if include_archive is None:
+        horizon = _archive_horizon(conn) if date_from else None
+        include_archive = horizon is not None and date_from < horizon
+
+    query = f"SELECT {APPOINTMENT_COLUMNS} FROM appointments_view WHERE {where}"
+    query_params = list(params)
+    if include_archive:
+        query += f" UNION ALL SELECT {APPOINTMENT_COLUMNS} FROM appointments_archive WHERE {where}"
+        query_params += params
+    query += " ORDER BY datetime, id"
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        query_params += [limit, offset]
+
+    rows = _select(conn, Appointment, query, query_params).fetchall()
+    conn.close()
+    return rows
+
+
+def _salon_appointments_filter(salon_id: str, date_from: Optional[str], date_to: Optional[str],
+                               master_id: Optional[str], status: Optional[str]) -> tuple[str, List[Any]]:
+    where = "salon_id = ?"
+    params: List[Any] = [salon_id]
+    if date_from:
+        where += " AND datetime >= ?"
+        params.append(date_from)
+    if date_to:
+        where += " AND datetime < ?"
+        params.append(date_to)
+    if master_id:
+        where += " AND master_id = ?"
+        params.append(master_id)
+    if status:
+        where += " AND status = ?"
+        params.append(status)
+    return where, params
+
+
+def get_salon_appointments(salon_id: str, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                           master_id: Optional[str] = None, status: Optional[str] = None,
+                           limit: Optional[int] = None, offset: int = 0,
+                           include_archive: Optional[bool] = None) -> List[Appointment]:
+    """Получить записи салона в хронологическом порядке.
+
+    ``date_from`` включительно, ``date_to`` не включительно (ISO-строки,
+    можно просто дату ``YYYY-MM-DD``); фильтры и пагинация выполняются в SQL.
+    Диапазон, уходящий за границу архива, читает и appointments_archive.
+    """
+    where, params = _salon_appointments_filter(salon_id, date_from, date_to, master_id, status)
+    return _select_appointments(where, params, date_from, include_archive, limit, offset)
+
+
+def iter_salon_appointments(salon_id: str, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                            master_id: Optional[str] = None, status: Optional[str] = None,
+                            include_archive: bool = True,
+                            batch_size: int = 1000) -> Iterator[List[Appointment]]:
+    """Выдавать записи салона порциями по ``batch_size`` (для выгрузки).
+
+    Читает одним запросом через ``fetchmany`` на собственном соединении:
+    память не зависит от размера истории, а весь результат — один снимок
+    WAL. Генератор можно продолжать из разных потоков (StreamingResponse).
+    """
+    where, params = _salon_appointments_filter(salon_id, date_from, date_to, master_id, status)
+    query = f"SELECT {APPOINTMENT_COLUMNS} FROM appointments_view WHERE {where}"
+    if include_archive:
+        query += f" UNION ALL SELECT {APPOINTMENT_COLUMNS} FROM appointments_archive WHERE {where}"
+        params = params + params
+    query += " ORDER BY datetime, id"
+
+    conn = connect(str(DB_PATH), check_same_thread=False)
+    try:
+        cursor = _select(conn, Appointment, query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
+def count_salon_appointments(salon_id: str, date_from: str, date_to: str) -> Dict[str, int]:
+    """Количество записей салона (вместе с архивом): всего, до окна и после окна [date_from, date_to)"""
+    conn = get_db_connection()
+    row = conn.execute(
+        "SELECT COUNT(*) AS total, "
+        "COALESCE(SUM(datetime < ?), 0) AS before, "
+        "COALESCE(SUM(datetime >= ?), 0) AS after "
+        "FROM (SELECT datetime FROM appointments_view WHERE salon_id = ? "
+        "UNION ALL SELECT datetime FROM appointments_archive WHERE salon_id = ?)",
+        (date_from, date_to, salon_id, salon_id),
+    ).fetchone()
+    conn.close()
+    return {"total": row["total"], "before": row["before"], "after": row["after"]}
+
+
+# Занятость мастеров: master_occupancy хранит битовую маску занятых слотов
+# на каждый день. Создание записи добавляет её биты (OR), отмена, завершение
+# и удаление пересчитывают затронутые дни по оставшимся записям;
+# rebuild_occupancy сверяет таблицу с записями целиком.
+_OCCUPANCY_UPSERT = (
+    "INSERT INTO master_occupancy (master_id, day, mask) VALUES (?, ?, ?) "
+    "ON CONFLICT(master_id, day) DO UPDATE SET mask = {mask}"
+)
+_ACTIVE_BOOKINGS = "status NOT IN ('cancelled', 'completed')"
+
+
+def _occupy(conn: sqlite3.Connection, master_id: str, datetime_str: str) -> None:
+    moment = availability.parse_local(datetime_str)
+    if moment is None:
+        return
+    conn.executemany(
+        _OCCUPANCY_UPSERT.format(mask="mask | excluded.mask"),
+        [(master_id, day.isoformat(), mask) for day, mask in availability.booking_masks(moment).items()],
     )
-    conn.commit()
+
+
+def _refresh_occupancy(conn: sqlite3.Connection, booked: Iterable[Tuple[str, str]]) -> None:
+    """Пересчитать дни, которые занимали записи ``(master_id, datetime)``"""
+    days_by_master: Dict[str, set] = {}
+    for master_id, value in booked:
+        moment = availability.parse_local(value)
+        if moment is not None:
+            days_by_master.setdefault(master_id, set()).update((moment.date(), moment.date() + timedelta(days=1)))
+    for master_id, days in days_by_master.items():
+        date_from, date_to = availability.booking_window(min(days), max(days))
+        rows = conn.execute(
+            f"SELECT master_id, datetime FROM appointments_view "
+            f"WHERE master_id = ? AND datetime >= ? AND datetime < ? AND {_ACTIVE_BOOKINGS}",
+            (master_id, date_from, date_to),
+        )
+        masks = availability.occupancy_masks(days, availability.group_bookings(rows).get(master_id, {}))
+        conn.executemany(
+            "DELETE FROM master_occupancy WHERE master_id = ? AND day = ?",
+            [(master_id, day.isoformat()) for day in days if day not in masks],
+        )
+        conn.executemany(
+            _OCCUPANCY_UPSERT.format(mask="excluded.mask"),
+            [(master_id, day.isoformat(), mask) for day, mask in masks.items()],
+        )
+
+
+def get_occupancy(master_ids: List[str], first: date, last: date) -> Dict[str, Dict[date, int]]:
+    """Маски занятых слотов мастеров по дням first..last (дни без записей отсутствуют)"""
+    if not master_ids:
+        return {}
+    conn = get_db_connection()
+    placeholders = ",".join("?" * len(master_ids))
+    rows = conn.execute(
+        f"SELECT master_id, day, mask FROM master_occupancy "
+        f"WHERE master_id IN ({placeholders}) AND day >= ? AND day <= ?",
+        [*master_ids, first.isoformat(), last.isoformat()],
+    ).fetchall()
     conn.close()
+    occupancy: Dict[str, Dict[date, int]] = {}
+    for master_id, day, mask in rows:
+        occupancy.setdefault(master_id, {})[date.fromisoformat(day)] = mask
+    return occupancy
+
+
+def _rebuild_occupancy(conn: sqlite3.Connection, repair: bool) -> Dict[str, Any]:
+    started = time.perf_counter()
+    expected: Dict[Tuple[str, str], int] = {}
+    rows = conn.execute(
+        f"SELECT m.id, a.datetime FROM appointments a JOIN masters m ON m.pk = a.master_pk "
+        f"WHERE a.{_ACTIVE_BOOKINGS}"
+    )
+    for master_id, value in rows:
+        moment = availability.parse_local(value)
+        if moment is None:
+            continue
+        for day, mask in availability.booking_masks(moment).items():
+            key = (master_id, day.isoformat())
+            expected[key] = expected.get(key, 0) | mask
+    stored = {(master_id, day): mask for master_id, day, mask in conn.execute(
+        "SELECT master_id, day, mask FROM master_occupancy"
+    )}
+    stale = [key for key in stored if key not in expected]
+    wrong = [(*key, mask) for key, mask in expected.items() if stored.get(key) != mask]
+    if repair:
+        conn.executemany("DELETE FROM master_occupancy WHERE master_id = ? AND day = ?", stale)
+        conn.executemany(_OCCUPANCY_UPSERT.format(mask="excluded.mask"), wrong)
     return {
-        "id": appointment_id,
-        "salon_id": salon_id,
-        "master_id": master_id,
-        "service_id": service_id,
-        "client_id": client_id,
-        "datetime": datetime_str,
-        "status": status
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        "days": len(expected),
+        "mismatched": len(stale) + len(wrong),
+        "repaired": repair,
     }
 
 
-def get_salon_appointments(salon_id: str) -> List[Dict]:
-    """Получить все записи салона"""
+def rebuild_occupancy(repair: bool = True) -> Dict[str, Any]:
+    """Сверить master_occupancy с записями и (если repair) исправить расхождения.
+
+    Отчёт: число дней с занятыми слотами и число расходившихся дней.
+    """
+    if repair:
+        return _write(_rebuild_occupancy, repair)
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM appointments WHERE salon_id = ?", (salon_id,))
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    try:
+        return _rebuild_occupancy(conn, repair)
+    finally:
+        conn.close()
 
 
-def get_master_appointments(master_ids: List[str]) -> List[Dict]:
+def get_master_appointments(master_ids: List[str]) -> List[Appointment]:
     """Получить записи мастера"""
     if not master_ids:
         return []
     
     conn = get_db_connection()
-    cursor = conn.cursor()
     placeholders = ",".join("?" * len(master_ids))
-    cursor.execute(f"SELECT * FROM appointments WHERE master_id IN ({placeholders})", master_ids)
-    rows = cursor.fetchall()
+    rows = _select(
+        conn, Appointment, f"SELECT {APPOINTMENT_COLUMNS} FROM appointments_view WHERE master_id IN ({placeholders})",
+        master_ids,
+    ).fetchall()
     conn.close()
-    return [dict(row) for row in rows]
+    return rows
 
 
-def get_client_appointments(client_id: str) -> List[Dict]:
-    """Получить записи клиента"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM appointments WHERE client_id = ?", (client_id,))
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+def get_client_appointments(client_id: str, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                            include_archive: Optional[bool] = None) -> List[Appointment]:
+    """Получить записи клиента (архив — как в get_salon_appointments)"""
+    where = "client_id = ?"
+    params: List[Any] = [client_id]
+    if date_from:
+        where += " AND datetime >= ?"
+        params.append(date_from)
+    if date_to:
+        where += " AND datetime < ?"
+        params.append(date_to)
+    return _select_appointments(where, params, date_from, include_archive)
+
+
+# Архивирование старых записей: переносятся только завершённые и отменённые,
+# активные записи остаются в горячей таблице при любом возрасте
+def _archive_batch(conn: sqlite3.Connection, before: str, batch_size: int) -> int:
+    ids = [
+        row["id"] for row in conn.execute(
+            f"SELECT id FROM appointments WHERE datetime < ? AND NOT ({_ACTIVE_BOOKINGS}) "
+            "ORDER BY datetime LIMIT ?",
+            (before, batch_size),
+        )
+    ]
+    if ids:
+        placeholders = ",".join("?" * len(ids))
+        conn.execute(
+            f"INSERT OR REPLACE INTO appointments_archive ({APPOINTMENT_COLUMNS}, archived_at) "
+            f"SELECT {APPOINTMENT_COLUMNS}, ? FROM appointments_view WHERE id IN ({placeholders})",
+            [datetime.now().isoformat(timespec="seconds"), *ids],
+        )
+        # Неактивные записи слотов не занимают — master_occupancy не меняется
+        conn.execute(f"DELETE FROM appointments WHERE id IN ({placeholders})", ids)
+    horizon = _archive_horizon(conn)
+    if horizon is None or before > horizon:
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('archive_horizon', ?)", (before,)
+        )
+    return len(ids)
+
 
+def archive_appointments(before: str, batch_size: int = 500) -> int:
+    """Перенести одну порцию завершённых и отменённых записей старше ``before`` в appointments_archive.
 
-def update_appointment(appointment_id: str, status: Optional[str] = None) -> Optional[Dict]:
+    Каждая порция — отдельная короткая транзакция; возвращает число
+    перенесённых записей (меньше ``batch_size`` — переносить больше нечего).
+    """
+    return _write(_archive_batch, before, batch_size)
+
+
+def _update_appointment(conn: sqlite3.Connection, appointment_id: str,
+                        status: Optional[str]) -> Optional[Appointment]:
+    if status:
+        conn.execute("UPDATE appointments SET status = ? WHERE id = ?", (status, appointment_id))
+        _log_changes(conn, "appointment", "id = ?", [(appointment_id,)])
+    appointment = _select(
+        conn, Appointment, f"SELECT {APPOINTMENT_COLUMNS} FROM appointments_view WHERE id = ?", (appointment_id,)
+    ).fetchone()
+    if status and appointment:
+        _refresh_occupancy(conn, [(appointment.master_id, appointment.datetime)])
+    return appointment
+
+
+def update_appointment(appointment_id: str, status: Optional[str] = None) -> Optional[Appointment]:
     """Обновить запись"""
+    return _write(_update_appointment, appointment_id, status)
+
+
+def _update_appointments_status(conn: sqlite3.Connection, appointment_ids: List[str], status: str) -> int:
+    cursor = conn.executemany(
+        "UPDATE appointments SET status = ? WHERE id = ?",
+        [(status, appointment_id) for appointment_id in appointment_ids],
+    )
+    _log_changes(conn, "appointment", "id = ?", [(appointment_id,) for appointment_id in appointment_ids])
+    placeholders = ",".join("?" * len(appointment_ids))
+    _refresh_occupancy(conn, conn.execute(
+        f"SELECT master_id, datetime FROM appointments_view WHERE id IN ({placeholders})", appointment_ids
+    ).fetchall())
+    return cursor.rowcount
+
+
+def update_appointments_status(appointment_ids: List[str], status: str) -> int:
+    """Установить статус нескольким записям одной транзакцией"""
+    if not appointment_ids:
+        return 0
+    return _write(_update_appointments_status, appointment_ids, status)
+
+
+def get_appointments_by_ids(appointment_ids: List[str]) -> List[Appointment]:
+    """Получить записи по списку ID одним запросом (порядок не гарантирован)"""
+    if not appointment_ids:
+        return []
+    placeholders = ", ".join("?" * len(appointment_ids))
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    if status:
-        cursor.execute("UPDATE appointments SET status = ? WHERE id = ?", (status, appointment_id))
-    
-    conn.commit()
-    cursor.execute("SELECT * FROM appointments WHERE id = ?", (appointment_id,))
-    row = cursor.fetchone()
+    rows = _select(
+        conn, Appointment, f"SELECT {APPOINTMENT_COLUMNS} FROM appointments_view WHERE id IN ({placeholders})",
+        appointment_ids,
+    ).fetchall()
     conn.close()
-    
-    return dict(row) if row else None
+    return rows
 
 
-def get_appointment_by_id(appointment_id: str) -> Optional[Dict]:
+def get_appointment_by_id(appointment_id: str) -> Optional[Appointment]:
     """Получить запись по ID"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM appointments WHERE id = ?", (appointment_id,))
-    row = cursor.fetchone()
+    row = _select(
+        conn, Appointment, f"SELECT {APPOINTMENT_COLUMNS} FROM appointments_view WHERE id = ?", (appointment_id,)
+    ).fetchone()
     conn.close()
-    return dict(row) if row else None
+    return row
+
+
+# Дельта-синхронизация по журналу changes (см. changes.py)
+def _changes_filter(scope: changes.Scope) -> Tuple[str, List[Any]]:
+    clauses: List[str] = []
+    params: List[Any] = []
+    if scope.salon_id:
+        clauses.append("salon_id = ?")
+        params.append(scope.salon_id)
+    if scope.catalog_salon_id:
+        clauses.append("(salon_id = ? AND entity IN ('salon', 'master', 'service'))")
+        params.append(scope.catalog_salon_id)
+    if scope.master_ids:
+        clauses.append(f"master_id IN ({','.join('?' * len(scope.master_ids))})")
+        params.extend(scope.master_ids)
+    if scope.client_id:
+        clauses.append("client_id = ?")
+        params.append(scope.client_id)
+    return " OR ".join(clauses) or "0", params
+
+
+def _changes_horizon(conn) -> int:
+    """Наибольший seq, удалённый сжатием по сроку хранения"""
+    row = conn.execute("SELECT value FROM meta WHERE key = 'changes_horizon'").fetchone()
+    return int(row["value"]) if row else 0
+
+
+def _current_entities(conn, entity: str, ids: List[str]) -> Dict[str, Any]:
+    """Текущее состояние сущностей ``ids`` (удалённых в результате нет)"""
+    if not ids:
+        return {}
+    placeholders = ",".join("?" * len(ids))
+    if entity == "salon":
+        rows = conn.execute(f"SELECT id, name FROM salons WHERE id IN ({placeholders})", ids)
+        return {row["id"]: dict(row) for row in rows}
+    if entity == "schedule":
+        rows = conn.execute(
+            f"SELECT m.id, s.rules FROM masters m LEFT JOIN master_schedules s ON s.master_id = m.id "
+            f"WHERE m.id IN ({placeholders})", ids,
+        )
+        return {row["id"]: json.loads(row["rules"]) if row["rules"] else None for row in rows}
+    if entity == "appointment":
+        # Запись, ушедшая в архив, не удалена
+        rows = _select(
+            conn, Appointment,
+            f"SELECT {APPOINTMENT_COLUMNS} FROM appointments_view WHERE id IN ({placeholders}) "
+            f"UNION ALL SELECT {APPOINTMENT_COLUMNS} FROM appointments_archive WHERE id IN ({placeholders})",
+            ids + ids,
+        )
+        return {row.id: row for row in rows}
+    cls, table = (Master, "masters") if entity == "master" else (Service, "services")
+    rows = _select(conn, cls, f"SELECT {select_columns(cls)} FROM {table} WHERE id IN ({placeholders})", ids)
+    return {row.id: row for row in rows}
+
+
+def get_changes(scope: changes.Scope, since: Optional[int], limit: int = 500) -> Dict[str, Any]:
+    """Сущности области ``scope``, изменившиеся после курсора ``since``.
+
+    Не больше ``limit`` сущностей за раз (``has_more`` — есть следующая
+    страница). Курсор, которого журнал уже не помнит, даёт ``reset``.
+    """
+    conn = get_db_connection()
+    try:
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        last = row["seq"] if row else 0
+        if changes.needs_reset(since, _changes_horizon(conn), last):
+            return changes.result(last, reset=True)
+        where, params = _changes_filter(scope)
+        latest = conn.execute(
+            f"SELECT entity, entity_id, MAX(seq) AS seq FROM changes WHERE seq > ? AND ({where}) "
+            f"GROUP BY entity, entity_id ORDER BY seq LIMIT ?",
+            [since, *params, limit + 1],
+        ).fetchall()
+        page, ids = changes.paginate([tuple(row) for row in latest], since, limit)
+        for entity, entity_ids in ids.items():
+            changes.fill(page, entity, entity_ids, _current_entities(conn, entity, entity_ids))
+        return page
+    finally:
+        conn.close()
+
+
+def _compact_changes(conn: sqlite3.Connection, before: str, batch_size: int) -> int:
+    # Запись, за которой есть более поздняя по той же сущности, ответов не меняет
+    superseded = conn.execute(
+        "DELETE FROM changes WHERE seq IN (SELECT c.seq FROM changes c WHERE EXISTS ("
+        "SELECT 1 FROM changes n WHERE n.entity = c.entity AND n.entity_id = c.entity_id AND n.seq > c.seq"
+        ") LIMIT ?)",
+        (batch_size,),
+    ).rowcount
+    expired = [
+        row["seq"] for row in conn.execute(
+            "SELECT seq FROM changes WHERE changed_at < ? ORDER BY seq LIMIT ?", (before, batch_size)
+        )
+    ]
+    if expired:
+        conn.execute(f"DELETE FROM changes WHERE seq IN ({','.join('?' * len(expired))})", expired)
+        if max(expired) > _changes_horizon(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('changes_horizon', ?)", (str(max(expired)),)
+            )
+    return superseded + len(expired)
+
 
+def compact_changes(before: str, batch_size: int = 500) -> int:
+    """Одна порция сжатия журнала: перекрытые записи и записи старше ``before``.
 
+    Возвращает число удалённых записей (меньше ``batch_size`` — сжимать больше нечего).
+    """
+    return _write(_compact_changes, before, batch_size)
@@ -0,0 +1,156 @@
+"""Single-writer queue for SQLite.
+
+SQLite allows one writer at a time. Instead of letting every request open a
+connection and race for the write lock, :class:`SQLiteWriter` owns the only
+write connection in a background thread and applies submitted operations in
+order. Operations that arrive close together share one transaction (group
+commit): each runs inside its own ``SAVEPOINT``, so a failing operation is
+rolled back alone, and the batch is made durable with a single ``COMMIT``.
+Callers receive a :class:`concurrent.futures.Future` that resolves once the
+transaction holding their write has committed.
+"""
+from __future__ import annotations
+
+import logging
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+WriteOp = Callable[..., Any]
+
+_STOP = object()
+
+
+@dataclass
+class _Job:
+    op: WriteOp
+    args: tuple
+    kwargs: dict
+    future: Future = field(default_factory=Future)
+
+
+@dataclass
+class WriterStats:
+    transactions: int = 0
+    operations: int = 0
+    failed_operations: int = 0
+    largest_batch: int = 0
+
+
+class SQLiteWriter:
+    """Background thread executing write operations on one connection."""
+
+    def __init__(
+        self,
+        db_path: str | Path,
+        connect: Callable[[str], sqlite3.Connection],
+        max_batch: int = 64,
+        max_delay: float = 0.002,
+    ):
+        self.db_path = str(db_path)
+        self._connect = connect
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.stats = WriterStats()
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "SQLiteWriter":
+        if not self.running:
+            self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        """Finish queued writes, then close the connection."""
+        if not self.running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, op: WriteOp, *args: Any, **kwargs: Any) -> Future:
+        """Queue ``op(conn, *args, **kwargs)``; the future holds its result."""
+        if not self.running:
+            raise RuntimeError("SQLite writer is not running")
+        job = _Job(op, args, kwargs)
+        self._queue.put(job)
+        return job.future
+
+    def _collect(self, first: _Job) -> tuple[List[_Job], bool]:
+        batch = [first]
+        stop = False
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=self.max_delay) if self.max_delay else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _run(self) -> None:
+        conn = self._connect(self.db_path)
+        conn.isolation_level = None  # транзакциями управляем вручную
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                batch, stop = self._collect(item)
+                self._apply(conn, batch)
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _apply(self, conn: sqlite3.Connection, batch: List[_Job]) -> None:
+        outcomes: List[tuple[_Job, bool, Any]] = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for job in batch:
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT write_op")
+                try:
+                    result = job.op(conn, *job.args, **job.kwargs)
+                except Exception as exc:  # noqa: BLE001 - передаём вызывающему
+                    conn.execute("ROLLBACK TO write_op")
+                    conn.execute("RELEASE write_op")
+                    outcomes.append((job, False, exc))
+                else:
+                    conn.execute("RELEASE write_op")
+                    outcomes.append((job, True, result))
+            conn.execute("COMMIT")
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("Group commit of %s writes failed", len(batch))
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            # Ожидающие и выполненные операции: транзакция не зафиксирована ни для одной
+            for job in batch:
+                if not job.future.done():
+                    job.future.set_exception(exc)
+            return
+
+        self.stats.transactions += 1
+        self.stats.largest_batch = max(self.stats.largest_batch, len(batch))
+        for job, ok, value in outcomes:
+            self.stats.operations += 1
+            if ok:
+                job.future.set_result(value)
+            else:
+                self.stats.failed_operations += 1
+                job.future.set_exception(value)
@@ -0,0 +1,173 @@
+"""In-process pub/sub behind the live appointment stream (Server-Sent Events).
+
+Write paths publish an event after their transaction commits, addressed to
+topics such as ``salon:<id>`` and ``master:<id>``; every open stream
+subscribes to the topics of its caller. Event ids are ``<epoch>:<seq>``
+with a per-process epoch and an increasing sequence number.
+
+The broker keeps the last ``history`` events, so a client that reconnects
+with ``Last-Event-ID`` gets exactly what it missed. If the id is no longer
+in the buffer, or comes from an earlier process, the stream starts with a
+``reset`` event instead and the client reloads its list.
+
+Each subscription has a bounded queue. A subscriber that falls more than
+``queue_size`` events behind never slows the publisher down: its backlog is
+replaced with a single ``reset`` and its stream ends.
+
+Everything lives in one process. Several API workers would each see only
+their own writes.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+
+RESET = "reset"
+
+
+@dataclass(frozen=True)
+class Event:
+    id: str
+    seq: int
+    type: str
+    data: Any
+    topics: FrozenSet[str]
+
+
+class TooManySubscribers(RuntimeError):
+    """The broker already serves ``max_subscribers`` streams."""
+
+
+def format_event(event: Event) -> str:
+    """One event in ``text/event-stream`` framing."""
+    data = json.dumps(event.data, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {event.id}\nevent: {event.type}\ndata: {data}\n\n"
+
+
+class Subscription:
+    """One stream's view of the broker: a bounded queue filled from any thread."""
+
+    def __init__(self, broker: "EventBroker", topics: FrozenSet[str], loop: asyncio.AbstractEventLoop):
+        self.broker = broker
+        self.topics = topics
+        self.closed = False
+        self._loop = loop
+        self._queue: "asyncio.Queue[Event]" = asyncio.Queue()
+
+    def _deliver(self, event: Event) -> None:
+        # Вызывается в цикле событий подписчика
+        if self.closed:
+            return
+        if self._queue.qsize() >= self.broker.queue_size:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(self.broker.reset_event())
+            self.closed = True
+            return
+        self._queue.put_nowait(event)
+
+    def push(self, event: Event) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._deliver, event)
+        except RuntimeError:  # цикл подписчика уже закрыт
+            self.closed = True
+
+    async def get(self, timeout: float) -> Optional[Event]:
+        """Next event, or ``None`` if nothing arrived within ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+
+class EventBroker:
+    """Topic-addressed fan-out with a replay buffer; safe to publish from any thread."""
+
+    def __init__(self, history: int = 1000, queue_size: int = 100, max_subscribers: int = 1000):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.epoch = format(time.time_ns(), "x")
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._history: Deque[Event] = deque(maxlen=history)
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._count = 0
+
+    def _reset(self, seq: int) -> Event:
+        return Event(f"{self.epoch}:{seq}", seq, RESET, {}, frozenset())
+
+    def reset_event(self) -> Event:
+        with self._lock:
+            return self._reset(self._seq)
+
+    def publish(self, type: str, data: Any, topics: Iterable[str]) -> Event:
+        topics = frozenset(topics)
+        with self._lock:
+            self._seq += 1
+            event = Event(f"{self.epoch}:{self._seq}", self._seq, type, data, topics)
+            self._history.append(event)
+            targets = {sub for topic in topics for sub in self._subscribers.get(topic, ())}
+        for subscription in targets:
+            subscription.push(event)
+        return event
+
+    def _missed(self, topics: FrozenSet[str], last_event_id: str) -> Optional[List[Event]]:
+        """Buffered events after ``last_event_id``; ``None`` if they cannot be replayed."""
+        epoch, _, seq = last_event_id.partition(":")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        last = int(seq)
+        if last > self._seq:
+            return None
+        if last < self._seq and (not self._history or self._history[0].seq > last + 1):
+            return None  # часть событий уже вытеснена из буфера
+        return [event for event in self._history if event.seq > last and event.topics & topics]
+
+    def subscribe(self, topics: Iterable[str],
+                  last_event_id: Optional[str] = None) -> Tuple[Subscription, List[Event]]:
+        """Open a subscription (inside the running event loop) plus the events to replay first.
+
+        Registration and the replay snapshot happen under one lock, so no
+        event is lost or delivered twice between the two.
+        """
+        topics = frozenset(topics)
+        subscription = Subscription(self, topics, asyncio.get_running_loop())
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise TooManySubscribers(f"{self._count} streams are already open")
+            for topic in topics:
+                self._subscribers.setdefault(topic, set()).add(subscription)
+            self._count += 1
+            if last_event_id is None:
+                replay: List[Event] = []
+            else:
+                missed = self._missed(topics, last_event_id)
+                replay = missed if missed is not None else [self._reset(self._seq)]
+        return subscription, replay
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            removed = False
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers and subscription in subscribers:
+                    subscribers.discard(subscription)
+                    removed = True
+                    if not subscribers:
+                        del self._subscribers[topic]
+            if removed:
+                self._count -= 1
+        subscription.closed = True
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return self._count
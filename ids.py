@@ -0,0 +1,64 @@
+"""Time-ordered primary keys.
+
+Random UUID4 keys land at random places in the primary-key B-tree, so every
+insert touches a different leaf page. :func:`new_id` returns a UUIDv7
+(RFC 9562): a 48-bit millisecond timestamp followed by a 12-bit counter and
+random bits. Consecutive ids sort in creation order, inserts append to the
+right edge of the index, and the string form is still a regular 36-char UUID,
+so existing clients and stored UUID4 ids keep working side by side.
+
+The id is the external key only. Inside the database salons, masters,
+services and appointments have an ``INTEGER PRIMARY KEY`` (``pk``, the rowid),
+and appointments reference their salon, master and service by it (migration
+5 in ``database.py``); the ``appointments_view`` view maps them back to these
+ids. That is what makes the appointment rows and indexes about half the size
+of the TEXT-keyed layout (see ``benchmarks/bench_ids.py``).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+import uuid
+
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def _next_timestamp() -> tuple[int, int]:
+    global _last_ms, _counter
+    with _lock:
+        now = time.time_ns() // 1_000_000
+        if now > _last_ms:
+            _last_ms = now
+            # Случайное начало счётчика, старший бит оставляем под переполнение
+            _counter = int.from_bytes(os.urandom(2), "big") & 0x7FF
+        else:
+            _counter += 1
+            if _counter > 0xFFF:
+                # Счётчик исчерпан в этой миллисекунде: занимаем следующую
+                _last_ms += 1
+                _counter = 0
+        return _last_ms, _counter
+
+
+def uuid7() -> uuid.UUID:
+    """A UUIDv7, monotonic within this process."""
+    ms, counter = _next_timestamp()
+    rand_b = int.from_bytes(os.urandom(8), "big") & 0x3FFF_FFFF_FFFF_FFFF
+    value = (ms & 0xFFFF_FFFF_FFFF) << 80
+    value |= 0x7 << 76 | counter << 64
+    value |= 0b10 << 62 | rand_b
+    return uuid.UUID(int=value)
+
+
+def new_id() -> str:
+    """Primary key for a new row."""
+    return str(uuid7())
+
+
+def id_timestamp_ms(value: str) -> int:
+    """Creation time (Unix ms) encoded in an id produced by :func:`new_id`."""
+    return uuid.UUID(value).int >> 80
@@ -0,0 +1,185 @@
+"""Background jobs of the API process.
+
+Archival moves completed and cancelled appointments older than
+``ARCHIVE_RETENTION_DAYS`` (active ones stay hot at any age) from the hot
+``appointments`` table into ``appointments_archive`` in small batches, so
+indexes and scans on the hot table stay proportional to recent activity.
+The same job compacts the delta-sync change log: entries superseded by a
+later change of the same entity, and entries older than
+``CHANGES_RETENTION_DAYS``.
+
+Database maintenance runs ``PRAGMA optimize``, an incremental vacuum and a
+WAL checkpoint. Its schedule adapts to churn: a pass that found work (free
+pages, a long WAL) halves the delay before the next one, a quiet pass
+doubles it, within ``[interval / 8, interval * 4]``.
+
+The integrity check (``PRAGMA quick_check`` plus ``PRAGMA foreign_key_check``)
+runs every ``DB_INTEGRITY_INTERVAL_SECONDS`` and logs a warning when it finds
+corruption or rows whose parent is gone. The same loop rebuilds the
+per-master occupancy bitmaps from the appointments and repairs any day that
+drifted from them.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+from config import get_settings
+from repository import get_repository
+
+
+logger = logging.getLogger(__name__)
+
+
+def run_archival(retention_days: int, batch_size: int = 500, pause: float = 0.05) -> int:
+    """Archive everything older than the retention horizon; returns rows moved."""
+    before = (date.today() - timedelta(days=retention_days)).isoformat()
+    repo = get_repository()
+    moved = 0
+    while True:
+        batch = repo.archive_appointments(before, batch_size)
+        moved += batch
+        if batch < batch_size:
+            break
+        time.sleep(pause)  # даём место обычным запросам между порциями
+    if moved:
+        logger.info("Archived %s appointments older than %s", moved, before)
+    return moved
+
+
+def run_change_compaction(retention_days: int, batch_size: int = 500, pause: float = 0.05) -> int:
+    """Compact the change log in batches; returns entries removed."""
+    before = (date.today() - timedelta(days=retention_days)).isoformat()
+    repo = get_repository()
+    removed = 0
+    while True:
+        batch = repo.compact_changes(before, batch_size)
+        removed += batch
+        if batch < batch_size:
+            break
+        time.sleep(pause)
+    if removed:
+        logger.info("Compacted %s change log entries (retention horizon %s)", removed, before)
+    return removed
+
+
+async def archival_loop() -> None:
+    settings = get_settings()
+    while True:
+        try:
+            await asyncio.to_thread(
+                run_archival, settings.archive_retention_days, settings.archive_batch_size
+            )
+        except Exception:  # noqa: BLE001 - задача должна переживать сбои
+            logger.exception("Appointment archival failed")
+        try:
+            await asyncio.to_thread(
+                run_change_compaction, settings.changes_retention_days, settings.archive_batch_size
+            )
+        except Exception:  # noqa: BLE001 - задача должна переживать сбои
+            logger.exception("Change log compaction failed")
+        await asyncio.sleep(settings.archive_interval_seconds)
+
+
+# WAL длиннее этого числа кадров (~16 МБ при странице 4 КБ) сбрасываем TRUNCATE
+WAL_TRUNCATE_FRAMES = 4096
+
+last_maintenance_report: Optional[Dict] = None
+
+
+def run_db_maintenance(checkpoint: str = "PASSIVE", vacuum_pages: int = 2000) -> Optional[Dict]:
+    """One maintenance pass; the report is logged and kept in ``last_maintenance_report``."""
+    global last_maintenance_report
+    report = get_repository().maintenance(vacuum_pages=vacuum_pages, checkpoint=checkpoint)
+    if report is not None:
+        last_maintenance_report = report
+        logger.info(
+            "DB maintenance: %.1f ms, reclaimed %s pages, freelist %s, checkpoint %s (%s/%s frames)",
+            report["duration_ms"], report["reclaimed_pages"], report["freelist_count"],
+            report["checkpoint"], report["checkpointed_frames"], report["wal_frames"],
+        )
+    return report
+
+
+def next_maintenance_delay(report: Optional[Dict], current: float, base: float) -> float:
+    """Adaptive delay until the next pass."""
+    if report is None:
+        return base
+    busy = report["reclaimed_pages"] > 0 or report["freelist_count"] > 0 or report["wal_frames"] > WAL_TRUNCATE_FRAMES
+    delay = current / 2 if busy else current * 2
+    return max(base / 8, min(base * 4, delay))
+
+
+def next_checkpoint_mode(report: Optional[Dict]) -> str:
+    if report is not None and report["wal_frames"] > WAL_TRUNCATE_FRAMES:
+        return "TRUNCATE"
+    return "PASSIVE"
+
+
+async def maintenance_loop() -> None:
+    base = float(get_settings().db_maintenance_interval_seconds)
+    delay = base
+    report: Optional[Dict] = None
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            report = await asyncio.to_thread(run_db_maintenance, next_checkpoint_mode(report))
+        except Exception:  # noqa: BLE001 - задача должна переживать сбои
+            logger.exception("Database maintenance failed")
+            report = None
+        delay = next_maintenance_delay(report, delay, base)
+
+
+last_integrity_report: Optional[Dict] = None
+
+
+def run_integrity_check() -> Optional[Dict]:
+    """Run the integrity check; the report is logged and kept in ``last_integrity_report``."""
+    global last_integrity_report
+    report = get_repository().integrity_report()
+    if report is None:
+        return None
+    last_integrity_report = report
+    if report["ok"]:
+        logger.info("DB integrity check passed in %.1f ms", report["duration_ms"])
+    else:
+        logger.warning(
+            "DB integrity check failed: quick_check=%s, foreign key violations=%s",
+            report["quick_check"], report["foreign_key_violations"],
+        )
+    return report
+
+
+last_occupancy_report: Optional[Dict] = None
+
+
+def run_occupancy_check(repair: bool = True) -> Optional[Dict]:
+    """Verify (and repair) occupancy bitmaps; the report is kept in ``last_occupancy_report``."""
+    global last_occupancy_report
+    report = get_repository().rebuild_occupancy(repair)
+    if report is None:
+        return None
+    last_occupancy_report = report
+    if report["mismatched"]:
+        logger.warning(
+            "Occupancy bitmaps: %s of %s days did not match appointments%s",
+            report["mismatched"], report["days"], " (repaired)" if repair else "",
+        )
+    return report
+
+
+async def integrity_loop() -> None:
+    interval = get_settings().db_integrity_interval_seconds
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(run_integrity_check)
+        except Exception:  # noqa: BLE001 - задача должна переживать сбои
+            logger.exception("Database integrity check failed to run")
+        try:
+            await asyncio.to_thread(run_occupancy_check)
+        except Exception:  # noqa: BLE001 - задача должна переживать сбои
+            logger.exception("Occupancy check failed to run")
@@ -0,0 +1,118 @@
+"""Typed row records for masters, services, appointments and salons.
+
+Every record is a ``__slots__`` dataclass: no per-instance ``__dict__``, so a
+list of ten thousand appointments costs a fraction of the same list of
+dicts. :func:`row_factory` builds records straight from the tuples SQLite
+returns, skipping the ``sqlite3.Row`` → ``dict`` round trip; the selected
+columns must come in field order (see ``COLUMNS``). Low-cardinality columns
+listed in ``INTERNED`` (parent ids, status) are passed through
+:func:`sys.intern`, so a long list shares one string object per distinct
+value instead of one per row.
+
+Records also answer ``record["field"]`` and ``record.get("field")``, so code
+that was written against dict rows keeps working while it is migrated to
+attribute access.
+"""
+from __future__ import annotations
+
+import sqlite3
+import sys
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple, Type, TypeVar
+
+
+R = TypeVar("R", bound="Record")
+
+
+class Record:
+    __slots__ = ()
+
+    COLUMNS: Tuple[str, ...] = ()
+    INTERNED: Tuple[str, ...] = ()
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.COLUMNS}
+
+    def copy(self: R) -> R:
+        return type(self)(*(getattr(self, name) for name in self.COLUMNS))
+
+
+def _columns(cls: Type[R]) -> Type[R]:
+    cls.COLUMNS = tuple(f.name for f in fields(cls))
+    return cls
+
+
+@_columns
+@dataclass(slots=True)
+class Salon(Record):
+    id: str
+    name: str
+    owner_id: str
+
+
+@_columns
+@dataclass(slots=True)
+class Master(Record):
+    id: str
+    name: str
+    telegram_id: Optional[str] = None
+
+
+@_columns
+@dataclass(slots=True)
+class Service(Record):
+    id: str
+    name: str
+    price: Optional[float] = None
+    duration: Optional[int] = None
+    description: Optional[str] = None
+
+
+@_columns
+@dataclass(slots=True)
+class Appointment(Record):
+    INTERNED = ("salon_id", "master_id", "service_id", "status")
+
+    id: str
+    salon_id: str
+    master_id: str
+    service_id: str
+    client_id: str
+    datetime: str
+    status: str = "pending"
+
+
+@lru_cache(maxsize=None)
+def row_factory(cls: Type[R]) -> Callable[[sqlite3.Cursor, tuple], R]:
+    """``cursor.row_factory`` producing ``cls`` records from positional rows."""
+    interned = tuple(i for i, name in enumerate(cls.COLUMNS) if name in cls.INTERNED)
+    if not interned:
+        def factory(cursor: sqlite3.Cursor, row: tuple) -> R:
+            return cls(*row)
+        return factory
+
+    intern = sys.intern
+
+    def interning_factory(cursor: sqlite3.Cursor, row: tuple) -> R:
+        values = list(row)
+        for i in interned:
+            if values[i] is not None:
+                values[i] = intern(values[i])
+        return cls(*values)
+    return interning_factory
+
+
+def select_columns(cls: Type[Record], alias: str = "") -> str:
+    """Column list for ``SELECT`` matching the field order of ``cls``."""
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(prefix + name for name in cls.COLUMNS)
@@ -0,0 +1,796 @@
+"""Storage engines behind a common repository interface.
+
+``backend.py`` talks to :func:`get_repository` instead of calling
+``database.py`` directly. Two engines are available, selected by
+``STORAGE_ENGINE``:
+
+* ``sqlite`` — the production engine, a thin adapter over ``database.py``;
+* ``memory`` — dict/sorted-list indexes in process memory, used for
+  microbenchmarks and fast test runs. Nothing is persisted.
+"""
+from __future__ import annotations
+
+import contextlib
+import copy
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from datetime import date, datetime, timedelta
+from typing import Callable, ContextManager, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+import availability
+import catalog_import
+import changes
+import database
+from config import get_settings
+from ids import new_id
+from records import Appointment, Master, Record, Service
+
+
+class Repository(ABC):
+    """Operations on salons, masters, services and appointments.
+
+    Masters, services and appointments come back as :mod:`records`; a salon
+    is a dict of its own columns plus the requested relation lists.
+    """
+
+    @abstractmethod
+    def init(self, seed: bool = True) -> None:
+        """Prepare storage (schema, demo data)."""
+
+    def close(self) -> None:
+        """Release background resources on shutdown."""
+
+    def unit_of_work(self, write: bool = False) -> ContextManager:
+        """Scope in which all calls share one connection/transaction.
+
+        The scope value is ``None`` or has ``submit_commit()``, returning a
+        future to await before leaving the scope when the commit is deferred.
+        """
+        return contextlib.nullcontext()
+
+    def after_commit(self, callback: Callable[[], None]) -> None:
+        """Run ``callback`` once the current unit of work commits (now if none)."""
+        callback()
+
+    def in_snapshot(self) -> bool:
+        """Whether the current unit of work already reads from a snapshot that later commits won't change."""
+        return False
+
+    def maintenance(self, vacuum_pages: int = 2000, checkpoint: str = "PASSIVE") -> Optional[Dict]:
+        """Run one storage maintenance pass; ``None`` if the engine needs none."""
+        return None
+
+    def integrity_report(self) -> Optional[Dict]:
+        """Check storage consistency; ``None`` if the engine has nothing to check."""
+        return None
+
+    def rebuild_occupancy(self, repair: bool = True) -> Optional[Dict]:
+        """Recompute occupancy bitmaps from appointments and compare; ``None`` if none are stored."""
+        return None
+
+    # Салоны
+    @abstractmethod
+    def create_salon(self, name: str, owner_id: str) -> Dict: ...
+
+    @abstractmethod
+    def get_salon_by_id(self, salon_id: str, include: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        """Salon row plus the relations named in ``include`` (all by default)."""
+
+    @abstractmethod
+    def get_owner_salon(self, owner_id: str, include: Optional[Iterable[str]] = None) -> Optional[Dict]: ...
+
+    @abstractmethod
+    def get_owner_salon_id(self, owner_id: str) -> Optional[str]: ...
+
+    @abstractmethod
+    def update_salon(self, salon_id: str, name: Optional[str] = None) -> Optional[Dict]: ...
+
+    @abstractmethod
+    def get_all_salons(self) -> List[Dict]: ...
+
+    # Мастера
+    @abstractmethod
+    def create_master(self, salon_id: str, name: str, telegram_id: Optional[str] = None) -> Master: ...
+
+    @abstractmethod
+    def get_salon_masters(self, salon_id: str) -> List[Master]: ...
+
+    @abstractmethod
+    def update_master(self, master_id: str, name: Optional[str] = None) -> Optional[Master]: ...
+
+    @abstractmethod
+    def delete_master(self, master_id: str) -> bool: ...
+
+    @abstractmethod
+    def get_master_schedules(self, master_ids: List[str]) -> Dict[str, Dict]:
+        """Stored schedule documents by master id; masters without one are absent."""
+
+    @abstractmethod
+    def set_master_schedule(self, master_id: str, rules: Optional[Dict]) -> None:
+        """Replace a master's schedule document; ``None`` restores the default hours."""
+
+    # Услуги
+    @abstractmethod
+    def create_service(self, salon_id: str, name: str, price: Optional[float] = None,
+                       duration: Optional[int] = None, description: Optional[str] = None) -> Service: ...
+
+    @abstractmethod
+    def get_salon_services(self, salon_id: str) -> List[Service]: ...
+
+    @abstractmethod
+    def update_service(self, service_id: str, name: Optional[str] = None, price: Optional[float] = None,
+                       duration: Optional[int] = None, description: Optional[str] = None) -> Optional[Service]: ...
+
+    @abstractmethod
+    def delete_service(self, service_id: str) -> bool: ...
+
+    @abstractmethod
+    def import_catalog(self, salon_id: str, catalog: Dict[str, List[Dict]],
+                       upsert: Optional[str] = None) -> Dict:
+        """Create/update masters and services in one go; nothing is written if a row fails.
+
+        See :mod:`catalog_import` for the matching rules and the result shape.
+        """
+
+    # Записи
+    @abstractmethod
+    def create_appointment(self, salon_id: str, master_id: str, service_id: str,
+                           client_id: str, datetime_str: str, status: str = "pending") -> Appointment: ...
+
+    @abstractmethod
+    def get_salon_appointments(self, salon_id: str, date_from: Optional[str] = None,
+                               date_to: Optional[str] = None, master_id: Optional[str] = None,
+                               status: Optional[str] = None, limit: Optional[int] = None,
+                               offset: int = 0, include_archive: Optional[bool] = None) -> List[Appointment]:
+        """Chronological appointments; ``date_to`` is exclusive."""
+
+    @abstractmethod
+    def iter_salon_appointments(self, salon_id: str, date_from: Optional[str] = None,
+                                date_to: Optional[str] = None, master_id: Optional[str] = None,
+                                status: Optional[str] = None, include_archive: bool = True,
+                                batch_size: int = 1000) -> Iterator[List[Appointment]]:
+        """Chronological appointments in batches, for exports of any size."""
+
+    @abstractmethod
+    def count_salon_appointments(self, salon_id: str, date_from: str, date_to: str) -> Dict[str, int]:
+        """``total`` plus how many fall ``before``/``after`` the window."""
+
+    @abstractmethod
+    def get_occupancy(self, master_ids: List[str], first: date, last: date) -> Dict[str, Dict[date, int]]:
+        """Booked-slot bitmaps (see :mod:`availability`) per master and day of ``first..last``.
+
+        Days without active appointments are absent.
+        """
+
+    @abstractmethod
+    def get_master_appointments(self, master_ids: List[str]) -> List[Appointment]: ...
+
+    @abstractmethod
+    def get_client_appointments(self, client_id: str, date_from: Optional[str] = None,
+                                date_to: Optional[str] = None,
+                                include_archive: Optional[bool] = None) -> List[Appointment]: ...
+
+    @abstractmethod
+    def archive_appointments(self, before: str, batch_size: int = 500) -> int:
+        """Move one batch of completed/cancelled appointments older than ``before`` to cold storage."""
+
+    @abstractmethod
+    def update_appointment(self, appointment_id: str, status: Optional[str] = None) -> Optional[Appointment]: ...
+
+    @abstractmethod
+    def update_appointments_status(self, appointment_ids: List[str], status: str) -> int:
+        """Set ``status`` on all ``appointment_ids`` in one write; returns the count."""
+
+    @abstractmethod
+    def get_appointment_by_id(self, appointment_id: str) -> Optional[Appointment]: ...
+
+    @abstractmethod
+    def get_appointments_by_ids(self, appointment_ids: List[str]) -> List[Appointment]:
+        """Existing appointments among ``appointment_ids``, in no particular order."""
+
+    # Журнал изменений
+    @abstractmethod
+    def get_changes(self, scope: changes.Scope, since: Optional[int], limit: int = 500) -> Dict:
+        """Up to ``limit`` entities of ``scope`` changed after cursor ``since`` (see :mod:`changes`)."""
+
+    @abstractmethod
+    def compact_changes(self, before: str, batch_size: int = 500) -> int:
+        """Drop one batch of superseded change entries and of entries older than ``before``."""
+
+
+class SQLiteRepository(Repository):
+    """Production engine: delegates to the SQL in ``database.py``."""
+
+    def init(self, seed: bool = True) -> None:
+        database.init_db(seed=seed)
+        if get_settings().sqlite_writer_queue:
+            database.start_writer()
+
+    def close(self) -> None:
+        database.stop_writer()
+
+    def unit_of_work(self, write=False):
+        return database.unit_of_work(write)
+
+    def in_snapshot(self):
+        return database.in_snapshot()
+
+    def after_commit(self, callback):
+        database.after_commit(callback)
+
+    def maintenance(self, vacuum_pages=2000, checkpoint="PASSIVE"):
+        return database.run_maintenance(vacuum_pages, checkpoint)
+
+    def integrity_report(self):
+        return database.integrity_report()
+
+    def rebuild_occupancy(self, repair=True):
+        return database.rebuild_occupancy(repair)
+
+    def create_salon(self, name, owner_id):
+        return database.create_salon(name, owner_id)
+
+    def get_salon_by_id(self, salon_id, include=None):
+        return database.get_salon_by_id(salon_id, include)
+
+    def get_owner_salon(self, owner_id, include=None):
+        return database.get_owner_salon(owner_id, include)
+
+    def get_owner_salon_id(self, owner_id):
+        return database.get_owner_salon_id(owner_id)
+
+    def update_salon(self, salon_id, name=None):
+        return database.update_salon(salon_id, name)
+
+    def get_all_salons(self):
+        return database.get_all_salons()
+
+    def create_master(self, salon_id, name, telegram_id=None):
+        return database.create_master(salon_id, name, telegram_id)
+
+    def get_salon_masters(self, salon_id):
+        return database.get_salon_masters(salon_id)
+
+    def update_master(self, master_id, name=None):
+        return database.update_master(master_id, name)
+
+    def delete_master(self, master_id):
+        return database.delete_master(master_id)
+
+    def get_master_schedules(self, master_ids):
+        return database.get_master_schedules(master_ids)
+
+    def set_master_schedule(self, master_id, rules):
+        database.set_master_schedule(master_id, rules)
+
+    def create_service(self, salon_id, name, price=None, duration=None, description=None):
+        return database.create_service(salon_id, name, price, duration, description)
+
+    def get_salon_services(self, salon_id):
+        return database.get_salon_services(salon_id)
+
+    def update_service(self, service_id, name=None, price=None, duration=None, description=None):
+        return database.update_service(service_id, name, price, duration, description)
+
+    def delete_service(self, service_id):
+        return database.delete_service(service_id)
+
+    def import_catalog(self, salon_id, catalog, upsert=None):
+        return database.import_catalog(salon_id, catalog, upsert)
+
+    def create_appointment(self, salon_id, master_id, service_id, client_id, datetime_str, status="pending"):
+        return database.create_appointment(salon_id, master_id, service_id, client_id, datetime_str, status)
+
+    def get_salon_appointments(self, salon_id, date_from=None, date_to=None, master_id=None,
+                               status=None, limit=None, offset=0, include_archive=None):
+        return database.get_salon_appointments(
+            salon_id, date_from, date_to, master_id, status, limit, offset, include_archive
+        )
+
+    def iter_salon_appointments(self, salon_id, date_from=None, date_to=None, master_id=None,
+                                status=None, include_archive=True, batch_size=1000):
+        return database.iter_salon_appointments(
+            salon_id, date_from, date_to, master_id, status, include_archive, batch_size
+        )
+
+    def count_salon_appointments(self, salon_id, date_from, date_to):
+        return database.count_salon_appointments(salon_id, date_from, date_to)
+
+    def get_occupancy(self, master_ids, first, last):
+        return database.get_occupancy(master_ids, first, last)
+
+    def get_master_appointments(self, master_ids):
+        return database.get_master_appointments(master_ids)
+
+    def get_client_appointments(self, client_id, date_from=None, date_to=None, include_archive=None):
+        return database.get_client_appointments(client_id, date_from, date_to, include_archive)
+
+    def archive_appointments(self, before, batch_size=500):
+        return database.archive_appointments(before, batch_size)
+
+    def update_appointment(self, appointment_id, status=None):
+        return database.update_appointment(appointment_id, status)
+
+    def update_appointments_status(self, appointment_ids, status):
+        return database.update_appointments_status(appointment_ids, status)
+
+    def get_appointment_by_id(self, appointment_id):
+        return database.get_appointment_by_id(appointment_id)
+
+    def get_appointments_by_ids(self, appointment_ids):
+        return database.get_appointments_by_ids(appointment_ids)
+
+    def get_changes(self, scope, since, limit=500):
+        return database.get_changes(scope, since, limit)
+
+    def compact_changes(self, before, batch_size=500):
+        return database.compact_changes(before, batch_size)
+
+
+class MemoryRepository(Repository):
+    """Indexed in-memory engine.
+
+    Rows live in ``id -> dict`` tables; secondary indexes map salon, master,
+    client and owner ids to row ids. Appointment indexes are lists of
+    ``(datetime, id)`` kept sorted with :func:`bisect.insort`, so per-salon and
+    per-master reads come back in chronological order without sorting.
+    Callers always receive copies, never the stored rows. The change log is
+    a plain list in ``seq`` order that syncs scan from the end.
+    """
+
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._salons: Dict[str, Dict] = {}
+            self._masters: Dict[str, Dict] = {}
+            self._services: Dict[str, Dict] = {}
+            self._schedules: Dict[str, Dict] = {}
+            self._appointments: Dict[str, Appointment] = {}
+            self._salon_by_owner: Dict[str, str] = {}
+            self._masters_by_salon: Dict[str, List[str]] = {}
+            self._services_by_salon: Dict[str, List[str]] = {}
+            self._appointments_by_salon: Dict[str, List[Tuple[str, str]]] = {}
+            self._appointments_by_master: Dict[str, List[Tuple[str, str]]] = {}
+            self._appointments_by_client: Dict[str, List[Tuple[str, str]]] = {}
+            self._changes: List[changes.Change] = []
+            self._change_seq = 0
+            self._changes_horizon = 0
+
+    def init(self, seed: bool = True) -> None:
+        if not seed:
+            return
+        with self._lock:
+            if self._salons:
+                return
+            salon = self.create_salon("Demo Salon", "seed-owner")
+            master = self.create_master(salon["id"], "Анна", "seed-master")
+            service = self.create_service(salon["id"], "Укладка", 1500, 60, "Быстрая укладка")
+            self.create_appointment(
+                salon["id"], master["id"], service["id"], "seed-client", datetime.now().isoformat()
+            )
+
+    @staticmethod
+    def _project(row: Dict, cls: Type[Record]) -> Record:
+        return cls(*(row[key] for key in cls.COLUMNS))
+
+    def _appointment_rows(self, index: List[Tuple[str, str]]) -> List[Appointment]:
+        return [self._appointments[appointment_id].copy() for _, appointment_id in index]
+
+    @staticmethod
+    def _unindex(index: Dict[str, List[Tuple[str, str]]], key: str, entry: Tuple[str, str]) -> None:
+        entries = index.get(key)
+        if entries and entry in entries:
+            entries.remove(entry)
+
+    def _log(self, entity: str, entity_id: str, salon_id: str,
+             master_id: Optional[str] = None, client_id: Optional[str] = None) -> None:
+        self._change_seq += 1
+        self._changes.append(changes.Change(
+            self._change_seq, entity, entity_id, salon_id, master_id, client_id,
+            datetime.now().isoformat(timespec="seconds"),
+        ))
+
+    def _log_appointment(self, row: Appointment) -> None:
+        self._log("appointment", row.id, row.salon_id, row.master_id, row.client_id)
+
+    def _drop_appointment(self, appointment_id: str) -> None:
+        self._log_appointment(self._appointments[appointment_id])
+        row = self._appointments.pop(appointment_id)
+        entry = (row.datetime, appointment_id)
+        self._unindex(self._appointments_by_salon, row.salon_id, entry)
+        self._unindex(self._appointments_by_master, row.master_id, entry)
+        self._unindex(self._appointments_by_client, row.client_id, entry)
+
+    # Салоны
+    def create_salon(self, name, owner_id):
+        salon_id = new_id()
+        with self._lock:
+            self._salons[salon_id] = {"id": salon_id, "name": name, "owner_id": owner_id}
+            self._salon_by_owner.setdefault(owner_id, salon_id)
+            self._masters_by_salon[salon_id] = []
+            self._services_by_salon[salon_id] = []
+            self._appointments_by_salon[salon_id] = []
+            self._log("salon", salon_id, salon_id)
+        return self.get_salon_by_id(salon_id)
+
+    def get_salon_by_id(self, salon_id, include=None):
+        with self._lock:
+            row = self._salons.get(salon_id)
+            if not row:
+                return None
+            salon = dict(row)
+            relations = database.SALON_RELATIONS if include is None else set(include)
+            if "masters" in relations:
+                salon["masters"] = self.get_salon_masters(salon_id)
+            if "services" in relations:
+                salon["services"] = self.get_salon_services(salon_id)
+            if "appointments" in relations:
+                salon["appointments"] = self.get_salon_appointments(salon_id)
+            return salon
+
+    def get_owner_salon(self, owner_id, include=None):
+        with self._lock:
+            salon_id = self._salon_by_owner.get(owner_id)
+            return self.get_salon_by_id(salon_id, include) if salon_id else None
+
+    def get_owner_salon_id(self, owner_id):
+        return self._salon_by_owner.get(owner_id)
+
+    def update_salon(self, salon_id, name=None):
+        with self._lock:
+            if name and salon_id in self._salons:
+                self._salons[salon_id]["name"] = name
+                self._log("salon", salon_id, salon_id)
+            return self.get_salon_by_id(salon_id)
+
+    def get_all_salons(self):
+        with self._lock:
+            return [
+                {
+                    "id": row["id"],
+                    "name": row["name"],
+                    "masters_count": len(self._masters_by_salon.get(row["id"], ())),
+                    "services_count": len(self._services_by_salon.get(row["id"], ())),
+                }
+                for row in self._salons.values()
+            ]
+
+    # Мастера
+    def create_master(self, salon_id, name, telegram_id=None):
+        master_id = new_id()
+        with self._lock:
+            self._masters[master_id] = {
+                "id": master_id, "salon_id": salon_id, "name": name, "telegram_id": telegram_id,
+            }
+            self._masters_by_salon.setdefault(salon_id, []).append(master_id)
+            self._log("master", master_id, salon_id, master_id)
+        return Master(master_id, name, telegram_id)
+
+    def get_salon_masters(self, salon_id):
+        with self._lock:
+            return [
+                self._project(self._masters[master_id], Master)
+                for master_id in self._masters_by_salon.get(salon_id, ())
+            ]
+
+    def update_master(self, master_id, name=None):
+        with self._lock:
+            row = self._masters.get(master_id)
+            if not row:
+                return None
+            if name:
+                row["name"] = name
+                self._log("master", master_id, row["salon_id"], master_id)
+            return self._project(row, Master)
+
+    def delete_master(self, master_id):
+        with self._lock:
+            row = self._masters.pop(master_id, None)
+            if not row:
+                return False
+            self._masters_by_salon[row["salon_id"]].remove(master_id)
+            self._schedules.pop(master_id, None)
+            for _, appointment_id in list(self._appointments_by_master.pop(master_id, ())):
+                self._drop_appointment(appointment_id)
+            self._log("master", master_id, row["salon_id"], master_id)
+            return True
+
+    def get_master_schedules(self, master_ids):
+        with self._lock:
+            return {
+                master_id: copy.deepcopy(self._schedules[master_id])
+                for master_id in master_ids
+                if master_id in self._schedules
+            }
+
+    def set_master_schedule(self, master_id, rules):
+        with self._lock:
+            master = self._masters.get(master_id)
+            if master is None:
+                return
+            if rules is None:
+                self._schedules.pop(master_id, None)
+            else:
+                self._schedules[master_id] = copy.deepcopy(rules)
+            self._log("schedule", master_id, master["salon_id"], master_id)
+
+    # Услуги
+    def create_service(self, salon_id, name, price=None, duration=None, description=None):
+        service_id = new_id()
+        row = {
+            "id": service_id, "salon_id": salon_id, "name": name,
+            "price": price, "duration": duration, "description": description,
+        }
+        with self._lock:
+            self._services[service_id] = row
+            self._services_by_salon.setdefault(salon_id, []).append(service_id)
+            self._log("service", service_id, salon_id)
+        return self._project(row, Service)
+
+    def get_salon_services(self, salon_id):
+        with self._lock:
+            return [
+                self._project(self._services[service_id], Service)
+                for service_id in self._services_by_salon.get(salon_id, ())
+            ]
+
+    def update_service(self, service_id, name=None, price=None, duration=None, description=None):
+        with self._lock:
+            row = self._services.get(service_id)
+            if not row:
+                return None
+            for key, value in (("name", name), ("price", price),
+                               ("duration", duration), ("description", description)):
+                if value is not None:
+                    row[key] = value
+            self._log("service", service_id, row["salon_id"])
+            return self._project(row, Service)
+
+    def delete_service(self, service_id):
+        with self._lock:
+            row = self._services.pop(service_id, None)
+            if not row:
+                return False
+            self._services_by_salon[row["salon_id"]].remove(service_id)
+            orphaned = [
+                appointment_id
+                for _, appointment_id in self._appointments_by_salon.get(row["salon_id"], ())
+                if self._appointments[appointment_id].service_id == service_id
+            ]
+            for appointment_id in orphaned:
+                self._drop_appointment(appointment_id)
+            self._log("service", service_id, row["salon_id"])
+            return True
+
+    def import_catalog(self, salon_id, catalog, upsert=None):
+        tables = {"masters": (self._masters, self._masters_by_salon),
+                  "services": (self._services, self._services_by_salon)}
+        with self._lock:
+            plans = {}
+            for kind, (rows, by_salon) in tables.items():
+                existing = [
+                    (row_id, rows[row_id]["name"], rows[row_id].get("external_id"))
+                    for row_id in by_salon.get(salon_id, ())
+                ]
+                plans[kind] = catalog_import.plan(kind, catalog.get(kind, []), existing, upsert)
+            result = catalog_import.summary({kind: plans[kind][0] for kind in catalog_import.KINDS})
+            if result["errors"]:
+                return result
+
+            for kind, (_, inserts, updates) in plans.items():
+                rows, by_salon = tables[kind]
+                fields = catalog_import.FIELDS[kind]
+                for row_id, *params in inserts:
+                    rows[row_id] = {"id": row_id, "salon_id": salon_id, **dict(zip(fields, params))}
+                    by_salon.setdefault(salon_id, []).append(row_id)
+                for row_id, *params in updates:
+                    row = rows[row_id]
+                    for field, value in zip(fields, params):
+                        if value is not None:
+                            row[field] = value
+                entity = "master" if kind == "masters" else "service"
+                for row_id, *_ in [*inserts, *updates]:
+                    self._log(entity, row_id, salon_id, row_id if entity == "master" else None)
+            return result
+
+    # Записи
+    def create_appointment(self, salon_id, master_id, service_id, client_id, datetime_str, status="pending"):
+        appointment_id = new_id()
+        row = Appointment(appointment_id, salon_id, master_id, service_id, client_id, datetime_str, status)
+        entry = (datetime_str, appointment_id)
+        with self._lock:
+            self._appointments[appointment_id] = row
+            insort(self._appointments_by_salon.setdefault(salon_id, []), entry)
+            insort(self._appointments_by_master.setdefault(master_id, []), entry)
+            insort(self._appointments_by_client.setdefault(client_id, []), entry)
+            self._log_appointment(row)
+        return row.copy()
+
+    def get_salon_appointments(self, salon_id, date_from=None, date_to=None, master_id=None,
+                               status=None, limit=None, offset=0, include_archive=None):
+        with self._lock:
+            index = self._appointments_by_salon.get(salon_id, [])
+            lo = bisect_left(index, (date_from,)) if date_from else 0
+            hi = bisect_left(index, (date_to,)) if date_to else len(index)
+            rows = [
+                row.copy()
+                for row in (self._appointments[appointment_id] for _, appointment_id in index[lo:hi])
+                if (not master_id or row.master_id == master_id)
+                and (not status or row.status == status)
+            ]
+            if limit is not None:
+                rows = rows[offset:offset + limit]
+            return rows
+
+    def iter_salon_appointments(self, salon_id, date_from=None, date_to=None, master_id=None,
+                                status=None, include_archive=True, batch_size=1000):
+        with self._lock:
+            index = self._appointments_by_salon.get(salon_id, [])
+            lo = bisect_left(index, (date_from,)) if date_from else 0
+            hi = bisect_left(index, (date_to,)) if date_to else len(index)
+            entries = index[lo:hi]
+        for start in range(0, len(entries), batch_size):
+            with self._lock:
+                batch = [self._appointments.get(appointment_id) for _, appointment_id in
+                         entries[start:start + batch_size]]
+                rows = [
+                    row.copy()
+                    for row in batch
+                    if row is not None  # удалена после начала выгрузки
+                    and (not master_id or row.master_id == master_id)
+                    and (not status or row.status == status)
+                ]
+            if rows:
+                yield rows
+
+    def count_salon_appointments(self, salon_id, date_from, date_to):
+        with self._lock:
+            index = self._appointments_by_salon.get(salon_id, [])
+            before = bisect_left(index, (date_from,))
+            after = len(index) - bisect_left(index, (date_to,))
+            return {"total": len(index), "before": before, "after": after}
+
+    def get_occupancy(self, master_ids, first, last):
+        # Маски считаются по отсортированному индексу мастера, отдельно не хранятся
+        date_from, date_to = availability.booking_window(first, last)
+        days = [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+        occupancy = {}
+        with self._lock:
+            for master_id in master_ids:
+                index = self._appointments_by_master.get(master_id, [])
+                window = index[bisect_left(index, (date_from,)):bisect_left(index, (date_to,))]
+                bookings = availability.group_bookings(
+                    (master_id, value) for value, appointment_id in window
+                    if self._appointments[appointment_id].status not in availability.INACTIVE_STATUSES
+                )
+                masks = availability.occupancy_masks(days, bookings.get(master_id, {}))
+                if masks:
+                    occupancy[master_id] = masks
+        return occupancy
+
+    def get_master_appointments(self, master_ids):
+        with self._lock:
+            rows: List[Appointment] = []
+            for master_id in dict.fromkeys(master_ids):
+                rows.extend(self._appointment_rows(self._appointments_by_master.get(master_id, ())))
+            return rows
+
+    def get_client_appointments(self, client_id, date_from=None, date_to=None, include_archive=None):
+        with self._lock:
+            index = self._appointments_by_client.get(client_id, [])
+            lo = bisect_left(index, (date_from,)) if date_from else 0
+            hi = bisect_left(index, (date_to,)) if date_to else len(index)
+            return self._appointment_rows(index[lo:hi])
+
+    def archive_appointments(self, before, batch_size=500):
+        # Всё и так в памяти: холодного хранилища нет, переносить нечего
+        return 0
+
+    def update_appointment(self, appointment_id, status=None):
+        with self._lock:
+            row = self._appointments.get(appointment_id)
+            if not row:
+                return None
+            if status:
+                row.status = status
+                self._log_appointment(row)
+            return row.copy()
+
+    def update_appointments_status(self, appointment_ids, status):
+        with self._lock:
+            rows = [self._appointments[i] for i in appointment_ids if i in self._appointments]
+            for row in rows:
+                row.status = status
+                self._log_appointment(row)
+            return len(rows)
+
+    def get_appointment_by_id(self, appointment_id):
+        with self._lock:
+            row = self._appointments.get(appointment_id)
+            return row.copy() if row else None
+
+    def get_appointments_by_ids(self, appointment_ids):
+        with self._lock:
+            return [
+                self._appointments[appointment_id].copy()
+                for appointment_id in appointment_ids
+                if appointment_id in self._appointments
+            ]
+
+    def _current_entities(self, entity: str, ids: List[str]) -> Dict:
+        if entity == "salon":
+            return {i: {"id": i, "name": self._salons[i]["name"]} for i in ids if i in self._salons}
+        if entity == "master":
+            return {i: self._project(self._masters[i], Master) for i in ids if i in self._masters}
+        if entity == "service":
+            return {i: self._project(self._services[i], Service) for i in ids if i in self._services}
+        if entity == "schedule":
+            return {i: copy.deepcopy(self._schedules.get(i)) for i in ids if i in self._masters}
+        return {i: self._appointments[i].copy() for i in ids if i in self._appointments}
+
+    def get_changes(self, scope, since, limit=500):
+        with self._lock:
+            if changes.needs_reset(since, self._changes_horizon, self._change_seq):
+                return changes.result(self._change_seq, reset=True)
+            # С конца журнала: первая встреченная запись сущности — последняя по seq
+            latest = {}
+            for change in reversed(self._changes):
+                if change.seq <= since:
+                    break
+                key = (change.entity, change.entity_id)
+                if key not in latest and scope.matches(change):
+                    latest[key] = change.seq
+            rows = sorted(((*key, seq) for key, seq in latest.items()), key=lambda row: row[2])
+            page, ids = changes.paginate(rows[:limit + 1], since, limit)
+            for entity, entity_ids in ids.items():
+                changes.fill(page, entity, entity_ids, self._current_entities(entity, entity_ids))
+            return page
+
+    def compact_changes(self, before, batch_size=500):
+        with self._lock:
+            newest = {(change.entity, change.entity_id): change.seq for change in self._changes}
+            kept = []
+            removed = 0
+            for change in self._changes:
+                superseded = newest[(change.entity, change.entity_id)] != change.seq
+                if removed < batch_size and (superseded or change.changed_at < before):
+                    removed += 1
+                    if not superseded:
+                        self._changes_horizon = max(self._changes_horizon, change.seq)
+                    continue
+                kept.append(change)
+            self._changes = kept
+            return removed
+
+ENGINES = {
+    "sqlite": SQLiteRepository,
+    "memory": MemoryRepository,
+}
+
+_repository: Optional[Repository] = None
+
+
+def create_repository(engine: str) -> Repository:
+    try:
+        return ENGINES[engine]()
+    except KeyError:
+        raise ValueError(f"Unknown STORAGE_ENGINE '{engine}'. Allowed: {sorted(ENGINES)}") from None
+
+
+def get_repository() -> Repository:
+    """Process-wide repository, created from ``STORAGE_ENGINE`` on first use."""
+    global _repository
+    if _repository is None:
+        _repository = create_repository(get_settings().storage_engine)
+    return _repository
+
+
+def set_repository(repository: Optional[Repository]) -> None:
+    """Swap the active repository (tests, benchmarks); ``None`` resets it."""
+    global _repository
+    _repository = repository
@@ -10,7 +10,7 @@ import uvicorn
 from backend import app
 from bot import start_bot, shutdown_bot
 from config import get_settings
-from database import init_db
+from repository import get_repository
 
 
 logger = logging.getLogger(__name__)
@@ -26,7 +26,7 @@ async def main():
     logger.info("Starting services on %s:%s", settings.host, settings.port)
 
     # Ensure DB schema exists before serving requests
-    init_db()
+    get_repository().init()
 
     server_config = uvicorn.Config(
         app,
@@ -0,0 +1,153 @@
+"""Master working schedules: weekly template, breaks and date exceptions.
+
+A schedule is stored and exchanged as a plain document::
+
+    {
+        "weekly": {"mon": [["09:00", "18:00"]], ...},      # missing day = day off
+        "breaks": [{"start": "13:00", "end": "14:00", "days": ["mon", "tue"]}],
+        "exceptions": [{"date_from": "2030-01-01", "date_to": "2030-01-07", "intervals": []}],
+    }
+
+A break without ``days`` applies to every weekday. An exception replaces
+the hours of every date in ``date_from..date_to`` (inclusive): no intervals
+means a day off (vacation, sick day), otherwise the listed hours are worked
+as given, without the weekly breaks.
+
+:func:`compile_schedule` evaluates the rules once: breaks are subtracted
+from the weekly hours and exceptions are expanded to single dates, each day
+kept as a sorted tuple of ``(start_minute, end_minute)`` intervals plus its
+slot bitmap (see :mod:`availability`). A request then only looks the day
+up. Compiled schedules are kept in a :class:`serialization.GenerationCache`
+until the master's schedule is edited.
+"""
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import availability
+
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+MAX_EXCEPTION_DAYS = 366
+
+Interval = Tuple[int, int]
+Intervals = Tuple[Interval, ...]
+
+# Часы мастера, для которого расписание не задано
+DEFAULT_SCHEDULE: Dict[str, Any] = {
+    "weekly": {day: [["09:00", "18:00"]] for day in WEEKDAYS},
+    "breaks": [],
+    "exceptions": [],
+}
+
+
+class ScheduleError(ValueError):
+    """The schedule document is malformed or contradicts itself."""
+
+
+def parse_minute(value: str) -> int:
+    """``"HH:MM"`` -> minutes after midnight; ``"24:00"`` is the end of the day."""
+    try:
+        hours, minutes = value.split(":")
+        hour, minute = int(hours), int(minutes)
+    except (ValueError, AttributeError):
+        raise ScheduleError(f"invalid time '{value}', expected HH:MM") from None
+    if not (0 <= minute < 60 and (0 <= hour < 24 or (hour, minute) == (24, 0))):
+        raise ScheduleError(f"invalid time '{value}', expected HH:MM")
+    return hour * 60 + minute
+
+
+def parse_intervals(pairs: Iterable[Iterable[str]]) -> Intervals:
+    """``[["09:00", "13:00"], ...]`` -> sorted, merged minute intervals."""
+    intervals = []
+    for pair in pairs:
+        start, end = (parse_minute(value) for value in pair)
+        if start >= end:
+            raise ScheduleError(f"interval {list(pair)} ends before it starts")
+        intervals.append((start, end))
+    return merge(intervals)
+
+
+def merge(intervals: Iterable[Interval]) -> Intervals:
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return tuple(merged)
+
+
+def subtract(intervals: Intervals, cut: Interval) -> Intervals:
+    """``intervals`` minus the ``cut`` interval."""
+    cut_start, cut_end = cut
+    result = []
+    for start, end in intervals:
+        if start < cut_start:
+            result.append((start, min(end, cut_start)))
+        if end > cut_end:
+            result.append((max(start, cut_end), end))
+    return tuple(result)
+
+
+def _weekdays(names: Optional[Iterable[str]]) -> List[int]:
+    if names is None:
+        return list(range(7))
+    try:
+        return [WEEKDAYS.index(name) for name in names]
+    except ValueError:
+        raise ScheduleError(f"unknown weekday in {list(names)}, expected {list(WEEKDAYS)}") from None
+
+
+class CompiledSchedule:
+    """Per-day working intervals and slot bitmaps of one master."""
+
+    __slots__ = ("weekly", "exceptions", "_weekly_masks", "_exception_masks")
+
+    def __init__(self, weekly: Tuple[Intervals, ...], exceptions: Dict[date, Intervals]):
+        self.weekly = weekly
+        self.exceptions = exceptions
+        self._weekly_masks = tuple(availability.intervals_mask(day) for day in weekly)
+        self._exception_masks = {day: availability.intervals_mask(hours) for day, hours in exceptions.items()}
+
+    def intervals(self, day: date) -> Intervals:
+        hours = self.exceptions.get(day)
+        return self.weekly[day.weekday()] if hours is None else hours
+
+    def mask(self, day: date) -> int:
+        """Working slots of ``day`` (bit ``i`` = slot ``i`` of the availability grid)."""
+        mask = self._exception_masks.get(day)
+        return self._weekly_masks[day.weekday()] if mask is None else mask
+
+
+def compile_schedule(document: Dict[str, Any]) -> CompiledSchedule:
+    """Evaluate a schedule document; raises :class:`ScheduleError` if it is invalid."""
+    weekly_rules = document.get("weekly") or {}
+    unknown = set(weekly_rules) - set(WEEKDAYS)
+    if unknown:
+        raise ScheduleError(f"unknown weekday(s) {sorted(unknown)}, expected {list(WEEKDAYS)}")
+    weekly = [parse_intervals(weekly_rules.get(name, ())) for name in WEEKDAYS]
+
+    for rule in document.get("breaks") or ():
+        cut = parse_intervals([(rule["start"], rule["end"])])[0]
+        for weekday in _weekdays(rule.get("days")):
+            weekly[weekday] = subtract(weekly[weekday], cut)
+
+    exceptions: Dict[date, Intervals] = {}
+    for rule in document.get("exceptions") or ():
+        try:
+            first = date.fromisoformat(rule["date_from"])
+            last = date.fromisoformat(rule.get("date_to") or rule["date_from"])
+        except ValueError:
+            raise ScheduleError(f"invalid exception dates {rule}, expected YYYY-MM-DD") from None
+        if not 0 <= (last - first).days < MAX_EXCEPTION_DAYS:
+            raise ScheduleError(f"exception {first}..{last} must span 1 to {MAX_EXCEPTION_DAYS} days")
+        hours = parse_intervals(rule.get("intervals") or ())
+        for offset in range((last - first).days + 1):
+            exceptions[first + timedelta(days=offset)] = hours
+
+    return CompiledSchedule(tuple(weekly), exceptions)
+
+
+DEFAULT = compile_schedule(DEFAULT_SCHEDULE)
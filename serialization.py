@@ -0,0 +1,362 @@
+"""JSON responses encoded straight from row records.
+
+FastAPI normally passes a handler's return value through ``jsonable_encoder``,
+which walks every value in Python (and deep-copies dataclasses via
+``asdict``) before ``json.dumps`` runs. For a list of ten thousand
+appointments that walk costs an order of magnitude more than the encoding.
+
+:func:`encode` writes JSON text directly:
+
+* lists of :class:`records.Record` are encoded column-wise: each column goes
+  through the C string encoder with ``map`` and rows are stitched together
+  with a per-class ``%`` template, without a dict per row;
+* :class:`Fragment` values are pre-encoded JSON inserted verbatim, so
+  immutable pieces such as a salon's service catalog are encoded once and
+  served from :class:`FragmentCache`;
+* everything else (dicts, lists, scalars) goes through ``json.dumps``.
+
+:class:`RecordRoute` makes every route of the app return its result through
+:class:`RecordJSONResponse` and tags ``GET`` responses with an ``ETag``,
+answering a matching ``If-None-Match`` with ``304``. Each route still
+declares a ``response_model``, which documents the contract in OpenAPI and
+is checked against real responses in the tests. It is not re-validated on
+every request, but it still filters: :func:`project` drops the keys and
+record columns the model does not declare, using field sets computed once
+per model. A record list whose columns are all declared is encoded as is.
+"""
+from __future__ import annotations
+
+import csv
+import functools
+import hashlib
+import inspect
+import io
+import json
+import threading
+import types
+from collections import OrderedDict
+from dataclasses import fields
+from json.encoder import encode_basestring
+from operator import attrgetter
+from typing import (
+    Any, Awaitable, Callable, Dict, FrozenSet, Hashable, Iterator, Optional, Sequence, Tuple, Type, Union,
+    get_args, get_origin,
+)
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from starlette.requests import Request
+from pydantic import BaseModel
+from starlette.responses import Response
+
+from records import Record
+
+
+class Fragment(str):
+    """Already encoded JSON, embedded as is by :func:`encode`."""
+
+    __slots__ = ()
+
+
+def _encode_value(value: Any) -> str:
+    if value.__class__ is str:
+        return encode_basestring(value)
+    if value is None:
+        return "null"
+    return _dumps(value)
+
+
+@functools.lru_cache(maxsize=None)
+def _record_layout(cls: Type[Record], names: Tuple[str, ...]) -> Tuple[str, Tuple[Tuple[Callable, Callable], ...]]:
+    template = "{" + ",".join(f"{encode_basestring(name)}:%s" for name in names) + "}"
+    # Поля, объявленные как str, не бывают None: их кодирует C-функция напрямую
+    declared = {f.name: f.type for f in fields(cls)}
+    columns = tuple(
+        (attrgetter(name), encode_basestring if declared[name] in ("str", str) else _encode_value)
+        for name in names
+    )
+    return template, columns
+
+
+def _encoded_rows(rows: Sequence[Record], names: Optional[Tuple[str, ...]] = None) -> Iterator[str]:
+    cls = type(rows[0])
+    template, columns = _record_layout(cls, names or cls.COLUMNS)
+    encoded = [map(encode, map(get, rows)) for get, encode in columns]
+    return map(template.__mod__, zip(*encoded))
+
+
+def encode_records(rows: Sequence[Record], names: Optional[Tuple[str, ...]] = None) -> str:
+    """JSON array of records of one class; ``names`` picks a subset of ``COLUMNS``."""
+    if not rows:
+        return "[]"
+    return "[" + ",".join(_encoded_rows(rows, names)) + "]"
+
+
+def encode_ndjson(rows: Sequence[Record]) -> str:
+    """One JSON object per line (NDJSON), each line terminated by ``\\n``."""
+    if not rows:
+        return ""
+    return "\n".join(_encoded_rows(rows)) + "\n"
+
+
+def encode_csv(rows: Sequence[Record]) -> str:
+    """CSV lines of records, columns in ``COLUMNS`` order."""
+    if not rows:
+        return ""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(map(attrgetter(*rows[0].COLUMNS), rows))
+    return buffer.getvalue()
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+_dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_default).encode
+
+
+def _is_record_list(value: Any) -> bool:
+    return isinstance(value, list) and bool(value) and isinstance(value[0], Record) \
+        and all(row.__class__ is value[0].__class__ for row in value)
+
+
+def _has_fast_parts(value: Any) -> bool:
+    if isinstance(value, (Fragment, Record)) or _is_record_list(value):
+        return True
+    if isinstance(value, dict):
+        return any(_has_fast_parts(item) for item in value.values())
+    return False
+
+
+def encode_text(value: Any) -> str:
+    if isinstance(value, Fragment):
+        return value
+    if isinstance(value, Record):
+        return encode_records([value])[1:-1]
+    if _is_record_list(value):
+        return encode_records(value)
+    if isinstance(value, dict) and _has_fast_parts(value):
+        return "{" + ",".join(
+            f"{encode_basestring(str(key))}:{encode_text(item)}" for key, item in value.items()
+        ) + "}"
+    return _dumps(value)
+
+
+def encode(value: Any) -> bytes:
+    """Encode a handler result (dicts, lists, records, fragments) to UTF-8 JSON."""
+    return encode_text(value).encode("utf-8")
+
+
+class _Model:
+    """Keys a response model declares, each with the shape of its value (``None``: kept as is)."""
+
+    __slots__ = ("fields", "names")
+
+    def __init__(self, fields: Dict[str, Any]):
+        self.fields = fields
+        self.names: FrozenSet[str] = frozenset(fields)
+
+
+class _Items:
+    __slots__ = ("item",)
+
+    def __init__(self, item: Any):
+        self.item = item
+
+
+class _Values:
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+
+@functools.lru_cache(maxsize=None)
+def response_shape(annotation: Any) -> Any:
+    """What :func:`project` keeps of a value declared as ``annotation``; ``None`` keeps everything."""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return _Model({name: response_shape(field.annotation) for name, field in annotation.model_fields.items()})
+    origin, args = get_origin(annotation), get_args(annotation)
+    if origin is list and args:
+        item = response_shape(args[0])
+        return None if item is None else _Items(item)
+    if origin is dict and len(args) == 2:
+        value = response_shape(args[1])
+        return None if value is None else _Values(value)
+    if origin in (Union, types.UnionType):
+        declared = [arg for arg in args if arg is not type(None)]
+        return response_shape(declared[0]) if len(declared) == 1 else None
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _kept_columns(cls: Type[Record], names: FrozenSet[str]) -> Tuple[str, ...]:
+    return tuple(name for name in cls.COLUMNS if name in names)
+
+
+def _project_records(rows: Sequence[Record], shape: Any) -> Any:
+    if not isinstance(shape, _Model):
+        return rows
+    kept = _kept_columns(type(rows[0]), shape.names)
+    if len(kept) == len(rows[0].COLUMNS):
+        return rows
+    # Столбцы, которых нет в модели, не попадают в ответ: кодируем подмножество сразу
+    return Fragment(encode_records(rows, kept))
+
+
+def project(value: Any, shape: Any) -> Any:
+    """Drop from ``value`` what ``shape`` (see :func:`response_shape`) does not declare.
+
+    Fragments are embedded verbatim: they are cached already in their
+    public form.
+    """
+    if shape is None or value is None or isinstance(value, Fragment):
+        return value
+    if isinstance(shape, _Items):
+        if _is_record_list(value):
+            return _project_records(value, shape.item)
+        return [project(item, shape.item) for item in value] if isinstance(value, list) else value
+    if isinstance(shape, _Values):
+        return {key: project(item, shape.value) for key, item in value.items()} if isinstance(value, dict) else value
+    if isinstance(value, Record):
+        projected = _project_records([value], shape)
+        return value if isinstance(projected, list) else Fragment(projected[1:-1])
+    if isinstance(value, dict):
+        declared = shape.fields
+        return {key: project(item, declared[key]) for key, item in value.items() if key in declared}
+    return value
+
+
+class RecordJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return encode(content)
+
+
+class RecordRoute(APIRoute):
+    """Route whose handler result is encoded by :func:`encode`, bypassing ``jsonable_encoder``.
+
+    The result is still cut down to the route's ``response_model`` by :func:`project`.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        status_code = kwargs.get("status_code") or 200
+
+        def respond(result: Any) -> Response:
+            if isinstance(result, Response):
+                return result
+            return RecordJSONResponse(project(result, self.shape), status_code=status_code)
+
+        if inspect.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def target(*args: Any, **kw: Any) -> Response:
+                return respond(await endpoint(*args, **kw))
+        else:
+            @functools.wraps(endpoint)
+            def target(*args: Any, **kw: Any) -> Response:
+                return respond(endpoint(*args, **kw))
+
+        super().__init__(path, target, **kwargs)
+        self.shape = response_shape(self.response_model)
+
+    def get_route_handler(self) -> Callable[[Request], Awaitable[Response]]:
+        handler = super().get_route_handler()
+
+        async def conditional_handler(request: Request) -> Response:
+            response = await handler(request)
+            if request.method in ("GET", "HEAD") and isinstance(response, RecordJSONResponse):
+                return with_etag(request, response)
+            return response
+
+        return conditional_handler
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def with_etag(request: Request, response: Response) -> Response:
+    """Add an ``ETag`` to a successful response; ``304`` if the client already has it.
+
+    The tag is a hash of the encoded body, so it changes exactly when the
+    payload does. ``Vary: X-User-Id`` keeps caches from sharing per-user
+    payloads.
+    """
+    if not 200 <= response.status_code < 300:
+        return response
+    etag = etag_for(response.body)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "X-User-Id"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and {"*", etag} & {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return response
+
+
+class GenerationCache:
+    """Small LRU with generation-checked writes.
+
+    A reader takes :meth:`generation` *before* it reads the data it is going
+    to cache and passes it to :meth:`put`; if the key was invalidated in
+    between (a write committed meanwhile), the stale value is dropped
+    instead of cached. A generation is an ``(epoch, counter)`` pair:
+    :meth:`clear` moves to a new epoch, so it also outdates generations
+    taken for keys that were not cached at the time.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._generations: Dict[Hashable, int] = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self, key: Hashable) -> Tuple[int, int]:
+        with self._lock:
+            return self._epoch, self._generations.get(key, 0)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def prepare(self, value: Any) -> Any:
+        """Turn a freshly built value into what is cached and returned."""
+        return value
+
+    def put(self, key: Hashable, generation: Tuple[int, int], value: Any) -> Any:
+        value = self.prepare(value)
+        with self._lock:
+            if (self._epoch, self._generations.get(key, 0)) == generation:
+                self._items[key] = value
+                self._items.move_to_end(key)
+                while len(self._items) > self.maxsize:
+                    self._items.popitem(last=False)
+        return value
+
+    def invalidate(self, *keys: Hashable) -> None:
+        with self._lock:
+            for key in keys:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._generations.clear()
+            self._items.clear()
+
+
+class FragmentCache(GenerationCache):
+    """:class:`GenerationCache` of pre-encoded JSON; :meth:`put` encodes plain values."""
+
+    def prepare(self, value: Any) -> Fragment:
+        return value if isinstance(value, Fragment) else Fragment(encode_text(value))
@@ -7,7 +7,7 @@ from backend import app
 
 client = TestClient(app)
 
-# Тестовые данные
+# Тестовые данные (владелец и мастер — те же, что у фикстур salon/master в conftest.py)
 TEST_USER_ID = "12345"
 TEST_USER_ID_2 = "67890"
 TEST_MASTER_TELEGRAM_ID = "99999"
@@ -38,7 +38,7 @@ class TestOwnerAPI:
         assert data["services"] == []
         assert data["appointments"] == []
 
-    def test_create_salon_duplicate(self):
+    def test_create_salon_duplicate(self, salon):
         """Повторное создание салона → 400"""
         response = client.post(
             "/api/owner/salon",
@@ -56,7 +56,7 @@ class TestOwnerAPI:
         )
         assert response.status_code == 404
 
-    def test_get_salon_success(self):
+    def test_get_salon_success(self, salon):
         """Получение салона владельцем → 200"""
         response = client.get(
             "/api/owner/salon",
@@ -75,7 +75,7 @@ class TestOwnerAPI:
         )
         assert response.status_code == 404
 
-    def test_add_master_success(self):
+    def test_add_master_success(self, salon):
         """Добавление мастера с салоном → 200"""
         response = client.post(
             "/api/owner/masters",
@@ -88,7 +88,7 @@ class TestOwnerAPI:
         assert data["telegram_id"] == TEST_MASTER_TELEGRAM_ID
         assert "id" in data
 
-    def test_list_masters(self):
+    def test_list_masters(self, master):
         """Список мастеров → 200"""
         response = client.get(
             "/api/owner/masters",
@@ -99,7 +99,7 @@ class TestOwnerAPI:
         assert "items" in data
         assert len(data["items"]) > 0
 
-    def test_update_master_success(self):
+    def test_update_master_success(self, master):
         """Обновление мастера → 200"""
         # Сначала получаем список мастеров
         list_response = client.get(
@@ -120,7 +120,7 @@ class TestOwnerAPI:
         data = response.json()
         assert data["name"] == "Updated Master"
 
-    def test_delete_master_not_found(self):
+    def test_delete_master_not_found(self, salon):
         """Удаление несуществующего мастера → 404"""
         response = client.delete(
             "/api/owner/masters/nonexistent",
@@ -128,7 +128,7 @@ class TestOwnerAPI:
         )
         assert response.status_code == 404
 
-    def test_delete_master_success(self):
+    def test_delete_master_success(self, salon):
         """Удаление мастера → 200"""
         # Сначала добавляем мастера
         add_response = client.post(
@@ -146,7 +146,7 @@ class TestOwnerAPI:
         assert response.status_code == 200
         assert response.json()["ok"] is True
 
-    def test_add_service_success(self):
+    def test_add_service_success(self, salon):
         """Добавление услуги → 200"""
         response = client.post(
             "/api/owner/services",
@@ -158,7 +158,7 @@ class TestOwnerAPI:
         assert data["name"] == "Service 1"
         assert "id" in data
 
-    def test_delete_service_not_found(self):
+    def test_delete_service_not_found(self, salon):
         """Удаление несуществующей услуги → 404"""
         response = client.delete(
             "/api/owner/services/nonexistent",
@@ -166,7 +166,7 @@ class TestOwnerAPI:
         )
         assert response.status_code == 404
 
-    def test_delete_service_success(self):
+    def test_delete_service_success(self, salon):
         """Удаление услуги → 200"""
         # Сначала добавляем услугу
         add_response = client.post(
@@ -184,6 +184,21 @@ class TestOwnerAPI:
         assert response.status_code == 200
         assert response.json()["ok"] is True
 
+    def test_delete_foreign_master_and_service(self, salon):
+        """Мастер и услуга чужого салона не удаляются → 404"""
+        other = {"X-User-Id": TEST_USER_ID_2}
+        client.post("/api/owner/salon", json={"name": "Other Salon"}, headers=other)
+        other_master = client.post("/api/owner/masters", json={"name": "Other Master"}, headers=other).json()
+        other_service = client.post("/api/owner/services", json={"name": "Other Service"}, headers=other).json()
+
+        for path in (f"/api/owner/masters/{other_master['id']}", f"/api/owner/services/{other_service['id']}"):
+            response = client.delete(path, headers={"X-User-Id": TEST_USER_ID})
+            assert response.status_code == 404
+
+        # Каталог чужого салона не тронут
+        assert client.get("/api/owner/masters", headers=other).json()["items"][0]["id"] == other_master["id"]
+        assert len(client.get("/api/owner/salon", headers=other).json()["services"]) == 1
+
 
 class TestClientAPI:
     """Тесты API для клиентов"""
@@ -201,40 +216,28 @@ class TestClientAPI:
         response = client.get("/api/client/salons/nonexistent")
         assert response.status_code == 404
 
-    def test_get_salon_success(self):
+    def test_get_salon_success(self, salon):
         """Получение салона → 200"""
-        # Сначала получаем список салонов
-        list_response = client.get("/api/client/salons")
-        salons = list_response.json()["items"]
-        if len(salons) > 0:
-            salon_id = salons[0]["id"]
-            response = client.get(f"/api/client/salons/{salon_id}")
-            assert response.status_code == 200
-            data = response.json()
-            assert "id" in data
-            assert "name" in data
-
-    def test_get_salon_masters(self):
+        response = client.get(f"/api/client/salons/{salon['id']}")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["id"] == salon["id"]
+        assert data["name"] == "Test Salon"
+
+    def test_get_salon_masters(self, salon, master):
         """Получение мастеров салона → 200"""
-        list_response = client.get("/api/client/salons")
-        salons = list_response.json()["items"]
-        if len(salons) > 0:
-            salon_id = salons[0]["id"]
-            response = client.get(f"/api/client/salons/{salon_id}/masters")
-            assert response.status_code == 200
-            data = response.json()
-            assert "items" in data
-
-    def test_get_salon_services(self):
+        response = client.get(f"/api/client/salons/{salon['id']}/masters")
+        assert response.status_code == 200
+        data = response.json()
+        assert [m["id"] for m in data["items"]] == [master["id"]]
+        assert "telegram_id" not in data["items"][0]
+
+    def test_get_salon_services(self, salon):
         """Получение услуг салона → 200"""
-        list_response = client.get("/api/client/salons")
-        salons = list_response.json()["items"]
-        if len(salons) > 0:
-            salon_id = salons[0]["id"]
-            response = client.get(f"/api/client/salons/{salon_id}/services")
-            assert response.status_code == 200
-            data = response.json()
-            assert "items" in data
+        response = client.get(f"/api/client/salons/{salon['id']}/services")
+        assert response.status_code == 200
+        data = response.json()
+        assert "items" in data
 
 
 class TestMasterAPI:
@@ -248,27 +251,24 @@ class TestMasterAPI:
         )
         assert response.status_code == 404
 
-    def test_get_salon_as_master(self):
+    def test_get_salon_as_master(self, salon, master):
         """Получение салона мастером → 200"""
-        # Мастер должен быть добавлен владельцем с telegram_id
         response = client.get(
             "/api/master/salon",
             headers={"X-User-Id": TEST_MASTER_TELEGRAM_ID}
         )
-        # Может быть 404 если мастер не добавлен, или 200 если добавлен
-        assert response.status_code in [200, 404]
+        assert response.status_code == 200
+        assert response.json()["id"] == salon["id"]
 
-    def test_get_appointments_as_master(self):
+    def test_get_appointments_as_master(self, master):
         """Получение записей мастером"""
         response = client.get(
             "/api/master/appointments",
             headers={"X-User-Id": TEST_MASTER_TELEGRAM_ID}
         )
-        # Может быть 404 если мастер не добавлен, или 200 если добавлен
-        assert response.status_code in [200, 404]
-        if response.status_code == 200:
-            data = response.json()
-            assert "items" in data
+        assert response.status_code == 200
+        data = response.json()
+        assert data["items"] == []
 
 
 class TestRoleDetection:
@@ -279,7 +279,7 @@ class TestRoleDetection:
         response = client.get("/api/user/role")
         assert response.status_code == 401
 
-    def test_get_role_owner(self):
+    def test_get_role_owner(self, salon):
         """Определение роли владельца → owner"""
         response = client.get(
             "/api/user/role",
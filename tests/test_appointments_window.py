@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import repository
+
+
+@pytest.fixture
+def history(salon):
+    repo = repository.get_repository()
+    master = repo.create_master(salon["id"], "Anna")
+    service = repo.create_service(salon["id"], "Cut")
+    now = datetime.now().replace(microsecond=0)
+    for days in (-60, -30, 0, 1, 30, 60, 90):
+        when = (now + timedelta(days=days)).isoformat()
+        repo.create_appointment(salon["id"], master["id"], service["id"], "client", when, "completed")
+    return salon
+
+
+def test_owner_salon_embeds_only_window(client, owner, history):
+    data = client.get("/api/owner/salon", headers=owner).json()
+
+    assert len(data["appointments"]) == 2
+    window = data["appointments_window"]
+    assert (window["total"], window["before"], window["after"]) == (7, 2, 3)
+    assert window["url"].startswith("/api/owner/appointments")
+
+
+def test_owner_appointments_pagination(client, owner, history):
+    first = client.get("/api/owner/appointments?limit=4", headers=owner).json()
+    second = client.get(f"/api/owner/appointments?limit=4&offset={first['next_offset']}", headers=owner).json()
+
+    assert len(first["items"]) == 4 and len(second["items"]) == 3
+    assert second["next_offset"] is None
+    datetimes = [apt["datetime"] for apt in first["items"] + second["items"]]
+    assert datetimes == sorted(datetimes)
+
+    today = datetime.now().date().isoformat()
+    ranged = client.get(f"/api/owner/appointments?date_from={today}", headers=owner).json()
+    assert len(ranged["items"]) == 5
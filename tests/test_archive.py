@@ -0,0 +1,67 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import database
+import maintenance
+
+
+def _days_ago(days: int) -> str:
+    return (datetime.now() - timedelta(days=days)).replace(microsecond=0).isoformat()
+
+
+@pytest.fixture
+def history(sqlite_repository, salon, add_master, service):
+    master = add_master("Anna")
+    for days in (400, 300, 200, 10, 0):
+        database.create_appointment(salon["id"], master["id"], service["id"], "client-a", _days_ago(days), "completed")
+    return salon
+
+
+def test_archival_moves_old_rows_in_batches(history):
+    assert maintenance.run_archival(retention_days=180, batch_size=2, pause=0) == 3
+
+    hot = database.get_salon_appointments(history["id"])
+    assert len(hot) == 2
+    conn = database.get_db_connection()
+    assert conn.execute("SELECT COUNT(*) FROM appointments_archive").fetchone()[0] == 3
+    conn.close()
+    assert maintenance.run_archival(retention_days=180, batch_size=2, pause=0) == 0
+
+
+def test_history_ranges_union_archive(client, owner, history):
+    maintenance.run_archival(retention_days=180, batch_size=100, pause=0)
+
+    year_ago = (date.today() - timedelta(days=365)).isoformat()
+    recent = (date.today() - timedelta(days=30)).isoformat()
+
+    assert len(database.get_salon_appointments(history["id"], date_from=year_ago)) == 4
+    assert len(database.get_salon_appointments(history["id"], date_from=recent)) == 2
+    assert len(database.get_client_appointments("client-a", date_from="2000-01-01")) == 5
+    assert len(database.get_client_appointments("client-a")) == 2
+
+    response = client.get(f"/api/owner/appointments?date_from={year_ago}", headers=owner)
+    datetimes = [apt["datetime"] for apt in response.json()["items"]]
+    assert len(datetimes) == 4 and datetimes == sorted(datetimes)
+
+
+def test_archival_keeps_active_appointments_hot(history, add_master, service):
+    master = add_master("Boris")
+    pending = database.create_appointment(history["id"], master["id"], service["id"], "client-b", _days_ago(300))
+    cancelled = database.create_appointment(
+        history["id"], master["id"], service["id"], "client-b", _days_ago(300), "cancelled",
+    )
+
+    assert maintenance.run_archival(retention_days=180, batch_size=100, pause=0) == 4
+
+    hot = {apt.id for apt in database.get_salon_appointments(history["id"])}
+    assert pending.id in hot and cancelled.id not in hot  # активная запись не уходит в архив по возрасту
+
+
+def test_window_counts_include_archive(history):
+    window = (date.today() - timedelta(days=30)).isoformat(), (date.today() + timedelta(days=1)).isoformat()
+    counts = database.count_salon_appointments(history["id"], *window)
+
+    maintenance.run_archival(retention_days=180, batch_size=100, pause=0)
+
+    assert database.count_salon_appointments(history["id"], *window) == counts == {"total": 5, "before": 3, "after": 0}
@@ -0,0 +1,91 @@
+from datetime import date, datetime, timedelta
+
+import availability
+import repository
+
+
+def test_free_mask_blocks_neighbouring_slots_and_past():
+    day = date(2030, 1, 7)
+    bookings = {day: [datetime(2030, 1, 7, 10, 0), datetime(2030, 1, 7, 13, 30)]}
+    mask = availability.free_mask(day, availability.booked_mask(day, bookings), now=datetime(2030, 1, 7, 9, 0))
+
+    hours = [int(slot[11:13]) for slot in availability.mask_slots(day, mask)]
+    assert hours == [11, 12, 15, 16, 17]  # 9:00 уже наступило, 10:00 занято, 13:30 задевает 13 и 14
+    assert availability.free_mask(day, 0, now=datetime(2030, 1, 8)) == 0
+    assert availability.booking_masks(datetime(2030, 1, 7, 23, 30)) == {day: 1 << 23, date(2030, 1, 8): 1}
+
+
+def test_week_availability_for_all_masters_matches_single_day_slots(client, salon, add_master, service):
+    repo = repository.get_repository()
+    anna, olga = add_master("Anna"), add_master("Olga")
+    first = date.today() + timedelta(days=1)
+    second = first + timedelta(days=1)
+    repo.create_appointment(salon["id"], anna["id"], service["id"], "c1", f"{first}T10:00:00")
+    repo.create_appointment(salon["id"], anna["id"], service["id"], "c2", f"{second}T12:00:00", "cancelled")
+    repo.create_appointment(salon["id"], olga["id"], service["id"], "c3", f"{second}T09:00:00")
+
+    response = client.get(f"/api/client/salons/{salon['id']}/availability",
+                          params={"date_from": first.isoformat(), "days": 7, "service_id": service["id"]})
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["date_from"], body["days"], body["slot_minutes"]) == (first.isoformat(), 7, 60)
+    assert set(body["masters"]) == {anna["id"], olga["id"]}
+
+    working = availability.working_mask(first)
+    assert body["masters"][anna["id"]][0] == working & ~(1 << 10)
+    assert body["masters"][anna["id"]][1] == working  # отменённая запись слот не занимает
+    assert body["masters"][olga["id"]][1] == working & ~(1 << 9)
+
+    for offset, mask in enumerate(body["masters"][anna["id"]]):
+        day = first + timedelta(days=offset)
+        slots = client.get(f"/api/client/salons/{salon['id']}/available-slots",
+                           params={"master_id": anna["id"], "date": day.isoformat()}).json()["items"]
+        assert slots == availability.mask_slots(day, mask)
+
+    one = client.get(f"/api/client/salons/{salon['id']}/availability",
+                     params={"date_from": first.isoformat(), "days": 2, "master_id": olga["id"]}).json()
+    assert list(one["masters"]) == [olga["id"]] and len(one["masters"][olga["id"]]) == 2
+    assert client.get(f"/api/client/salons/{salon['id']}/availability",
+                      params={"date_from": first.isoformat(), "service_id": "missing"}).status_code == 404
+    assert client.get(f"/api/client/salons/{salon['id']}/availability",
+                      params={"date_from": "soon"}).status_code == 400
+
+
+def test_earliest_slots_merge_masters_in_time_order():
+    now = datetime(2030, 1, 7, 9, 30)
+    day = now.date()
+    occupancy = {"anna": {day: 1 << 10 | 1 << 12}, "olga": {day: 1 << 11}}
+    loaded = []
+
+    def load(first, last):
+        loaded.append(first)
+        return occupancy
+
+    found = availability.earliest_slots(["anna", "olga"], now, length=2, limit=4, load_occupancy=load)
+    assert [(start.hour, master) for start, master in found] == [
+        (12, "olga"), (13, "anna"), (13, "olga"), (14, "anna"),
+    ]
+    assert loaded == [day]  # ответ нашёлся в первом же окне — дальше не читали
+
+    found = availability.earliest_slots(["anna"], now, length=1, limit=12, load_occupancy=load, chunk_days=1)
+    assert found[-1][0].date() == date(2030, 1, 8) and loaded[-1] == date(2030, 1, 8)
+
+
+def test_earliest_slots_endpoint_uses_service_duration(client, salon, add_master, add_service):
+    repo = repository.get_repository()
+    anna = add_master("Anna")
+    long_service = add_service("Color", 3000, 120)
+    tomorrow = date.today() + timedelta(days=1)
+    after = f"{tomorrow}T08:00:00"
+    repo.create_appointment(salon["id"], anna["id"], long_service["id"], "c1", f"{tomorrow}T10:00:00")
+
+    response = client.get(f"/api/client/salons/{salon['id']}/earliest-slots",
+                          params={"service_id": long_service["id"], "limit": 3, "after": after})
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["duration"] == 120
+    # 9:00 не подходит: двухчасовой услуге мешает запись в 10:00
+    assert [item["datetime"][11:16] for item in body["items"]] == ["11:00", "12:00", "13:00"]
+    assert {item["master_id"] for item in body["items"]} == {anna["id"]}
+    assert client.get(f"/api/client/salons/{salon['id']}/earliest-slots",
+                      params={"service_id": "missing"}).status_code == 404
@@ -0,0 +1,100 @@
+import dataclasses
+import gzip
+import sqlite3
+import threading
+
+import backend
+import backup
+import database
+
+
+def _seed(rows):
+    salon = database.create_salon("Salon", "owner")
+    master = database.create_master(salon["id"], "Anna")
+    service = database.create_service(salon["id"], "Cut")
+
+    def bulk_insert(conn):
+        conn.executemany(
+            database.APPOINTMENT_INSERT,
+            [(f"seed-{i}", salon["id"], master["id"], service["id"], "c" * 200, "2030-01-01T10:00:00", "pending")
+             for i in range(rows)],
+        )
+
+    database.submit_write(bulk_insert).result()
+    return salon, master, service
+
+
+def _restore(path, tmp_path):
+    raw = tmp_path / "restored.db"
+    with gzip.open(path, "rb") as src:
+        raw.write_bytes(src.read())
+    return sqlite3.connect(raw)
+
+
+def test_backup_under_concurrent_writes(sqlite_repository, tmp_path):
+    salon, master, service = _seed(5000)
+    stop = threading.Event()
+    written = []
+
+    def writer():
+        while not stop.is_set():
+            database.create_appointment(salon["id"], master["id"], service["id"], "live", "2030-01-02T10:00:00")
+            written.append(1)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        report = backup.create_backup(tmp_path / "backups", pages=16, sleep=0.001, max_restarts=3)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert written
+    assert backup.verify_backup(report["path"])["ok"]
+    conn = _restore(report["path"], tmp_path)
+    count = conn.execute("SELECT COUNT(*) FROM appointments").fetchone()[0]
+    conn.close()
+    assert 5000 <= count <= 5000 + len(written)
+
+
+def test_rotation_and_corruption(sqlite_repository, tmp_path):
+    dest = tmp_path / "backups"
+    reports = [backup.create_backup(dest, keep=2, sleep=0) for _ in range(3)]
+
+    assert [p.name for p in backup.list_snapshots(dest)] == [
+        r["path"].rsplit("/", 1)[-1] for r in reports[1:]
+    ]
+    assert reports[2]["rotated"] == [reports[0]["path"].rsplit("/", 1)[-1]]
+    assert len(list(dest.glob("*.sha256"))) == 2
+
+    with open(reports[2]["path"], "ab") as f:
+        f.write(b"garbage")
+    result = backup.verify_backup(reports[2]["path"])
+    assert result["checksum_ok"] is False and result["ok"] is False
+
+
+def test_admin_endpoint(sqlite_repository, tmp_path, monkeypatch, client):
+    monkeypatch.setattr(
+        backend, "settings",
+        dataclasses.replace(
+            backend.settings, storage_engine="sqlite", admin_ids=frozenset({"1"}),
+            backup_dir=str(tmp_path), backup_keep=3,
+        ),
+    )
+
+    assert client.post("/api/admin/backup", headers={"X-User-Id": "2"}).status_code == 403
+    response = client.post("/api/admin/backup", headers={"X-User-Id": "1"})
+    assert response.status_code == 200
+    assert backup.verify_backup(response.json()["path"])["ok"]
+
+
+def test_incremental_copy_pauses_between_steps(sqlite_repository, tmp_path, monkeypatch):
+    _seed(2000)
+    pauses = []
+    monkeypatch.setattr(backup.time, "sleep", pauses.append)
+
+    stats = backup.snapshot(tmp_path / "raw.db", pages=8, sleep=0.005)
+
+    assert stats["steps"] > 1
+    # Пауза после каждого шага, кроме последнего
+    assert pauses == [0.005] * (stats["steps"] - 1)
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import repository
+
+
+MASTER = {"X-User-Id": "batch-master"}
+
+
+@pytest.fixture
+def day(salon, add_master, service):
+    repo = repository.get_repository()
+    anna = add_master("Anna", "batch-master")
+    olga = add_master("Olga", "other-master")
+    start = (datetime.now() + timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+    apts = [
+        repo.create_appointment(salon["id"], master["id"], service["id"], f"c{i}",
+                                (start + timedelta(hours=i)).isoformat(), status)
+        for i, (master, status) in enumerate([
+            (anna, "pending"), (anna, "confirmed"), (anna, "cancelled"), (olga, "pending"),
+        ])
+    ]
+    return repo, [a.id for a in apts]
+
+
+def test_master_batch_applies_transition_rules_per_item(client, day):
+    repo, ids = day
+
+    response = client.patch("/api/master/appointments", json={"ids": ids + ["missing"], "status": "completed"},
+                            headers=MASTER)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["updated"], body["failed"]) == (2, 3)
+    outcomes = {item["id"]: item for item in body["items"]}
+    assert outcomes[ids[0]] == {"id": ids[0], "ok": True, "status": "completed"}
+    assert outcomes[ids[2]]["error"] == "Cannot change status of cancelled appointment"
+    assert outcomes[ids[3]]["error"] == "Appointment not found"  # запись другого мастера
+    assert outcomes["missing"]["ok"] is False
+
+    assert [repo.get_appointment_by_id(i).status for i in ids] == ["completed", "completed", "cancelled", "pending"]
+
+    again = client.patch("/api/master/appointments", json={"ids": ids[:1], "status": "pending"}, headers=MASTER)
+    assert again.json()["items"][0]["error"] == "Cannot change status of completed appointment"
+
+
+def test_owner_batch_closes_the_day(client, owner, day):
+    repo, ids = day
+
+    response = client.patch("/api/owner/appointments", json={"ids": ids + ids[:1], "status": "completed"},
+                            headers=owner)
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["updated"], body["failed"], len(body["items"])) == (3, 1, 4)
+    assert [repo.get_appointment_by_id(i).status for i in ids] == ["completed", "completed", "cancelled", "completed"]
+
+    assert client.patch("/api/owner/appointments", json={"ids": ids, "status": "done"},
+                        headers=owner).status_code == 400
+    assert client.patch("/api/owner/appointments", json={"ids": [], "status": "completed"},
+                        headers=owner).status_code == 422
+    assert client.patch("/api/owner/appointments", json={"ids": ids, "status": "completed"},
+                        headers={"X-User-Id": "stranger"}).status_code == 404
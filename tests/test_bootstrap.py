@@ -0,0 +1,83 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import backend
+import repository
+
+
+@pytest.fixture
+def booked(salon, add_master, service):
+    master = add_master("Anna", "boot-master")
+    when = (datetime.now() + timedelta(days=1)).replace(microsecond=0).isoformat()
+    appointment = repository.get_repository().create_appointment(
+        salon["id"], master["id"], service["id"], "boot-client", when,
+    )
+    return master, appointment
+
+
+def test_bootstrap_returns_role_specific_payload(client, owner, salon, service, booked):
+    master, appointment = booked
+
+    as_owner = client.get("/api/bootstrap", headers=owner).json()
+    assert as_owner["role"] == "owner"
+    assert as_owner["salon"]["id"] == salon["id"]
+    assert [m["id"] for m in as_owner["salon"]["masters"]] == [master["id"]]
+    assert "appointments" not in as_owner["salon"]
+    assert [a["id"] for a in as_owner["appointments"]] == [appointment.id]
+
+    as_master = client.get("/api/bootstrap", headers={"X-User-Id": "boot-master"}).json()
+    assert as_master["role"] == "master"
+    assert as_master["salon"]["services"][0]["id"] == service["id"]
+    assert [a["id"] for a in as_master["appointments"]] == [appointment.id]
+
+    as_client = client.get("/api/bootstrap", headers={"X-User-Id": "boot-client"}).json()
+    assert as_client["role"] == "client"
+    assert any(s["id"] == salon["id"] for s in as_client["salons"])
+    assert [a["id"] for a in as_client["appointments"]] == [appointment.id]
+    assert as_client["catalogs"][salon["id"]] == {
+        "id": salon["id"],
+        "name": salon["name"],
+        "masters": [{"id": master["id"], "name": "Anna"}],
+        "services": [{"id": service["id"], "name": "Cut", "price": 1000, "duration": 60, "description": None}],
+    }
+
+    newcomer = client.get("/api/bootstrap", headers={"X-User-Id": "boot-new"}).json()
+    assert (newcomer["role"], newcomer["appointments"], newcomer["catalogs"]) == ("client", [], {})
+    assert client.get("/api/bootstrap").status_code == 401
+
+
+def test_owner_bootstrap_uses_the_salon_window(client, owner, salon, service, booked):
+    master, appointment = booked
+    old = (datetime.now() - timedelta(days=90)).replace(microsecond=0).isoformat()
+    repository.get_repository().create_appointment(
+        salon["id"], master["id"], service["id"], "boot-client", old, "completed",
+    )
+
+    as_owner = client.get("/api/bootstrap", headers=owner).json()
+    assert [a["id"] for a in as_owner["appointments"]] == [appointment.id]  # запись вне окна не пришла
+    window = as_owner["appointments_window"]
+    assert (window["total"], window["before"], window["after"]) == (2, 1, 0)
+    assert window == client.get("/api/owner/salon", headers=owner).json()["appointments_window"]
+
+
+def test_client_bootstrap_does_not_cache_catalog_older_than_a_write(
+        sqlite_repository, client, salon, service, booked, monkeypatch):
+    original = backend.get_owner_salon_id
+
+    def owner_lookup_then_concurrent_write(user_id):
+        salon_id = original(user_id)  # снимок запроса уже открыт
+        # Запись из другого потока фиксируется между снимком и чтением каталога
+        writer = threading.Thread(target=sqlite_repository.create_master, args=(salon["id"], "Late"))
+        writer.start()
+        writer.join()
+        return salon_id
+
+    monkeypatch.setattr(backend, "get_owner_salon_id", owner_lookup_then_concurrent_write)
+    as_client = client.get("/api/bootstrap", headers={"X-User-Id": "boot-client"}).json()
+    assert [m["name"] for m in as_client["catalogs"][salon["id"]]["masters"]] == ["Anna"]
+    monkeypatch.undo()
+
+    masters = client.get(f"/api/client/salons/{salon['id']}/masters").json()["items"]
+    assert sorted(m["name"] for m in masters) == ["Anna", "Late"]
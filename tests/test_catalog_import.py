@@ -0,0 +1,81 @@
+import database
+
+
+URL = "/api/owner/catalog/import"
+
+
+def _catalog(client, owner):
+    masters = client.get("/api/owner/masters", headers=owner).json()["items"]
+    services = client.get("/api/owner/salon?fields=services", headers=owner).json()["services"]
+    return masters, services
+
+
+def test_json_import_creates_hundreds_of_rows(client, owner, salon):
+    payload = {
+        "masters": [{"name": f"Master {i}", "external_id": f"m-{i}"} for i in range(200)],
+        "services": [{"name": f"Service {i}", "price": 1000 + i, "duration": 60} for i in range(300)],
+    }
+
+    response = client.post(URL, json=payload, headers=owner)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["created"], body["updated"], body["errors"]) == (500, 0, 0)
+    assert body["masters"][5]["status"] == "created" and body["masters"][5]["external_id"] == "m-5"
+
+    masters, services = _catalog(client, owner)
+    assert len(masters) == 200 and len(services) == 300
+    assert {m["id"] for m in masters} == {r["id"] for r in body["masters"]}
+
+
+def test_csv_upsert_by_external_id_updates_in_place(client, owner, salon):
+    client.post(URL, json={"masters": [{"name": "Anna", "external_id": "m-1", "telegram_id": "tg-1"}]},
+                headers=owner)
+    csv_body = (
+        "kind,name,telegram_id,price,duration,description,external_id\n"
+        "master,Anna K.,,,,,m-1\n"
+        "master,Olga,tg-2,,,,m-2\n"
+        "service,Cut,,1500,45,Short,s-1\n"
+    )
+
+    response = client.post(URL, params={"upsert": "external_id"}, content=csv_body.encode(),
+                           headers={**owner, "Content-Type": "text/csv"})
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert [r["status"] for r in body["masters"]] == ["updated", "created"]
+    assert (body["created"], body["updated"]) == (2, 1)
+
+    masters, services = _catalog(client, owner)
+    assert {(m["name"], m["telegram_id"]) for m in masters} == {("Anna K.", "tg-1"), ("Olga", "tg-2")}
+    assert [(s["name"], s["price"], s["duration"]) for s in services] == [("Cut", 1500, 45)]
+
+
+def test_invalid_rows_reject_the_whole_import(client, owner, salon):
+    client.post(URL, json={"services": [{"name": "Cut", "external_id": "s-1"}]}, headers=owner)
+
+    response = client.post(URL, json={"services": [{"name": "Color"}, {"name": ""}, {"price": "free"}]},
+                           headers=owner)
+    assert response.status_code == 422
+    rows = response.json()["detail"]["services"]
+    assert [r["status"] for r in rows] == ["valid", "error", "error"]
+    assert "name" in rows[1]["error"] and "price" in rows[2]["error"]
+
+    response = client.post(URL, params={"upsert": "name"}, json={"services": [
+        {"name": "Cut", "price": 900},
+        {"name": "Color", "external_id": "s-1"},
+        {"name": "Cut"},
+    ]}, headers=owner)
+    assert response.status_code == 422
+    assert [r["status"] for r in response.json()["detail"]["services"]] == ["updated", "error", "error"]
+
+    _, services = _catalog(client, owner)
+    assert [(s["name"], s["price"]) for s in services] == [("Cut", None)]
+    assert client.post(URL, content=b"name\nAnna\n", headers={**owner, "Content-Type": "text/csv"}).status_code == 400
+
+
+def test_migration_adds_external_id_column_and_index(sqlite_repository):
+    conn = database.get_db_connection()
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(masters)")}
+    indexes = {row["name"] for row in conn.execute("PRAGMA index_list(services)")}
+    conn.close()
+    assert "external_id" in columns
+    assert "idx_services_external_id" in indexes
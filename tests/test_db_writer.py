@@ -0,0 +1,179 @@
+import dataclasses
+import sqlite3
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend
+import database
+import repository
+from db_writer import SQLiteWriter
+
+
+@pytest.fixture
+def writer():
+    writer = database.start_writer(max_delay=0.01)
+    yield writer
+    database.stop_writer()
+
+
+@pytest.fixture
+def catalog():
+    salon = database.create_salon("Salon", "owner-1")
+    master = database.create_master(salon["id"], "Anna")
+    service = database.create_service(salon["id"], "Cut")
+    return salon["id"], master["id"], service["id"]
+
+
+def test_concurrent_bookings_are_serialized(writer, catalog):
+    salon_id, master_id, service_id = catalog
+    futures = []
+    lock = threading.Lock()
+
+    def burst(worker: int):
+        for i in range(25):
+            future = database.submit_create_appointment(
+                salon_id, master_id, service_id, f"client-{worker}", f"2030-01-01T{i:02d}:00:00"
+            )
+            with lock:
+                futures.append(future)
+
+    threads = [threading.Thread(target=burst, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results = [future.result(timeout=10) for future in futures]
+    assert len({r["id"] for r in results}) == 200
+    assert len(database.get_salon_appointments(salon_id)) == 200
+    assert writer.stats.transactions < writer.stats.operations
+
+
+def test_failed_operation_does_not_poison_batch(writer, catalog):
+    salon_id, master_id, service_id = catalog
+
+    def broken(conn):
+        conn.execute("INSERT INTO salons (id, name, owner_id) VALUES ('x', 'X', 'o')")
+        raise sqlite3.IntegrityError("boom")
+
+    bad = database.submit_write(broken)
+    good = database.submit_create_appointment(salon_id, master_id, service_id, "c", "2030-01-01T10:00:00")
+
+    with pytest.raises(sqlite3.IntegrityError):
+        bad.result(timeout=5)
+    assert good.result(timeout=5)["client_id"] == "c"
+    assert database.get_salon_by_id("x") is None
+
+
+def test_sync_api_goes_through_writer(writer, catalog):
+    salon_id, _, _ = catalog
+    before = writer.stats.operations
+    database.update_salon(salon_id, "Renamed")
+    assert writer.stats.operations == before + 1
+    assert database.get_salon_by_id(salon_id)["name"] == "Renamed"
+
+
+def test_locked_database_fails_every_write_instead_of_hanging(catalog):
+    salon_id, _, _ = catalog
+    writer = SQLiteWriter(
+        database.DB_PATH, lambda path: sqlite3.connect(path, timeout=0.05), max_delay=0.05
+    ).start()
+    blocker = sqlite3.connect(str(database.DB_PATH), isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")  # BEGIN IMMEDIATE писателя упадёт с "database is locked"
+    try:
+        futures = [writer.submit(database._update_salon, salon_id, f"Name {i}") for i in range(5)]
+        for future in futures:
+            with pytest.raises(sqlite3.OperationalError, match="locked"):
+                future.result(timeout=5)
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+        writer.stop()
+
+
+def test_http_writes_are_group_committed_by_the_writer(sqlite_repository, client, owner, salon):
+    writer = database.start_writer(max_delay=0.05)
+    try:
+        def add(worker):
+            for i in range(5):
+                response = client.post("/api/owner/masters", json={"name": f"M{worker}-{i}"}, headers=owner)
+                assert response.status_code == 200, response.text
+
+        threads = [threading.Thread(target=add, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert writer.stats.operations == 40  # транзакции запросов шли через писателя
+        assert writer.stats.largest_batch > 1  # и фиксировались вместе
+        assert len(client.get("/api/owner/masters", headers=owner).json()["items"]) == 40
+
+        with pytest.raises(RuntimeError):
+            with database.unit_of_work(write=True):
+                database.create_master(salon["id"], "Rolled back")
+                raise RuntimeError("handler failed")
+    finally:
+        database.stop_writer()  # дописывает очередь
+    assert writer.stats.failed_operations == 1  # откат — это отменённый SAVEPOINT в пакете
+    assert len(database.get_salon_masters(salon["id"])) == 40
+
+
+class FlakyCommitConnection(sqlite3.Connection):
+    """Соединение, у которого по флагу не проходит COMMIT."""
+
+    fail_commit = False
+
+    def execute(self, sql, *args):
+        if sql == "COMMIT" and FlakyCommitConnection.fail_commit:
+            raise sqlite3.OperationalError("disk I/O error")
+        return super().execute(sql, *args)
+
+
+def test_app_lifespan_sends_api_writes_through_the_writer(sqlite_repository, monkeypatch):
+    settings = dataclasses.replace(repository.get_settings(), sqlite_writer_queue=True)
+    monkeypatch.setattr(repository, "get_settings", lambda: settings)
+    monkeypatch.setattr(backend, "settings", dataclasses.replace(
+        backend.settings, archive_interval_seconds=0, db_maintenance_interval_seconds=0,
+        db_integrity_interval_seconds=0,
+    ))
+
+    def flaky_connect(path, check_same_thread=True):
+        conn = sqlite3.connect(path, timeout=5, check_same_thread=check_same_thread, factory=FlakyCommitConnection)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    monkeypatch.setattr(database, "connect", flaky_connect)
+    owner = {"X-User-Id": "lifespan-owner"}
+    with TestClient(backend.app, raise_server_exceptions=False) as client:  # startup запускает писателя
+        writer = database._writer
+        assert writer is not None and writer.running
+        assert client.post("/api/owner/salon", json={"name": "Salon"}, headers=owner).status_code == 200
+        statuses = []
+
+        def add(worker):
+            for i in range(5):
+                statuses.append(client.post("/api/owner/masters", json={"name": f"M{worker}-{i}"},
+                                            headers=owner).status_code)
+
+        threads = [threading.Thread(target=add, args=(n,)) for n in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert statuses == [200] * 30
+        assert writer.stats.operations == 31 and writer.stats.largest_batch > 1
+
+        FlakyCommitConnection.fail_commit = True
+        try:
+            lost = client.post("/api/owner/masters", json={"name": "Lost"}, headers=owner)
+        finally:
+            FlakyCommitConnection.fail_commit = False
+        assert lost.status_code == 500  # групповой COMMIT не прошёл — клиент узнаёт об этом
+
+        names = [m["name"] for m in client.get("/api/owner/masters", headers=owner).json()["items"]]
+        assert len(names) == 30 and "Lost" not in names
+    assert database._writer is None  # shutdown остановил писателя
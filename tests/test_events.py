@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import backend
+import events
+from backend import app
+
+
+def test_broker_replays_resumes_and_drops_slow_subscribers():
+    async def scenario():
+        broker = events.EventBroker(history=3, queue_size=2, max_subscribers=2)
+        live, replay = broker.subscribe({"salon:a"})
+        assert replay == []
+
+        first = broker.publish("appointment", {"n": 1}, {"salon:a", "master:x"})
+        broker.publish("appointment", {"n": 2}, {"salon:b"})
+        third = broker.publish("appointment", {"n": 3}, {"salon:a"})
+        assert [(await live.get(1)).data, (await live.get(1)).data] == [{"n": 1}, {"n": 3}]
+        assert await live.get(0.01) is None  # тишина — время для heartbeat
+
+        # Переподключение: пропущенные события своей темы, дальше — вживую
+        resumed, missed = broker.subscribe({"salon:a"}, last_event_id=first.id)
+        assert [event.id for event in missed] == [third.id]
+        with pytest.raises(events.TooManySubscribers):
+            broker.subscribe({"salon:a"})
+        broker.unsubscribe(resumed)
+
+        for n in (4, 5):  # буфер на 3 события вытесняет событие 2
+            broker.publish("appointment", {"n": n}, {"salon:b"})
+        for stale in (first.id, "0:1", "garbage"):
+            gone, missed = broker.subscribe({"salon:a"}, last_event_id=stale)
+            assert [event.type for event in missed] == [events.RESET]
+            broker.unsubscribe(gone)
+
+        for n in range(3):  # live не читает: очередь на 2 события переполняется
+            broker.publish("appointment", {"n": n}, {"salon:a"})
+        await asyncio.sleep(0)
+        assert (await live.get(1)).type == events.RESET
+        assert live.closed and live.pending() == 0
+
+    asyncio.run(scenario())
+
+
+def test_appointment_writes_reach_salon_and_master_streams(client, salon, add_master, service):
+    master = add_master("Anna", "events-master")
+    when = (datetime.now() + timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+
+    async def scenario():
+        owner_stream, _ = backend.event_broker.subscribe({f"salon:{salon['id']}"})
+        master_stream, _ = backend.event_broker.subscribe({f"master:{master['id']}"})
+        try:
+            created = client.post("/api/client/appointments", headers={"X-User-Id": "events-client"}, json={
+                "salon_id": salon["id"], "master_id": master["id"], "service_id": service["id"],
+                "datetime": when.isoformat(),
+            }).json()
+            client.patch("/api/master/appointments", json={"ids": [created["id"]], "status": "confirmed"},
+                         headers={"X-User-Id": "events-master"})
+            for stream in (owner_stream, master_stream):
+                first, second = await stream.get(1), await stream.get(1)
+                assert (first.type, first.data["id"], first.data["status"]) == ("appointment", created["id"], "pending")
+                assert second.data["status"] == "confirmed"
+        finally:
+            backend.event_broker.unsubscribe(owner_stream)
+            backend.event_broker.unsubscribe(master_stream)
+
+    asyncio.run(scenario())
+
+
+def test_stream_endpoint_scope_heartbeat_and_reset(monkeypatch, client, owner, salon):
+    assert client.get("/api/events").status_code == 401
+    assert client.get("/api/events", headers={"X-User-Id": "events-stranger"}).status_code == 404
+
+    # Неизвестный Last-Event-ID: поток из retry и reset, после чего он закрывается
+    response = client.get("/api/events", headers={**owner, "Last-Event-ID": "old:5"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    frames = response.text.split("\n\n")
+    assert frames[0] == "retry: 3000" and "event: reset" in frames[1]
+
+    monkeypatch.setattr(backend.settings, "events_heartbeat_seconds", 0.01)
+
+    async def scenario():
+        stream = backend.event_stream({"salon:heartbeat"}, None)
+        assert await stream.__anext__() == "retry: 3000\n\n"
+        assert backend.event_broker.subscriber_count() == 0  # подписка — только когда поток читают
+        assert await stream.__anext__() == ": ping\n\n"
+        assert backend.event_broker.subscriber_count() == 1
+        await stream.aclose()
+        assert backend.event_broker.subscriber_count() == 0
+
+    asyncio.run(scenario())
+
+
+def test_dropped_streams_release_their_subscriptions(monkeypatch, owner, salon):
+    monkeypatch.setattr(backend.settings, "events_heartbeat_seconds", 0.01)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/api/events", "raw_path": b"/api/events", "root_path": "",
+        "query_string": b"", "headers": [(b"x-user-id", owner["X-User-Id"].encode())],
+        "client": ("testclient", 50000), "server": ("testserver", 80),
+    }
+
+    async def drop(after_frames):
+        """Клиент уходит после ``after_frames`` кадров; -1 — соединение рвётся до заголовков."""
+        frames, gone, requested = [], asyncio.Event(), []
+
+        async def receive():
+            if not requested:
+                requested.append(True)
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if after_frames < 0:
+                raise OSError("connection reset by peer")
+            if message["type"] == "http.response.body" and message.get("body"):
+                frames.append(message["body"])
+            if len(frames) >= after_frames:
+                gone.set()
+
+        try:
+            await asyncio.wait_for(app(scope, receive, send), 5)
+        except OSError:
+            pass
+        return frames
+
+    async def scenario():
+        for after_frames in (-1, 0, 1, 3, -1, 2):
+            await drop(after_frames)
+            assert backend.event_broker.subscriber_count() == 0
+        assert (await drop(3))[2] == b": ping\n\n"  # поток действительно был подписан
+
+    asyncio.run(scenario())
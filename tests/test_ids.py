@@ -0,0 +1,84 @@
+import sqlite3
+import time
+import uuid
+from datetime import date
+
+import database
+import ids
+
+
+def test_ids_are_uuid7_and_monotonic():
+    values = [ids.new_id() for _ in range(10000)]
+
+    assert values == sorted(values)
+    assert len(set(values)) == len(values)
+    parsed = uuid.UUID(values[0])
+    assert parsed.version == 7
+    assert parsed.variant == uuid.RFC_4122
+    assert abs(ids.id_timestamp_ms(values[-1]) - time.time() * 1000) < 5000
+
+
+def test_rows_get_time_ordered_ids(sqlite_repository):
+    salon = database.create_salon("Salon", "owner")
+    master = database.create_master(salon["id"], "Anna")
+    service = database.create_service(salon["id"], "Cut")
+    created = [
+        database.create_appointment(salon["id"], master["id"], service["id"], "c", "2030-01-01T10:00:00")["id"]
+        for _ in range(5)
+    ]
+
+    assert uuid.UUID(salon["id"]).version == 7
+    assert created == sorted(created)
+
+
+def test_integer_key_migration_keeps_public_ids(tmp_path):
+    path = tmp_path / "text_keys.db"
+    legacy = sqlite3.connect(path)
+    legacy.executescript("""
+        CREATE TABLE salons (id TEXT PRIMARY KEY, name TEXT NOT NULL, owner_id TEXT NOT NULL);
+        CREATE TABLE masters (id TEXT PRIMARY KEY, salon_id TEXT NOT NULL, name TEXT NOT NULL,
+            telegram_id TEXT, external_id TEXT, FOREIGN KEY (salon_id) REFERENCES salons(id) ON DELETE CASCADE);
+        CREATE TABLE services (id TEXT PRIMARY KEY, salon_id TEXT NOT NULL, name TEXT NOT NULL, price REAL,
+            duration INTEGER, description TEXT, external_id TEXT,
+            FOREIGN KEY (salon_id) REFERENCES salons(id) ON DELETE CASCADE);
+        CREATE TABLE appointments (id TEXT PRIMARY KEY, salon_id TEXT NOT NULL, master_id TEXT NOT NULL,
+            service_id TEXT NOT NULL, client_id TEXT NOT NULL, datetime TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            FOREIGN KEY (salon_id) REFERENCES salons(id) ON DELETE CASCADE,
+            FOREIGN KEY (master_id) REFERENCES masters(id) ON DELETE CASCADE,
+            FOREIGN KEY (service_id) REFERENCES services(id) ON DELETE CASCADE);
+        CREATE TABLE master_schedules (master_id TEXT PRIMARY KEY, rules TEXT NOT NULL, updated_at TEXT NOT NULL,
+            FOREIGN KEY (master_id) REFERENCES masters(id) ON DELETE CASCADE);
+        INSERT INTO salons VALUES ('s1', 'Salon', 'owner');
+        INSERT INTO masters VALUES ('m1', 's1', 'Anna', 'tg', 'ext-1');
+        INSERT INTO services VALUES ('v1', 's1', 'Cut', 1000, 60, NULL, NULL);
+        INSERT INTO master_schedules VALUES ('m1', '{}', '2030-01-01');
+        INSERT INTO appointments VALUES ('a1', 's1', 'm1', 'v1', 'c', '2030-01-01T10:00:00', 'pending');
+        INSERT INTO appointments VALUES ('a2', 's1', 'm1', 'v1', 'c', '2030-01-02T10:00:00', 'cancelled');
+        INSERT INTO appointments VALUES ('a-orphan', 's1', 'm-gone', 'v1', 'c', '2030-01-03T10:00:00', 'pending');
+        PRAGMA user_version = 4;
+    """)
+    legacy.close()
+
+    database.configure(f"sqlite:///{path}")
+    database.init_db(seed=False)
+
+    conn = database.get_db_connection()
+    columns = {row["name"]: row["type"] for row in conn.execute("PRAGMA table_info(appointments)")}
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(database.MIGRATIONS)
+    conn.close()
+    assert columns["salon_pk"] == columns["master_pk"] == columns["service_pk"] == "INTEGER"
+    assert "salon_id" not in columns  # внешние id родителей — только через appointments_view
+
+    rows = database.get_salon_appointments("s1")
+    assert [(a.id, a.master_id, a.service_id, a.status) for a in rows] == [
+        ("a1", "m1", "v1", "pending"), ("a2", "m1", "v1", "cancelled"),
+    ]
+    assert database.get_master_schedules(["m1"]) == {"m1": {}}
+    assert database.get_occupancy(["m1"], date(2030, 1, 1), date(2030, 1, 1)) == {"m1": {date(2030, 1, 1): 1 << 10}}
+    assert database.integrity_report()["ok"]
+
+    created = database.create_appointment("s1", "m1", "v1", "c", "2030-01-04T10:00:00")
+    assert database.get_appointment_by_id(created.id).master_id == "m1"
+    database.delete_master("m1")
+    assert database.get_salon_appointments("s1") == []
@@ -0,0 +1,96 @@
+import sqlite3
+
+import pytest
+
+import database
+import maintenance
+
+
+def test_migration_enables_incremental_vacuum(tmp_path):
+    path = tmp_path / "legacy.db"
+    legacy = sqlite3.connect(path)
+    legacy.execute("CREATE TABLE salons (id TEXT PRIMARY KEY, name TEXT NOT NULL, owner_id TEXT NOT NULL)")
+    legacy.commit()
+    assert legacy.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    legacy.close()
+
+    database.configure(f"sqlite:///{path}")
+    database.init_db(seed=False)
+
+    conn = database.get_db_connection()
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(database.MIGRATIONS)
+    conn.close()
+
+
+def test_maintenance_pass_reclaims_pages(sqlite_repository):
+    salon = database.create_salon("Salon", "owner")
+    master = database.create_master(salon["id"], "Anna")
+    service = database.create_service(salon["id"], "Cut")
+
+    def bulk_insert(conn):
+        conn.executemany(
+            database.APPOINTMENT_INSERT,
+            [(f"a{i}", salon["id"], master["id"], service["id"], "c" * 200, f"2030-01-01T{i % 24:02d}:00:00",
+              "pending") for i in range(3000)],
+        )
+
+    database.submit_write(bulk_insert).result()
+    database.submit_write(lambda conn: conn.execute("DELETE FROM appointments")).result()
+
+    report = maintenance.run_db_maintenance(checkpoint="TRUNCATE")
+
+    assert report["reclaimed_pages"] > 0
+    assert report["reclaimed_bytes"] > 0
+    assert report["freelist_count"] == 0
+    assert report["duration_ms"] >= 0
+    assert maintenance.last_maintenance_report is report
+
+
+def test_adaptive_schedule():
+    quiet = {"reclaimed_pages": 0, "freelist_count": 0, "wal_frames": 10}
+    busy = {"reclaimed_pages": 50, "freelist_count": 0, "wal_frames": 10}
+    long_wal = {"reclaimed_pages": 0, "freelist_count": 0, "wal_frames": maintenance.WAL_TRUNCATE_FRAMES + 1}
+
+    assert maintenance.next_maintenance_delay(quiet, 900, 900) == 1800
+    assert maintenance.next_maintenance_delay(quiet, 3600, 900) == 3600
+    assert maintenance.next_maintenance_delay(busy, 900, 900) == 450
+    assert maintenance.next_maintenance_delay(busy, 112.5, 900) == 112.5
+    assert maintenance.next_checkpoint_mode(long_wal) == "TRUNCATE"
+    assert maintenance.next_checkpoint_mode(quiet) == "PASSIVE"
+
+
+def test_orphan_migration_and_cascade(tmp_path):
+    path = tmp_path / "orphans.db"
+    database.configure(f"sqlite:///{path}")
+    database.init_db(seed=False)
+    legacy = sqlite3.connect(path)
+    legacy.execute("PRAGMA user_version = 1")
+    legacy.execute("INSERT INTO salons (id, name, owner_id) VALUES ('s1', 'Salon', 'owner')")
+    legacy.execute("INSERT INTO masters (id, salon_id, name) VALUES ('m-gone', 's-gone', 'Ghost')")
+    legacy.execute("INSERT INTO services (id, salon_id, name) VALUES ('svc', 's1', 'Cut')")
+    legacy.executemany(  # master_pk 404 — мастер удалён
+        "INSERT INTO appointments (id, salon_pk, master_pk, service_pk, client_id, datetime) "
+        "VALUES (?, 1, 404, 1, 'c', '2030-01-01T10:00:00')",
+        [(f"a{i}",) for i in range(1200)],
+    )
+    legacy.commit()
+    legacy.close()
+
+    report = database.integrity_report()
+    assert report["foreign_key_violations"] == {"masters": 1, "appointments": 1200}
+
+    database.init_db(seed=False)
+    conn = database.get_db_connection()
+    assert conn.execute("SELECT COUNT(*) FROM appointments").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM masters").fetchone()[0] == 0
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(database.MIGRATIONS)
+    conn.close()
+    assert database.integrity_report()["ok"]
+
+    master = database.create_master("s1", "Anna")
+    database.create_appointment("s1", master["id"], "svc", "c", "2030-01-01T10:00:00")
+    database.delete_master(master["id"])
+    assert database.get_salon_appointments("s1") == []
+    with pytest.raises(sqlite3.IntegrityError):
+        database.create_appointment("s1", "missing", "svc", "c", "2030-01-01T11:00:00")
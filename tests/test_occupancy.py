@@ -0,0 +1,88 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import database
+import maintenance
+import repository
+
+
+CLIENT = {"X-User-Id": "occupancy-client"}
+
+
+@pytest.fixture
+def anna(add_master):
+    return add_master("Anna")
+
+
+def test_conflict_check_uses_slot_bitmaps(client, salon, anna, service):
+    repo = repository.get_repository()
+    day = date.today() + timedelta(days=1)
+
+    def book(when):
+        return client.post("/api/client/appointments", headers=CLIENT, json={
+            "salon_id": salon["id"], "master_id": anna["id"], "service_id": service["id"], "datetime": f"{day}T{when}",
+        })
+
+    first = book("10:00:00")
+    assert first.status_code == 200
+    assert book("10:00:00").status_code == 409
+    assert book("10:30:00").status_code == 409  # задевает слот 10:00
+    assert book("11:00:00").status_code == 200
+
+    client.patch(f"/api/client/appointments/{first.json()['id']}", json={"status": "cancelled"}, headers=CLIENT)
+    assert book("10:30:00").status_code == 409  # слот 11:00 всё ещё занят
+    assert book("10:00:00").status_code == 200
+    assert repo.get_occupancy([anna["id"]], day, day) == {anna["id"]: {day: 1 << 10 | 1 << 11}}
+
+
+def test_bitmaps_follow_mutations_and_rebuild_repairs_drift(sqlite_repository, salon, anna, service, add_service):
+    repo = sqlite_repository
+    other = add_service("Color", 3000, 60)
+    day = date.today() + timedelta(days=3)
+    late = repo.create_appointment(salon["id"], anna["id"], service["id"], "c1", f"{day}T23:30:00")
+    done = repo.create_appointment(salon["id"], anna["id"], service["id"], "c2", f"{day}T12:00:00")
+    repo.create_appointment(salon["id"], anna["id"], other["id"], "c3", f"{day}T15:00:00")
+    repo.create_appointment(salon["id"], anna["id"], service["id"], "c4", f"{day}T16:00:00", "cancelled")
+
+    next_day = day + timedelta(days=1)
+    assert repo.get_occupancy([anna["id"]], day, next_day) == {
+        anna["id"]: {day: 1 << 12 | 1 << 15 | 1 << 23, next_day: 1},
+    }
+
+    repo.update_appointment(done.id, "completed")
+    repo.update_appointments_status([late.id], "cancelled")
+    repo.delete_service(other["id"])
+    assert repo.get_occupancy([anna["id"]], day, next_day) == {}
+    assert repo.rebuild_occupancy(repair=False)["mismatched"] == 0
+
+    repo.create_appointment(salon["id"], anna["id"], service["id"], "c5", f"{day}T09:00:00")
+    conn = database.get_db_connection()
+    conn.execute("UPDATE master_occupancy SET mask = 0")
+    conn.execute("INSERT INTO master_occupancy VALUES (?, '2030-01-01', 4)", (anna["id"],))
+    conn.commit()
+    conn.close()
+
+    assert repo.rebuild_occupancy(repair=False)["mismatched"] == 2
+    report = maintenance.run_occupancy_check()
+    assert (report["days"], report["mismatched"]) == (1, 2)
+    assert maintenance.last_occupancy_report is report
+    assert repo.get_occupancy([anna["id"]], day, day) == {anna["id"]: {day: 1 << 9}}
+    assert repo.rebuild_occupancy(repair=False)["mismatched"] == 0
+
+
+def test_migration_builds_bitmaps_for_existing_appointments(client, sqlite_repository, salon, anna, service):
+    repo = sqlite_repository
+    day = date.today() + timedelta(days=2)
+    repo.create_appointment(salon["id"], anna["id"], service["id"], "c1", f"{day}T14:00:00")
+    conn = database.get_db_connection()
+    conn.execute("DELETE FROM master_occupancy")
+    conn.execute("PRAGMA user_version = 3")
+    conn.commit()
+    conn.close()
+
+    database.init_db(seed=False)
+    assert repo.get_occupancy([anna["id"]], day, day) == {anna["id"]: {day: 1 << 14}}
+    slots = client.get(f"/api/client/salons/{salon['id']}/available-slots",
+                       params={"master_id": anna["id"], "date": day.isoformat()}).json()["items"]
+    assert datetime(day.year, day.month, day.day, 14).isoformat() not in slots
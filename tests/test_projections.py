@@ -0,0 +1,37 @@
+import database
+
+
+def test_fields_parameter_limits_relations(client, owner, salon):
+    client.post("/api/owner/masters", json={"name": "Anna"}, headers=owner)
+
+    data = client.get("/api/owner/salon?fields=masters", headers=owner).json()
+    assert [m["name"] for m in data["masters"]] == ["Anna"]
+    assert "services" not in data and "appointments" not in data
+
+    bare = client.get("/api/owner/salon?fields=", headers=owner).json()
+    assert set(bare) == {"id", "name", "owner_id"}
+
+    full = client.get("/api/owner/salon", headers=owner).json()
+    assert {"masters", "services", "appointments"} <= set(full)
+
+
+def test_unknown_field_rejected(client, owner, salon):
+    response = client.get("/api/owner/salon?fields=masters,secrets", headers=owner)
+    assert response.status_code == 400
+
+
+def test_owner_mutations_skip_appointment_history(sqlite_repository, monkeypatch, client, owner, salon):
+
+    def fail(*args, **kwargs):
+        raise AssertionError("appointment history must not be loaded")
+
+    monkeypatch.setattr(database, "get_salon_appointments", fail)
+
+    master = client.post("/api/owner/masters", json={"name": "Anna"}, headers=owner)
+    assert master.status_code == 200
+    assert client.get("/api/owner/masters", headers=owner).status_code == 200
+    assert client.patch(
+        f"/api/owner/masters/{master.json()['id']}", json={"name": "Maria"}, headers=owner
+    ).status_code == 200
+    service = client.post("/api/owner/services", json={"name": "Cut"}, headers=owner).json()
+    assert client.delete(f"/api/owner/services/{service['id']}", headers=owner).status_code == 200
@@ -0,0 +1,35 @@
+import sqlite3
+
+import pytest
+
+import database
+from records import Appointment, Master, row_factory, select_columns
+
+
+def test_row_factory_builds_slotted_records():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE masters (id TEXT, salon_id TEXT, name TEXT, telegram_id TEXT)")
+    conn.execute("INSERT INTO masters VALUES ('m1', 's1', 'Anna', 'tg')")
+    cursor = conn.cursor()
+    cursor.row_factory = row_factory(Master)
+    master = cursor.execute(f"SELECT {select_columns(Master)} FROM masters").fetchone()
+
+    assert master == Master("m1", "Anna", "tg")
+    assert not hasattr(master, "__dict__")
+    assert master["name"] == "Anna" and master.get("missing") is None
+    assert master.to_dict() == {"id": "m1", "name": "Anna", "telegram_id": "tg"}
+    with pytest.raises(KeyError):
+        master["salon_id"]
+
+
+def test_database_returns_records(sqlite_repository):
+    salon = database.create_salon("Salon", "owner")
+    master = database.create_master(salon["id"], "Anna", "tg")
+    service = database.create_service(salon["id"], "Cut", 1000, 60)
+    created = database.create_appointment(salon["id"], master.id, service.id, "c", "2030-01-01T10:00:00")
+
+    loaded = database.get_salon_by_id(salon["id"])
+    assert loaded["masters"] == [master]
+    assert loaded["services"] == [service]
+    assert loaded["appointments"] == [created]
+    assert isinstance(database.get_appointment_by_id(created.id), Appointment)
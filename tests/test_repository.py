@@ -0,0 +1,65 @@
+import pytest
+
+import repository
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def repo(request):
+    if request.param == "sqlite":
+        return repository.SQLiteRepository()
+    return repository.MemoryRepository()
+
+
+def test_salon_aggregate(repo):
+    salon = repo.create_salon("Salon", "owner-1")
+    master = repo.create_master(salon["id"], "Anna", "tg-1")
+    service = repo.create_service(salon["id"], "Cut", 1000, 60, None)
+    repo.create_appointment(salon["id"], master["id"], service["id"], "client-1", "2030-01-02T10:00:00")
+
+    loaded = repo.get_owner_salon("owner-1")
+    assert loaded["id"] == salon["id"]
+    assert [m["name"] for m in loaded["masters"]] == ["Anna"]
+    assert [s["name"] for s in loaded["services"]] == ["Cut"]
+    assert len(loaded["appointments"]) == 1
+    assert repo.get_all_salons() == [
+        {"id": salon["id"], "name": "Salon", "masters_count": 1, "services_count": 1}
+    ]
+
+
+def test_updates_and_deletes(repo):
+    salon = repo.create_salon("Salon", "owner-1")
+    master = repo.create_master(salon["id"], "Anna")
+    service = repo.create_service(salon["id"], "Cut")
+
+    assert repo.update_master(master["id"], "Maria")["name"] == "Maria"
+    assert repo.update_service(service["id"], price=500)["price"] == 500
+    assert repo.update_salon(salon["id"], "Renamed")["name"] == "Renamed"
+
+    appointment = repo.create_appointment(salon["id"], master["id"], service["id"], "c", "2030-01-02T10:00:00")
+    assert repo.update_appointment(appointment["id"], "confirmed")["status"] == "confirmed"
+    assert repo.get_client_appointments("c")[0]["id"] == appointment["id"]
+    assert repo.get_master_appointments([master["id"]])[0]["status"] == "confirmed"
+
+    assert repo.delete_service(service["id"]) is True
+    assert repo.delete_service(service["id"]) is False
+    assert repo.delete_master(master["id"]) is True
+    assert repo.get_salon_masters(salon["id"]) == []
+
+
+def test_memory_engine_returns_copies():
+    repo = repository.MemoryRepository()
+    salon = repo.create_salon("Salon", "owner-1")
+    repo.create_master(salon["id"], "Anna", "tg-1")
+
+    masters = repo.get_salon_masters(salon["id"])
+    masters[0].telegram_id = None
+    assert repo.get_salon_masters(salon["id"])[0].telegram_id == "tg-1"
+
+    appointment = repo.create_appointment(salon["id"], masters[0].id, "svc", "c", "2030-01-02T10:00:00")
+    appointment.status = "cancelled"
+    assert repo.get_appointment_by_id(appointment.id).status == "pending"
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        repository.create_repository("postgres")
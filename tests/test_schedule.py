@@ -0,0 +1,75 @@
+from datetime import date, timedelta
+
+import pytest
+
+import availability
+import backend
+import schedule
+
+
+def _cached(master_id):
+    return backend.schedule_cache.get(master_id) is not None
+
+
+def test_compile_subtracts_breaks_and_applies_exceptions():
+    compiled = schedule.compile_schedule({
+        "weekly": {"mon": [["09:00", "13:00"], ["12:00", "18:30"]], "sat": [["10:00", "14:00"]]},
+        "breaks": [{"start": "13:00", "end": "14:00", "days": ["mon"]}],
+        "exceptions": [
+            {"date_from": "2030-01-14", "date_to": "2030-01-20", "intervals": []},
+            {"date_from": "2030-01-21", "intervals": [["12:00", "15:00"]]},
+        ],
+    })
+    monday, saturday, sunday = date(2030, 1, 7), date(2030, 1, 12), date(2030, 1, 13)
+
+    assert compiled.intervals(monday) == ((540, 780), (840, 1110))
+    assert compiled.mask(monday) == availability.range_mask(9, 12) | availability.range_mask(14, 17)
+    assert compiled.mask(saturday) == availability.range_mask(10, 13)
+    assert compiled.mask(sunday) == 0  # день не указан — выходной
+    assert compiled.mask(date(2030, 1, 14)) == 0 and compiled.mask(date(2030, 1, 20)) == 0
+    assert compiled.mask(date(2030, 1, 21)) == availability.range_mask(12, 14)  # перерыв не действует
+    assert schedule.DEFAULT.mask(sunday) == availability.working_mask(sunday)
+
+    for bad in ({"weekly": {"mon": [["18:00", "09:00"]]}}, {"weekly": {"xyz": []}},
+                {"weekly": {"mon": [["9", "18:00"]]}},
+                {"exceptions": [{"date_from": "2030-02-01", "date_to": "2030-01-01"}]}):
+        with pytest.raises(schedule.ScheduleError):
+            schedule.compile_schedule(bad)
+
+
+def test_schedule_edit_changes_availability_and_invalidates_cache(client, owner, salon, add_master):
+    master = add_master("Anna")
+    salon_id = salon["id"]
+    url = f"/api/owner/masters/{master['id']}/schedule"
+    monday = date.today() + timedelta(days=7 - date.today().weekday())
+
+    def slots(day):
+        items = client.get(f"/api/client/salons/{salon_id}/available-slots",
+                           params={"master_id": master["id"], "date": day.isoformat()}).json()["items"]
+        return [int(slot[11:13]) for slot in items]
+
+    default = client.get(url, headers=owner).json()
+    assert default["custom"] is False and default["weekly"]["sun"] == [["09:00", "18:00"]]
+    assert slots(monday) == list(range(9, 18))
+    assert _cached(master["id"])
+
+    rules = {
+        "weekly": {"mon": [["10:00", "16:00"]]},
+        "breaks": [{"start": "12:00", "end": "13:00"}],
+        "exceptions": [{"date_from": (monday + timedelta(days=7)).isoformat(), "intervals": [], "note": "Отпуск"}],
+    }
+    response = client.put(url, json=rules, headers=owner)
+    assert response.status_code == 200, response.text
+    assert response.json()["custom"] is True
+    assert not _cached(master["id"])  # правка сбрасывает скомпилированное расписание
+
+    assert slots(monday) == [10, 11, 13, 14, 15]
+    assert slots(monday + timedelta(days=1)) == []
+    assert slots(monday + timedelta(days=7)) == []
+    assert client.get(url, headers=owner).json()["exceptions"][0]["note"] == "Отпуск"
+
+    assert client.put(url, json={"weekly": {"mon": [["16:00", "10:00"]]}}, headers=owner).status_code == 400
+    assert client.put(url, json=rules, headers={"X-User-Id": "stranger"}).status_code == 404
+
+    assert client.delete(url, headers=owner).json()["custom"] is False
+    assert slots(monday + timedelta(days=1)) == list(range(9, 18))
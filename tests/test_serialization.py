@@ -0,0 +1,184 @@
+import json
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, TypeAdapter
+
+from backend import ItemsOut, MasterOut, PublicMasterOut, SalonOut, app, catalog_cache
+from records import Appointment, Master, Service
+from serialization import Fragment, FragmentCache, RecordRoute, encode, project, response_shape
+
+
+MASTER = {"X-User-Id": "ser-master"}
+CLIENT = {"X-User-Id": "ser-client"}
+
+
+def test_encode_matches_jsonable_encoder():
+    payload = {
+        "items": [Service("s1", "Стрижка \"classic\"", 1500.5, 60, None), Service("s2", "Cut", None, None, "x\ny")],
+        "master": Master("m1", "Анна"),
+        "appointments": [Appointment("a1", "s", "m", "v", "c", "2030-01-01T10:00:00")],
+        "empty": [],
+        "nested": {"fragment": Fragment('{"cached":true}'), "n": 1},
+    }
+    expected = jsonable_encoder({**payload, "nested": {"fragment": {"cached": True}, "n": 1}})
+    assert json.loads(encode(payload)) == expected
+
+
+def test_fragment_cache_rejects_stale_put():
+    cache = FragmentCache()
+    generation = cache.generation("k")
+    cache.invalidate("k")  # запись зафиксирована, пока читатель строил фрагмент
+    cache.put("k", generation, ["stale"])
+    assert cache.get("k") is None
+
+    cache.put("k", cache.generation("k"), ["fresh"])
+    assert cache.get("k") == '["fresh"]'
+
+    # clear() устаревает и поколения ключей, которых в кеше не было
+    pending = cache.generation("other")
+    cache.clear()
+    cache.put("other", pending, ["stale"])
+    assert cache.get("other") is None and cache.get("k") is None
+
+
+def test_record_routes_drop_what_the_response_model_does_not_declare():
+    class CatalogOut(BaseModel):
+        masters: Dict[str, PublicMasterOut]
+        owner: Optional[MasterOut] = None
+
+    masters = [Master("m1", "Анна", "tg-1"), Master("m2", "Olga", None)]
+    shape = response_shape(ItemsOut[PublicMasterOut])
+    assert project({"items": masters}, response_shape(ItemsOut[MasterOut]))["items"] is masters  # все столбцы — как есть
+    assert json.loads(encode(project({"items": masters, "debug": 1}, shape))) == {
+        "items": [{"id": "m1", "name": "Анна"}, {"id": "m2", "name": "Olga"}],
+    }
+    assert json.loads(encode(project(
+        {"masters": {"a": masters[0], "b": {"id": "m2", "name": "Olga", "pin": 1}}, "owner": masters[0]},
+        response_shape(CatalogOut),
+    ))) == {
+        "masters": {"a": {"id": "m1", "name": "Анна"}, "b": {"id": "m2", "name": "Olga"}},
+        "owner": {"id": "m1", "name": "Анна", "telegram_id": "tg-1"},
+    }
+
+    probe = FastAPI()
+    probe.router.route_class = RecordRoute
+
+    @probe.get("/salon", response_model=SalonOut)
+    def salon():
+        return {"id": "s1", "name": "Salon", "owner_id": "o1", "secret": "x",
+                "masters": [{"id": "m1", "name": "Анна", "telegram_id": None, "pin": "1234"}],
+                "services": [Service("v1", "Cut", 1000, 60, None)]}
+
+    @probe.get("/masters", response_model=List[PublicMasterOut])
+    def public_masters():
+        return masters
+
+    probe_client = TestClient(probe)
+    assert probe_client.get("/salon").json() == {
+        "id": "s1", "name": "Salon", "owner_id": "o1",
+        "masters": [{"id": "m1", "name": "Анна", "telegram_id": None}],
+        "services": [{"id": "v1", "name": "Cut", "price": 1000, "duration": 60, "description": None}],
+    }
+    assert probe_client.get("/masters").json() == [{"id": "m1", "name": "Анна"}, {"id": "m2", "name": "Olga"}]
+
+
+def _response_models():
+    return {
+        (method, route.path): route.response_model
+        for route in app.routes
+        if isinstance(route, APIRoute) and route.response_model is not None
+        for method in route.methods
+    }
+
+
+def test_responses_match_declared_models(client, owner):
+    models = _response_models()
+    responses = []
+
+    def call(method, path, route=None, **kwargs):
+        response = client.request(method, path, **kwargs)
+        assert response.status_code == 200, response.text
+        responses.append(((method, route or path), response))
+        return response.json()
+
+    salon = call("POST", "/api/owner/salon", json={"name": "Salon"}, headers=owner)
+    master = call("POST", "/api/owner/masters", json={"name": "Anna", "telegram_id": "ser-master"}, headers=owner)
+    service = call("POST", "/api/owner/services", json={"name": "Cut", "price": 1000, "duration": 60},
+                   headers=owner)
+    when = (datetime.now() + timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0).isoformat()
+    appointment = call("POST", "/api/client/appointments", headers=CLIENT, json={
+        "salon_id": salon["id"], "master_id": master["id"], "service_id": service["id"], "datetime": when,
+    })
+    sid = salon["id"]
+    call("GET", "/api/owner/salon", headers=owner)
+    call("PATCH", "/api/owner/salon", json={"name": "Renamed"}, headers=owner)
+    call("GET", "/api/owner/masters", headers=owner)
+    call("PUT", f"/api/owner/masters/{master['id']}/schedule", "/api/owner/masters/{master_id}/schedule",
+         json={"weekly": {"mon": [["10:00", "18:00"]]}, "breaks": [{"start": "13:00", "end": "14:00"}]},
+         headers=owner)
+    call("GET", f"/api/owner/masters/{master['id']}/schedule", "/api/owner/masters/{master_id}/schedule",
+         headers=owner)
+    call("GET", "/api/owner/appointments?limit=10", "/api/owner/appointments", headers=owner)
+    call("GET", "/api/client/salons")
+    call("GET", f"/api/client/salons/{sid}", "/api/client/salons/{salon_id}")
+    call("GET", f"/api/client/salons/{sid}/masters", "/api/client/salons/{salon_id}/masters")
+    call("GET", f"/api/client/salons/{sid}/services", "/api/client/salons/{salon_id}/services")
+    call("GET", f"/api/client/salons/{sid}/available-slots?master_id={master['id']}&date={when[:10]}",
+         "/api/client/salons/{salon_id}/available-slots")
+    call("GET", f"/api/client/salons/{sid}/availability?date_from={when[:10]}&days=3",
+         "/api/client/salons/{salon_id}/availability")
+    call("GET", f"/api/client/salons/{sid}/earliest-slots?service_id={service['id']}&limit=3",
+         "/api/client/salons/{salon_id}/earliest-slots")
+    call("GET", "/api/client/appointments", headers=CLIENT)
+    call("GET", "/api/master/salon", headers=MASTER)
+    call("GET", "/api/master/appointments", headers=MASTER)
+    call("PATCH", f"/api/master/appointments/{appointment['id']}", "/api/master/appointments/{appointment_id}",
+         json={"status": "confirmed"}, headers=MASTER)
+    call("PATCH", "/api/owner/appointments", json={"ids": [appointment["id"], "missing"], "status": "completed"},
+         headers=owner)
+    call("GET", "/api/user/role", headers=owner)
+    for headers in (owner, MASTER, CLIENT):
+        call("GET", "/api/bootstrap", headers=headers)
+        call("GET", "/api/sync?since=0", "/api/sync", headers=headers)
+    call("GET", "/health")
+
+    for key, response in responses:
+        TypeAdapter(models[key]).validate_json(response.content, strict=True)
+    assert "telegram_id" not in client.get(f"/api/client/salons/{sid}/masters").json()["items"][0]
+
+
+def test_catalog_cache_invalidated_by_owner_writes(client, owner, salon):
+    path = f"/api/client/salons/{salon['id']}/services"
+
+    assert client.get(path).json() == {"items": []}
+    hits = catalog_cache.hits
+    assert client.get(path).json() == {"items": []}
+    assert catalog_cache.hits == hits + 1
+
+    service = client.post("/api/owner/services", json={"name": "Cut"}, headers=owner).json()
+    assert [s["name"] for s in client.get(path).json()["items"]] == ["Cut"]
+    client.patch(f"/api/owner/services/{service['id']}", json={"name": "Color"}, headers=owner)
+    assert [s["name"] for s in client.get(path).json()["items"]] == ["Color"]
+    assert client.get(f"/api/client/salons/{salon['id']}").json()["services_count"] == 1
+    assert client.get("/api/client/salons/missing/services").status_code == 404
+
+
+def test_get_responses_carry_etag_and_answer_304(client, owner, salon):
+    path = f"/api/client/salons/{salon['id']}/services"
+
+    first = client.get(path)
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    cached = client.get(path, headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b"" and cached.headers["etag"] == etag
+
+    client.post("/api/owner/services", json={"name": "Cut"}, headers=owner)
+    changed = client.get(path, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert "etag" not in client.get("/api/client/salons/missing/services").headers
@@ -0,0 +1,90 @@
+from datetime import date, timedelta
+
+import changes
+import maintenance
+import repository
+
+
+MASTER = {"X-User-Id": "sync-master"}
+CLIENT = {"X-User-Id": "sync-client"}
+
+
+def _sync(client, headers, since, **params):
+    response = client.get("/api/sync", params={"since": since, **params}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _cursor(client, headers):
+    page = client.get("/api/sync", headers=headers).json()
+    assert page["reset"] is True and page["appointments"] == []
+    return page["cursor"]
+
+
+def test_sync_returns_only_changed_entities_in_scope(client, owner, salon, add_master, service):
+    anna, boris = add_master("Anna", "sync-master"), add_master("Boris")
+    cut = service
+    day = date.today() + timedelta(days=1)
+
+    def book(master, hour, headers=CLIENT):
+        return client.post("/api/client/appointments", headers=headers, json={
+            "salon_id": salon["id"], "master_id": master["id"], "service_id": cut["id"],
+            "datetime": f"{day}T{hour:02d}:00:00",
+        }).json()
+
+    owner_cursor, master_cursor, client_cursor = _cursor(client, owner), _cursor(client, MASTER), _cursor(client, CLIENT)
+    mine = book(anna, 10)
+    other = book(boris, 11, headers={"X-User-Id": "sync-other"})
+    client.patch(f"/api/master/appointments/{mine['id']}", json={"status": "confirmed"}, headers=MASTER)
+    client.patch(f"/api/owner/masters/{boris['id']}", json={"name": "Bob"}, headers=owner)
+    client.put(f"/api/owner/masters/{anna['id']}/schedule", json={"weekly": {"mon": [["10:00", "16:00"]]}},
+               headers=owner)
+
+    page = _sync(client, owner, owner_cursor)
+    assert page["reset"] is False and page["has_more"] is False
+    assert [m["name"] for m in page["masters"]] == ["Bob"]
+    assert page["services"] == [] and page["salons"] == []
+    assert {a["id"]: a["status"] for a in page["appointments"]} == {mine["id"]: "confirmed", other["id"]: "pending"}
+    assert [(s["master_id"], s["custom"]) for s in page["schedules"]] == [(anna["id"], True)]
+    assert _sync(client, owner, page["cursor"])["appointments"] == []  # с нового курсора изменений нет
+
+    master = _sync(client, MASTER, master_cursor)
+    assert [a["id"] for a in master["appointments"]] == [mine["id"]]
+    assert [m["id"] for m in master["masters"]] == [boris["id"]]  # каталог салона виден мастеру
+    assert [a["id"] for a in _sync(client, CLIENT, client_cursor)["appointments"]] == [mine["id"]]
+
+    # Постранично: курсор страницы — последний seq в ней
+    first = _sync(client, owner, owner_cursor, limit=2)
+    assert first["has_more"] is True
+    rest = _sync(client, owner, first["cursor"], limit=10)
+    assert len(first["masters"] + first["appointments"] + first["schedules"]) == 2
+    assert len(rest["masters"] + rest["appointments"] + rest["schedules"]) == 2
+
+    # Удаление услуги каскадом удаляет записи — их id приходят в deleted
+    client.delete(f"/api/owner/services/{cut['id']}", headers=owner)
+    deleted = _sync(client, owner, page["cursor"])["deleted"]
+    assert deleted["services"] == [cut["id"]]
+    assert sorted(deleted["appointments"]) == sorted([mine["id"], other["id"]])
+    assert _sync(client, CLIENT, client_cursor)["deleted"]["appointments"] == [mine["id"]]
+    assert client.get("/api/sync").status_code == 401
+
+
+def test_compaction_keeps_answers_and_resets_expired_cursors():
+    repo = repository.get_repository()
+    start = repo.get_changes(changes.Scope(), None)["cursor"]
+    salon = repo.create_salon("Salon", "compact-owner")
+    anna = repo.create_master(salon["id"], "Anna")
+    for name in ("Anya", "Annie", "Anna"):
+        repo.update_master(anna.id, name)
+    scope = changes.Scope(salon_id=salon["id"])
+    before = repo.get_changes(scope, start)
+
+    assert repo.compact_changes(date.today().isoformat()) == 3  # создание и два переименования перекрыты
+    assert repo.get_changes(scope, start) == before
+
+    tomorrow = (date.today() + timedelta(days=1)).isoformat()
+    assert repo.compact_changes(tomorrow, batch_size=1) == 1  # самая старая запись — салон
+    assert repo.get_changes(scope, start)["reset"] is True
+    assert maintenance.run_change_compaction(-1, batch_size=1) == 1
+    assert repo.get_changes(scope, before["cursor"])["reset"] is False
+    assert repo.get_changes(scope, before["cursor"] + 1)["reset"] is True  # такого курсора не выдавали
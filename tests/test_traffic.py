@@ -0,0 +1,106 @@
+import asyncio
+import shutil
+from datetime import date, timedelta
+
+import httpx
+
+import backend
+import database
+import repository
+import traffic
+from config import get_settings
+
+
+def test_capture_is_sanitized(tmp_path, monkeypatch, client):
+    recorder = traffic.TrafficRecorder(tmp_path / "traffic.jsonl", salt="test")
+    monkeypatch.setattr(backend, "traffic_recorder", recorder)
+
+    client.post("/api/owner/masters", json={"name": "Secret Name"}, headers={"X-User-Id": "42"})
+    client.get("/api/client/salons/some-salon/masters")
+    client.get("/health")
+    recorder.close()
+
+    traces = list(traffic.load_traces(tmp_path / "traffic.jsonl"))
+    assert [t["r"] for t in traces] == [
+        "/api/owner/masters",
+        "/api/client/salons/{salon_id}/masters",
+    ]
+    assert traces[0]["b"] == {"name": "str"} and "v" not in traces[0]
+    assert traces[0]["u"] == traffic.hash_user_id("42", "test")
+    assert "42" not in traces[0]["u"]
+    assert traces[1]["p"] == {"salon_id": "some-salon"}
+    assert "Secret" not in (tmp_path / "traffic.jsonl").read_text(encoding="utf-8")
+
+
+def _replay(traces):
+    async def run():
+        transport = httpx.ASGITransport(app=backend.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await traffic.replay(traces, "http://test", speed=0, client=http)
+
+    return {(row["method"], row["route"]): row for row in asyncio.run(run())}
+
+
+def test_replay_maps_recorded_ids_onto_synthetic_salon():
+    traces = [
+        {"t": 0.0, "m": "GET", "r": "/health", "p": {}, "q": {}, "b": None, "u": None, "s": 200, "d": 1.0},
+        {"t": 0.01, "m": "GET", "r": "/api/client/salons/{salon_id}", "p": {"salon_id": "gone"},
+         "q": {}, "b": None, "u": "abc", "s": 200, "d": 2.0},
+    ]
+
+    rows = _replay(traces)
+    assert rows["GET", "/health"]["count"] == 1
+    assert rows["GET", "/api/client/salons/{salon_id}"]["status_mismatches"] == 0  # не 404: салон создан заранее
+    assert rows["GET", "/api/client/salons/{salon_id}"]["ok"] == 1
+
+
+def test_captured_session_replays_on_empty_database(tmp_path, monkeypatch, client, template_db):
+    recorder = traffic.TrafficRecorder(tmp_path / "traffic.jsonl", salt="test")
+    monkeypatch.setattr(backend, "traffic_recorder", recorder)
+    owner, master, visitor = {"X-User-Id": "100"}, {"X-User-Id": "200"}, {"X-User-Id": "300"}
+    tomorrow = date.today() + timedelta(days=1)
+
+    salon = client.post("/api/owner/salon", json={"name": "Studio"}, headers=owner).json()
+    anna = client.post("/api/owner/masters", json={"name": "Anna", "telegram_id": "200"}, headers=owner).json()
+    cut = client.post("/api/owner/services", json={"name": "Cut", "price": 900, "duration": 60}, headers=owner).json()
+    client.patch(f"/api/owner/services/{cut['id']}", json={"price": 1000}, headers=owner)
+    client.put(f"/api/owner/masters/{anna['id']}/schedule", json={"weekly": {"mon": [["10:00", "18:00"]]}},
+               headers=owner)
+    client.get("/api/bootstrap", headers=visitor)
+    client.get(f"/api/client/salons/{salon['id']}/masters")
+    client.get(f"/api/client/salons/{salon['id']}/services")
+    client.get(f"/api/client/salons/{salon['id']}/availability",
+               params={"date_from": tomorrow.isoformat(), "days": 7, "service_id": cut["id"]})
+    booked = [
+        client.post("/api/client/appointments", headers=visitor, json={
+            "salon_id": salon["id"], "master_id": anna["id"], "service_id": cut["id"],
+            "datetime": f"{tomorrow + timedelta(days=n)}T{hour}:00:00",
+        }).json()
+        for n, hour in ((0, 10), (0, 11), (1, 12))
+    ]
+    client.get("/api/master/appointments", headers=master)
+    client.patch(f"/api/master/appointments/{booked[0]['id']}", json={"status": "confirmed"}, headers=master)
+    client.patch("/api/master/appointments", json={"ids": [booked[1]["id"]], "status": "confirmed"}, headers=master)
+    client.patch(f"/api/client/appointments/{booked[2]['id']}", json={"status": "cancelled"}, headers=visitor)
+    client.get("/api/owner/salon", headers=owner)
+    client.get("/api/owner/appointments", params={"limit": 10}, headers=owner)
+    client.get("/api/sync", headers=owner)
+    recorder.close()
+    traces = list(traffic.load_traces(tmp_path / "traffic.jsonl"))
+    assert all(200 <= t["s"] < 300 for t in traces)
+    assert "Anna" not in (tmp_path / "traffic.jsonl").read_text(encoding="utf-8")
+
+    # Пустая база: записанных пользователей и сущностей в ней нет
+    monkeypatch.setattr(backend, "traffic_recorder", None)
+    path = tmp_path / "replay.db"
+    shutil.copyfile(template_db, path)
+    database.configure(f"sqlite:///{path}")
+    repository.set_repository(
+        repository.MemoryRepository() if get_settings().storage_engine == "memory" else repository.SQLiteRepository()
+    )
+
+    rows = _replay(traces).values()
+    ok = sum(row["ok"] for row in rows)
+    assert sum(row["count"] for row in rows) == len(traces)
+    # Только создание салона расходится: салон владельца уже создан для воспроизведения
+    assert ok == len(traces) - 1, traffic.format_report(list(rows))
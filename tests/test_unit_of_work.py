@@ -0,0 +1,65 @@
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+from backend import app
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+    original = database.connect
+
+    def counting_connect(*args, **kwargs):
+        conn = original(*args, **kwargs)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(database, "connect", counting_connect)
+    return opened
+
+
+def test_owner_mutation_uses_one_connection(sqlite_repository, client, owner, service, connections):
+    connections.clear()
+
+    response = client.patch(f"/api/owner/services/{service['id']}", json={"price": 900}, headers=owner)
+
+    assert response.status_code == 200
+    assert response.json()["price"] == 900
+    assert len(connections) == 1
+
+
+def test_request_without_db_access_opens_no_connection(client, connections):
+    assert client.get("/health").status_code == 200
+    assert connections == []
+
+
+def test_failed_scope_rolls_back(sqlite_repository, salon):
+    with pytest.raises(RuntimeError):
+        with database.unit_of_work(write=True):
+            database.create_master(salon["id"], "Anna")
+            raise RuntimeError("handler failed")
+    assert database.get_salon_masters(salon["id"]) == []
+
+
+def test_nested_scope_reuses_connection():
+    with database.unit_of_work() as outer:
+        first = database.get_db_connection()
+        with database.unit_of_work() as inner:
+            assert inner is outer
+            assert database.get_db_connection() is first
+
+
+def test_failed_commit_reaches_the_client(sqlite_repository, owner, monkeypatch):
+    def failing_commit(self):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(database.UnitOfWork, "commit", failing_commit)
+    response = TestClient(app, raise_server_exceptions=False).post(
+        "/api/owner/salon", json={"name": "Salon"}, headers=owner,
+    )
+
+    assert response.status_code == 500  # COMMIT выполняется до отправки ответа
+    assert database.get_owner_salon_id(owner["X-User-Id"]) is None
@@ -0,0 +1,456 @@
+"""Capture and replay of sanitized API traffic for performance testing.
+
+Recording is opt-in: set ``TRAFFIC_CAPTURE_PATH`` and the backend appends one
+compact JSON line per ``/api`` request. Only the route template, path/query
+parameters, the *shape* of the JSON body, a salted hash of ``X-User-Id`` and
+timings are stored — never raw user ids or personal body values (names,
+descriptions, Telegram ids). The body fields in :data:`KEPT_BODY_FIELDS`
+(entity ids, status, booking time, working hours) are kept as values.
+
+The recorded users and ids do not exist in a fresh database, so before a
+replay :class:`ReplayFixtures` creates synthetic salons, masters, services
+and appointments that stand in for them, and requests are re-issued against
+those.
+
+Replay a capture against a local instance (ideally on an empty database)::
+
+    python traffic.py replay traffic.jsonl --base-url http://127.0.0.1:8000 --speed 4
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import statistics
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+def body_shape(value: Any) -> Any:
+    """Replace every scalar in a JSON document with its type name."""
+    if isinstance(value, dict):
+        return {key: body_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [body_shape(value[0])] if value else []
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    return "str"
+
+
+def body_from_shape(shape: Any) -> Any:
+    """Build a placeholder JSON document matching a recorded shape."""
+    if isinstance(shape, dict):
+        return {key: body_from_shape(item) for key, item in shape.items()}
+    if isinstance(shape, list):
+        return [body_from_shape(item) for item in shape]
+    return {"null": None, "bool": False, "int": 60, "float": 1000.0}.get(shape, "replay")
+
+
+def hash_user_id(user_id: Optional[str], salt: str) -> Optional[str]:
+    """Stable, non-reversible token for a Telegram user id."""
+    if not user_id:
+        return None
+    digest = hashlib.sha256(f"{salt}:{user_id}".encode("utf-8")).hexdigest()
+    return digest[:16]
+
+
+# Поля тела, которые записываются значениями: без них воспроизведение не найдёт сущности
+KEPT_BODY_FIELDS = frozenset({"salon_id", "master_id", "service_id", "ids", "status", "datetime", "weekly", "breaks"})
+
+
+def kept_values(document: Any) -> Optional[Dict[str, Any]]:
+    """Values of the top-level body fields listed in :data:`KEPT_BODY_FIELDS`."""
+    if not isinstance(document, dict):
+        return None
+    kept = {key: value for key, value in document.items() if key in KEPT_BODY_FIELDS}
+    return kept or None
+
+
+class TrafficRecorder:
+    """Append-only JSONL writer shared by all requests of the process."""
+
+    def __init__(self, path: str | Path, salt: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.salt = salt
+        self._lock = threading.Lock()
+        self._file = self.path.open("a", encoding="utf-8", buffering=1)
+
+    def record(
+        self,
+        *,
+        started_at: float,
+        method: str,
+        route: str,
+        path_params: Dict[str, Any],
+        query_params: Dict[str, str],
+        body: bytes,
+        user_id: Optional[str],
+        status: int,
+        duration_ms: float,
+    ) -> None:
+        shape = kept = None
+        if body:
+            try:
+                document = json.loads(body)
+            except ValueError:
+                shape = "raw"
+            else:
+                shape, kept = body_shape(document), kept_values(document)
+        entry = {
+            "t": round(started_at, 4),
+            "m": method,
+            "r": route,
+            "p": path_params,
+            "q": query_params,
+            "b": shape,
+            "u": hash_user_id(user_id, self.salt),
+            "s": status,
+            "d": round(duration_ms, 3),
+        }
+        if kept:
+            entry["v"] = kept
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def load_traces(path: str | Path) -> Iterator[Dict[str, Any]]:
+    """Read a capture file, skipping truncated trailing lines."""
+    with Path(path).open(encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def trace_url(trace: Dict[str, Any]) -> str:
+    """Fill the route template with the recorded path parameters."""
+    url = trace["r"]
+    for name, value in (trace.get("p") or {}).items():
+        url = url.replace("{" + name + "}", str(value))
+    return url
+
+
+# Параметр пути, запроса или поле тела -> вид сущности, на которую он ссылается
+ID_FIELDS = {
+    "salon_id": "salon",
+    "master_id": "master",
+    "service_id": "service",
+    "appointment_id": "appointment",
+    "ids": "appointment",
+}
+ROLES = ("owner", "master", "client")
+
+
+def trace_role(trace: Dict[str, Any]) -> Optional[str]:
+    """Role implied by the route (``/api/owner/...`` etc.); ``None`` for shared routes."""
+    parts = trace["r"].split("/")
+    return parts[2] if len(parts) > 2 and parts[1] == "api" and parts[2] in ROLES else None
+
+
+def recorded_ids(trace: Dict[str, Any]) -> Iterator[Tuple[str, str]]:
+    """``(kind, id)`` of every entity a trace refers to in its path, query or kept body values."""
+    for source in (trace.get("p") or {}, trace.get("q") or {}, trace.get("v") or {}):
+        for name, value in source.items():
+            kind = ID_FIELDS.get(name)
+            if kind is None:
+                continue
+            for item in value if isinstance(value, list) else [value]:
+                if isinstance(item, str):
+                    yield kind, item
+
+
+class ReplayFixtures:
+    """Synthetic users and entities standing in for the recorded ones.
+
+    :meth:`build` gives each hashed user the role of the routes they called
+    (owner over master over client): every owner gets a salon, every master
+    a master record whose ``telegram_id`` is the hashed id. Then one
+    synthetic entity is created per recorded id, in the salon the id was
+    seen with. :meth:`request` maps a trace onto these fixtures. Each
+    recorded booking time gets its own future slot, so bookings that did not
+    collide in the capture do not collide in the replay. A recorded salon
+    creation replays as ``400``: the owner's salon exists already.
+    """
+
+    def __init__(self, client: Any):
+        self.client = client
+        self.roles: Dict[str, str] = {}
+        self.salons: List[str] = []
+        self.owner_of: Dict[str, str] = {}  # салон -> владелец
+        self.salon_of: Dict[str, str] = {}  # владелец или мастер -> салон
+        self.master_of: Dict[str, str] = {}  # мастер -> его запись мастера
+        self.ids: Dict[str, Dict[str, str]] = {kind: {} for kind in ID_FIELDS.values()}
+        self.defaults: Dict[Tuple[str, str], str] = {}  # (салон, вид) -> мастер или услуга
+        self.slots: Dict[str, str] = {}  # записанное время -> свободный слот
+        self._next_slot = 0
+
+    @classmethod
+    async def build(cls, traces: List[Dict[str, Any]], client: Any) -> "ReplayFixtures":
+        fixtures = cls(client)
+        for trace in traces:
+            user, role = trace.get("u"), trace_role(trace) or "client"
+            if user and ROLES.index(role) < ROLES.index(fixtures.roles.get(user, "client")):
+                fixtures.roles[user] = role
+            elif user:
+                fixtures.roles.setdefault(user, "client")
+        for user, role in fixtures.roles.items():
+            if role == "owner":
+                await fixtures._add_salon(user)
+        for user, role in fixtures.roles.items():
+            if role == "master":
+                salon = await fixtures._pick_salon(len(fixtures.master_of))
+                fixtures.salon_of[user] = salon
+                fixtures.master_of[user] = await fixtures._post(
+                    "/api/owner/masters", fixtures.owner_of[salon], {"name": "Replay master", "telegram_id": user},
+                )
+        for kind in ("salon", "master", "service", "appointment"):
+            for trace in traces:
+                for seen, recorded in recorded_ids(trace):
+                    if seen == kind and recorded not in fixtures.ids[kind]:
+                        fixtures.ids[kind][recorded] = await fixtures._create(kind, trace)
+        return fixtures
+
+    async def _post(self, path: str, user: str, body: Dict[str, Any]) -> str:
+        response = await self.client.post(path, json=body, headers={"X-User-Id": user})
+        if response.status_code != 200:
+            raise RuntimeError(f"replay fixture {path} failed: {response.status_code} {response.text}")
+        return response.json()["id"]
+
+    async def _add_salon(self, owner: str) -> str:
+        salon = await self._post("/api/owner/salon", owner, {"name": "Replay salon"})
+        self.salons.append(salon)
+        self.owner_of[salon] = owner
+        self.salon_of[owner] = salon
+        return salon
+
+    async def _pick_salon(self, n: int) -> str:
+        if not self.salons:
+            await self._add_salon("replay-owner")
+        return self.salons[n % len(self.salons)]
+
+    async def _salon_for(self, trace: Dict[str, Any]) -> str:
+        recorded = _recorded(trace, "salon_id")
+        if recorded in self.ids["salon"]:
+            return self.ids["salon"][recorded]
+        return self.salon_of.get(trace.get("u")) or await self._pick_salon(0)
+
+    async def _default(self, salon: str, kind: str) -> str:
+        if (salon, kind) not in self.defaults:
+            self.defaults[salon, kind] = await self._create_in(salon, kind)
+        return self.defaults[salon, kind]
+
+    async def _create_in(self, salon: str, kind: str) -> str:
+        if kind == "master":
+            return await self._post("/api/owner/masters", self.owner_of[salon], {"name": "Replay master"})
+        return await self._post("/api/owner/services", self.owner_of[salon],
+                                {"name": "Replay service", "price": 1000, "duration": 60})
+
+    async def _create(self, kind: str, trace: Dict[str, Any]) -> str:
+        if kind == "salon":
+            return await self._pick_salon(len(self.ids["salon"]))
+        user = trace.get("u")
+        if kind == "appointment" and user in self.master_of:
+            salon, master, client = self.salon_of[user], self.master_of[user], "replay-client"
+        else:
+            salon = await self._salon_for(trace)
+            if kind != "appointment":
+                return await self._create_in(salon, kind)
+            master = self.ids["master"].get(_recorded(trace, "master_id")) or await self._default(salon, "master")
+            client = user if self.roles.get(user) == "client" else "replay-client"
+        service = self.ids["service"].get(_recorded(trace, "service_id")) or await self._default(salon, "service")
+        return await self._post("/api/client/appointments", client, {
+            "salon_id": salon, "master_id": master, "service_id": service, "datetime": self._slot(),
+        })
+
+    def _slot(self) -> str:
+        # Часовые слоты с 9 до 18, начиная с послезавтра: свободны у любого мастера
+        n, self._next_slot = self._next_slot, self._next_slot + 1
+        day = date.today() + timedelta(days=2 + n // 9)
+        return datetime(day.year, day.month, day.day, 9 + n % 9).isoformat()
+
+    def _map(self, name: str, value: Any) -> Any:
+        if name == "datetime" and isinstance(value, str):
+            return self.slots.setdefault(value, self._slot())
+        kind = ID_FIELDS.get(name)
+        if kind is None:
+            return value
+        if isinstance(value, list):
+            return [self.ids[kind].get(item, item) for item in value]
+        return self.ids[kind].get(value, value)
+
+    def request(self, trace: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """URL and ``httpx`` request arguments of a trace, with ids mapped onto the fixtures."""
+        path = {name: self._map(name, value) for name, value in (trace.get("p") or {}).items()}
+        query = {name: self._map(name, value) for name, value in (trace.get("q") or {}).items()}
+        headers = {"X-User-Id": trace["u"]} if trace.get("u") else {}
+        kwargs: Dict[str, Any] = {"params": query or None, "headers": headers}
+        if trace.get("b") not in (None, "raw"):
+            body = body_from_shape(trace["b"])
+            if isinstance(body, dict):
+                body.update((name, self._map(name, value)) for name, value in (trace.get("v") or {}).items())
+            kwargs["json"] = body
+        return trace_url({**trace, "p": path}), kwargs
+
+
+def _recorded(trace: Dict[str, Any], name: str) -> Optional[str]:
+    for source in (trace.get("p") or {}, trace.get("q") or {}, trace.get("v") or {}):
+        if isinstance(source.get(name), str):
+            return source[name]
+    return None
+
+
+@dataclass
+class RouteReport:
+    method: str
+    route: str
+    recorded_ms: List[float] = field(default_factory=list)
+    replayed_ms: List[float] = field(default_factory=list)
+    status_mismatches: int = 0
+    ok: int = 0
+
+    @staticmethod
+    def _percentile(values: List[float], pct: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self) -> Dict[str, Any]:
+        rec_p50 = self._percentile(self.recorded_ms, 50)
+        rep_p50 = self._percentile(self.replayed_ms, 50)
+        return {
+            "method": self.method,
+            "route": self.route,
+            "count": len(self.replayed_ms),
+            "recorded_p50_ms": round(rec_p50, 3),
+            "replayed_p50_ms": round(rep_p50, 3),
+            "recorded_p95_ms": round(self._percentile(self.recorded_ms, 95), 3),
+            "replayed_p95_ms": round(self._percentile(self.replayed_ms, 95), 3),
+            "delta_p50_ms": round(rep_p50 - rec_p50, 3),
+            "replayed_mean_ms": round(statistics.fmean(self.replayed_ms), 3) if self.replayed_ms else 0.0,
+            "status_mismatches": self.status_mismatches,
+            "ok": self.ok,
+        }
+
+
+async def replay(
+    traces: Iterable[Dict[str, Any]],
+    base_url: str,
+    speed: float = 1.0,
+    client: Any = None,
+) -> List[Dict[str, Any]]:
+    """Re-issue traces preserving their relative timing.
+
+    ``speed`` scales inter-arrival gaps (``2`` replays twice as fast, ``0``
+    fires every request as soon as possible). Each user's requests are sent
+    one after another, in recorded order, as their client did; different
+    users run concurrently. The hashed user id is sent as ``X-User-Id``, and
+    recorded ids are mapped onto :class:`ReplayFixtures` created first.
+    """
+    import httpx
+
+    traces = sorted(traces, key=lambda item: item["t"])
+    if not traces:
+        return []
+
+    reports: Dict[tuple, RouteReport] = {}
+    own_client = client is None
+    if own_client:
+        client = httpx.AsyncClient(base_url=base_url, timeout=30)
+
+    async def issue(trace: Dict[str, Any]) -> None:
+        if speed > 0:
+            delay = (trace["t"] - origin) / speed - (time.perf_counter() - loop_start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        url, kwargs = fixtures.request(trace)
+        started = time.perf_counter()
+        response = await client.request(trace["m"], url, **kwargs)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        key = (trace["m"], trace["r"])
+        report = reports.setdefault(key, RouteReport(trace["m"], trace["r"]))
+        report.recorded_ms.append(float(trace.get("d", 0.0)))
+        report.replayed_ms.append(elapsed_ms)
+        if response.status_code != trace.get("s"):
+            report.status_mismatches += 1
+        if 200 <= response.status_code < 300:
+            report.ok += 1
+
+    async def issue_in_order(session: List[Dict[str, Any]]) -> None:
+        for trace in session:
+            await issue(trace)
+
+    sessions: Dict[Any, List[Dict[str, Any]]] = {}
+    for n, trace in enumerate(traces):
+        sessions.setdefault(trace.get("u") or n, []).append(trace)
+
+    try:
+        fixtures = await ReplayFixtures.build(traces, client)
+        origin = traces[0]["t"]
+        loop_start = time.perf_counter()
+        await asyncio.gather(*(issue_in_order(session) for session in sessions.values()))
+    finally:
+        if own_client:
+            await client.aclose()
+
+    return sorted(
+        (report.summary() for report in reports.values()),
+        key=lambda item: item["count"],
+        reverse=True,
+    )
+
+
+def format_report(rows: List[Dict[str, Any]]) -> str:
+    header = (f"{'method':<7}{'route':<48}{'count':>7}{'2xx':>7}{'rec p50':>10}{'rep p50':>10}{'rep p95':>10}"
+              f"{'Δp50':>10}{'status≠':>9}")
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(
+            f"{row['method']:<7}{row['route']:<48}{row['count']:>7}{row['ok']:>7}"
+            f"{row['recorded_p50_ms']:>10.2f}{row['replayed_p50_ms']:>10.2f}"
+            f"{row['replayed_p95_ms']:>10.2f}{row['delta_p50_ms']:>+10.2f}{row['status_mismatches']:>9}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay captured API traffic")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    replay_parser = subparsers.add_parser("replay", help="re-issue a capture file")
+    replay_parser.add_argument("path", help="capture file (TRAFFIC_CAPTURE_PATH)")
+    replay_parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, 0 = no delays")
+    replay_parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    rows = asyncio.run(replay(load_traces(args.path), args.base_url, args.speed))
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(rows))
+
+
+if __name__ == "__main__":
+    main()